@@ -190,10 +190,14 @@ import os
 import logging
 
 import hubblestack.module_runner.runner_utils as runner_utils
+import hubblestack.utils.pygrep
 from hubblestack.exceptions import HubbleCheckValidationError, CommandExecutionError
 
 log = logging.getLogger(__name__)
 
+# the same path/pattern/flags are only grepped once per audit run (see AuditRunner)
+__pure__ = True
+
 
 def validate_params(block_id, block_dict, extra_args=None):
     """
@@ -391,6 +395,11 @@ def _grep(path,
         options = [] if options == '' else [options]
         cmd = ['grep'] + options + [pattern]
 
+    try:
+        return hubblestack.utils.pygrep.run(cmd, stdin=None if path else string)
+    except hubblestack.utils.pygrep.GrepUnsupported as exc:
+        log.debug('running grep binary, in-process grep not possible: %s', exc)
+
     try:
         if path:
             ret = __mods__['cmd.run_all'](cmd, python_shell=False, ignore_retcode=True)
@@ -186,6 +186,9 @@ from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
+# checks with the same name pattern share one lookup per audit run (see AuditRunner)
+__pure__ = True
+
 
 def validate_params(block_id, block_dict, extra_args=None):
     """
@@ -11,6 +11,10 @@ Note: Now each module just returns its output (As Data gathering)
       For Audit checks, comparison logic is now moved to comparators. 
       See below sections for more understanding
 
+Note: Parsed files (and the lines of config files) are kept in
+      hubblestack.utils.parsed_files until the file changes, so checks
+      against the same file don't read and parse it again.
+
 Usable in Modules
 -----------------
 - Audit
@@ -223,17 +227,22 @@ main:
 """
 
 import os
+import copy
 import logging
 import json as _json
 import yaml as _yaml
 import re
 
 from hubblestack.utils.encoding import encode_base64
+from hubblestack.utils.parsed_files import PARSED_FILES
 import hubblestack.module_runner.runner_utils as runner_utils
 from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
+# results only depend on the args (path, format, ...), AuditRunner reuses them within a run
+__pure__ = True
+
 
 def validate_params(block_id, block_dict, extra_args=None):
     """
@@ -336,15 +345,11 @@ def _handle_file_helper(file_format, block_id, path, subkey=None, sep=None, chai
         log.error('Path %s not found.', path)
         return runner_utils.prepare_negative_result_for_module(block_id, 'file_not_found')
 
+    if file_format not in _LOADERS:
+        return runner_utils.prepare_negative_result_for_module(block_id, 'unknown_format')
     ret = None
     try:
-        with open(path, 'r') as file_handle:
-            if file_format == 'json':
-                ret = _json.load(file_handle)
-            elif file_format == 'yaml':
-                ret = _yaml.safe_load(file_handle)
-            else:
-                return runner_utils.prepare_negative_result_for_module(block_id, 'unknown_format')
+        ret = PARSED_FILES.get(path, file_format, _LOADERS[file_format])
     except Exception:
         log.error('Error reading file %s.', path, exc_info=True)
         return runner_utils.prepare_negative_result_for_module(block_id, 'exception while reading file')
@@ -368,7 +373,21 @@ def _handle_file_helper(file_format, block_id, path, subkey=None, sep=None, chai
             log.error('Error traversing dict.', exc_info=True)
             return runner_utils.prepare_negative_result_for_module(block_id, 'unknown_error')
 
-    return runner_utils.prepare_positive_result_for_module(block_id, ret)
+    # the parsed file is shared with the other checks of the file
+    return runner_utils.prepare_positive_result_for_module(block_id, copy.deepcopy(ret))
+
+
+def _load_json(path):
+    with open(path, 'r') as file_handle:
+        return _json.load(file_handle)
+
+
+def _load_yaml(path):
+    with open(path, 'r') as file_handle:
+        return _yaml.safe_load(file_handle)
+
+
+_LOADERS = {'json': _load_json, 'yaml': _load_yaml}
 
 
 def _handle_config_file(block_id, block_dict, extra_args=None):
@@ -499,18 +518,13 @@ def _lines_as_list(path, pattern, ignore_pattern):
     try:
         # All lines as list of strings
         if not pattern and not ignore_pattern:
-            with open(path, 'r') as input_file:
-                ret = input_file.readlines()
-                ret = [s.strip() for s in ret]
-                return ret
+            return list(_read_lines(path))
         # Some lines as a list of strings
         ret = []
-        with open(path, 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                if not _check_pattern(line, pattern, ignore_pattern):
-                    continue
-                ret.append(line)
+        for line in _read_lines(path):
+            if not _check_pattern(line, pattern, ignore_pattern):
+                continue
+            ret.append(line)
     except Exception:
         log.error('Error while processing readfile.config for file %s.', path, exc_info=True)
         return None
@@ -527,25 +541,23 @@ def _lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep):
     processed_keys = set()
 
     try:
-        with open(path, 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                if not _check_pattern(line, pattern, ignore_pattern):
-                    continue
-                key, val = _process_line(line, dictsep, valsep, subsep)
-                if key in found_keys and key not in processed_keys:
-                    # Duplicate keys, make it a list of values underneath
-                    # and add to list of values
-                    ret[key] = [ret[key]]
-                    ret[key].append(val)
-                    processed_keys.add(key)
-                elif key in found_keys and key in processed_keys:
-                    # Duplicate keys, add to list of values
-                    ret[key].append(val)
-                else:
-                    # First found, add to dict as normal
-                    ret[key] = val
-                    found_keys.add(key)
+        for line in _read_lines(path):
+            if not _check_pattern(line, pattern, ignore_pattern):
+                continue
+            key, val = _process_line(line, dictsep, valsep, subsep)
+            if key in found_keys and key not in processed_keys:
+                # Duplicate keys, make it a list of values underneath
+                # and add to list of values
+                ret[key] = [ret[key]]
+                ret[key].append(val)
+                processed_keys.add(key)
+            elif key in found_keys and key in processed_keys:
+                # Duplicate keys, add to list of values
+                ret[key].append(val)
+            else:
+                # First found, add to dict as normal
+                ret[key] = val
+                found_keys.add(key)
     except Exception:
         log.error('Error while processing readfile.config for file %s.', path, exc_info=True)
         return None
@@ -553,6 +565,19 @@ def _lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep):
     return ret
 
 
+def _read_lines(path):
+    """
+    The stripped lines of the file at path, from the cache of parsed files
+    while the file is unchanged
+    """
+    return PARSED_FILES.get(path, 'lines', _load_lines)
+
+
+def _load_lines(path):
+    with open(path, 'r') as input_file:
+        return tuple(line.strip() for line in input_file)
+
+
 def _check_pattern(line, pattern, ignore_pattern):
     """
     Check a given line against both a pattern and an ignore_pattern and return
@@ -639,8 +664,7 @@ def _readfile_string(block_id, path, encode_b64=False, chained_param=None):
     if not os.path.isfile(path):
         log.error('Path %s not found.', path)
         return runner_utils.prepare_negative_result_for_module(block_id, 'file_not_found')
-    with open(path, 'r') as input_file:
-        ret = input_file.read()
+    ret = PARSED_FILES.get(path, 'string', _load_string)
     status = bool(ret)
     if encode_b64:
         status, ret = encode_base64(ret, format_chained=False)
@@ -648,6 +672,11 @@ def _readfile_string(block_id, path, encode_b64=False, chained_param=None):
     return status, ret
 
 
+def _load_string(path):
+    with open(path, 'r') as input_file:
+        return input_file.read()
+
+
 def get_filtered_params_to_log(block_id, block_dict, extra_args=None):
     """
     For getting params to log, in non-verbose logging
@@ -202,6 +202,9 @@ from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
+# checks of an audit run that stat the same path share the result (see AuditRunner)
+__pure__ = True
+
 
 def validate_params(block_id, block_dict, extra_args=None):
     """
@@ -176,6 +176,9 @@ from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
+# a kernel attribute is only read once per audit run (see AuditRunner)
+__pure__ = True
+
 
 def validate_params(block_id, block_dict, extra_args=None):
     """
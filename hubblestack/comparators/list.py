@@ -181,6 +181,46 @@ def match(audit_id, result_to_compare, args):
     return False, "list::match failure. Got={0}".format(result_to_compare)
 
 
+class _Values(object):
+    """
+    Primitive values indexed for exact (optionally case insensitive) lookups,
+    so comparing n elements with m candidates doesn't take n*m comparisons
+    """
+
+    def __init__(self, values, ignore_case=False):
+        self.values = list(values)
+        self.ignore_case = ignore_case
+        self.hashable = set()
+        self.unhashable = []
+        for value in self.values:
+            value = runner_utils.apply_case_on_string(value, ignore_case)
+            try:
+                self.hashable.add(value)
+            except TypeError:
+                self.unhashable.append(value)
+
+    def __contains__(self, value):
+        value = runner_utils.apply_case_on_string(value, self.ignore_case)
+        try:
+            if value in self.hashable:
+                return True
+        except TypeError:
+            pass
+        return any(value == other for other in self.unhashable)
+
+
+def _custom_comparator(to_compare):
+    """
+    The comparator args of a ``{name: {type: ..., ...}}`` entry, or None for
+    any other entry
+    """
+    if isinstance(to_compare, dict):
+        dict_key = list(to_compare.keys())[0]
+        if 'type' in to_compare[dict_key]:
+            return to_compare[dict_key]
+    return None
+
+
 def match_any(audit_id, result_to_compare, args):
     """
     Match any of dictionary mentioned. Match only mentioned attributes
@@ -194,6 +234,10 @@ def match_any(audit_id, result_to_compare, args):
     log.debug('Running list::match_any for check: {0}'.format(audit_id))
 
     ignore_case = args.get('ignore_case', False)
+    # primitive entries are looked up in an index, entries with a custom
+    # comparator are handed over to the comparator orchestrator
+    primitives = _Values((x for x in args['match_any'] if not isinstance(x, dict)), ignore_case)
+    custom_comparators = [x for x in map(_custom_comparator, args['match_any']) if x is not None]
     for r_compare in result_to_compare:
         if is_integer(r_compare):
             ret_status, ret_val = hubblestack.module_runner.comparator.run(
@@ -212,24 +256,13 @@ def match_any(audit_id, result_to_compare, args):
                 return True, "Check Passed"
         else:
             # direct compare
-            for to_compare in args['match_any']:
-                # check if it has specified any custom comparator
-                if isinstance(to_compare, dict):
-                    dict_key = list(to_compare.keys())[0]
-                    if 'type' in to_compare[dict_key]:
-                        # Lets hand-over this new specific comparison to comparator orchestrator
-                        ret_status, ret_val = hubblestack.module_runner.comparator.run(
-                            audit_id,
-                            to_compare[dict_key],
-                            r_compare)
-                        if ret_status:
-                            return True, "Check Passed"
-                else:
-                    # primitive datatype comparison
-                    to_compare_val1 = runner_utils.apply_case_on_string(to_compare, ignore_case)
-                    to_compare_val2 = runner_utils.apply_case_on_string(r_compare, ignore_case)
-                    if to_compare_val1 == to_compare_val2:
-                        return True, "Check Passed"
+            if r_compare in primitives:
+                return True, "Check Passed"
+            for comparator_args in custom_comparators:
+                ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                    audit_id, comparator_args, r_compare)
+                if ret_status:
+                    return True, "Check Passed"
 
     return False, "list::match_any failure. Got={0}".format(result_to_compare)
 
@@ -248,37 +281,40 @@ def match_all(audit_id, result_to_compare, args):
     log.debug('Running list::match_all for check: {0}'.format(audit_id))
 
     ignore_case = args.get('ignore_case', False)
+    dicts = [x for x in result_to_compare if isinstance(x, dict)]
+    primitives = _Values((x for x in result_to_compare if not isinstance(x, dict)), ignore_case)
     for to_compare in args['match_all']:
-        found_match = False
-        for r_compare in result_to_compare:
-            ret_status = False
+        if not _match_one(audit_id, to_compare, dicts, primitives, ignore_case):
+            return False, "Check failed, got={0}".format(result_to_compare)
+    return True, "Check Passed"
 
-            if isinstance(r_compare, dict):
-                # using dict::match
-                ret_status, ret_val = hubblestack.module_runner.comparator.run(
-                    audit_id,
-                    {"type": "dict", "match": to_compare, "ignore_case": ignore_case},
-                    r_compare)
-            elif isinstance(to_compare, dict):
-                dict_key = list(to_compare.keys())[0]
-                if 'type' in to_compare[dict_key]:
-                    # Lets hand-over this new specific comparison to comparator orchestrator
-                    ret_status, ret_val = hubblestack.module_runner.comparator.run(
-                        audit_id,
-                        to_compare[dict_key],
-                        r_compare)
-            else:
-                # simple comparison between primitive data types
-                to_compare_val1 = runner_utils.apply_case_on_string(r_compare, ignore_case)
-                to_compare_val2 = runner_utils.apply_case_on_string(to_compare, ignore_case)
-                ret_status = to_compare_val1 == to_compare_val2
 
+def _match_one(audit_id, to_compare, dicts, primitives, ignore_case):
+    """
+    Whether an entry of match_all matches any of the dict or primitive
+    elements of the list
+    """
+    for r_compare in dicts:
+        # using dict::match
+        ret_status, ret_val = hubblestack.module_runner.comparator.run(
+            audit_id,
+            {"type": "dict", "match": to_compare, "ignore_case": ignore_case},
+            r_compare)
+        if ret_status:
+            return True
+    if isinstance(to_compare, dict):
+        comparator_args = _custom_comparator(to_compare)
+        if comparator_args is None:
+            return False
+        # Lets hand-over this new specific comparison to comparator orchestrator
+        for r_compare in primitives.values:
+            ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                audit_id, comparator_args, r_compare)
             if ret_status:
-                found_match = True
-                break
-        if not found_match:
-            return False, "Check failed, got={0}".format(result_to_compare)
-    return True, "Check Passed"
+                return True
+        return False
+    # simple comparison between primitive data types
+    return to_compare in primitives
 
 
 def match_any_if_keyvalue_matches(audit_id, result_to_compare, args):
@@ -31,6 +31,10 @@ import re
 
 log = logging.getLogger(__name__)
 
+MAX_CACHED_PATTERNS = 1024
+# (pattern, flags) -> compiled regex
+_PATTERNS = {}
+
 
 def match(audit_id, result_to_compare, args):
     """
@@ -78,8 +82,21 @@ def _compare(result_to_compare, expected_string, args):
     is_regex = args.get('is_regex', False)
     if is_regex:
         is_multiline = args.get('is_multiline', True)
-        if is_multiline:
-            return re.search(expected_string, result_to_compare, re.MULTILINE)
-        return re.search(expected_string, result_to_compare)
+        return _compile(expected_string, re.MULTILINE if is_multiline else 0).search(result_to_compare)
     else:
         return result_to_compare == expected_string
+
+
+def _compile(pattern, flags):
+    """
+    Compile a pattern once; checks run the same patterns against every
+    element of a list and on every audit run
+    """
+    key = (pattern, flags)
+    regex = _PATTERNS.get(key)
+    if regex is None:
+        regex = re.compile(pattern, flags)
+        if len(_PATTERNS) >= MAX_CACHED_PATTERNS:
+            _PATTERNS.clear()
+        _PATTERNS[key] = regex
+    return regex
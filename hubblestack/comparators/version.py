@@ -29,6 +29,15 @@ Version comparator exposes various commands:
             - >= 4.28.0-1.el7
             - < 5.28.0-1.el7
 
+Versions are compared the way dpkg compares package versions (so
+``1.0~rc1 < 1.0 < 1.0+b1`` and ``1.0 < 1.0-1``); add ``format: rpm`` to
+compare them the way rpm does instead:
+
+    comparator:
+        type: version
+        format: rpm
+        match: >= 3.28.0-1.el7
+
 Complete Example
 
     comparator:
@@ -48,7 +57,8 @@ Complete Example
 """
 
 import logging
-from distutils.version import LooseVersion
+
+from hubblestack.utils.pkg.vercmp import dpkg_version_cmp, rpm_version_cmp
 
 log = logging.getLogger(__name__)
 
@@ -64,7 +74,7 @@ def match(audit_id, result_to_compare, args):
     """
     log.debug('Running version::match for audit_id: {0}'.format(audit_id))
 
-    if _match(result_to_compare, args['match']):
+    if _match(result_to_compare, args['match'], args.get('format')):
         return True, "Check Passed"
     return False, "version::match failure. Got={0} Expected={1}".format(result_to_compare, str(args['match']))
 
@@ -81,7 +91,7 @@ def match_any(audit_id, result_to_compare, args):
     log.debug('Running version::match_any for check: {0}'.format(audit_id))
 
     for option_to_match in args['match_any']:
-        if _match(result_to_compare, option_to_match):
+        if _match(result_to_compare, option_to_match, args.get('format')):
             return True, "Check passed"
 
     # did not match
@@ -89,26 +99,32 @@ def match_any(audit_id, result_to_compare, args):
                                                                                        str(args['match_any']))
 
 
-def _match(result_to_compare, expected_result):
+def _version_cmp(version1, version2, version_format=None):
+    """
+    cmp-style comparison of two versions, the dpkg way unless version_format
+    is rpm (or dpkg can't make sense of them)
+    """
+    if version_format != 'rpm':
+        try:
+            return dpkg_version_cmp(version1, version2)
+        except ValueError:
+            pass
+    return rpm_version_cmp(version1, version2)
+
+
+def _match(result_to_compare, expected_result, version_format=None):
     """
     compare versions
     """
     # got string having some comparison operators
     expected_result_value = expected_result.strip()
-    result_version_to_compare = LooseVersion(result_to_compare)
-
-    if expected_result_value.startswith('<='):
-        return result_version_to_compare <= LooseVersion(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('>='):
-        return result_version_to_compare >= LooseVersion(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('<'):
-        return result_version_to_compare < LooseVersion(expected_result_value[1:].strip())
-    elif expected_result_value.startswith('>'):
-        return result_version_to_compare > LooseVersion(expected_result_value[1:].strip())
-    elif expected_result_value.startswith('=='):
-        return result_version_to_compare == LooseVersion(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('!='):
-        return result_version_to_compare != LooseVersion(expected_result_value[2:].strip())
+    for operator, accepted in (('<=', (-1, 0)), ('>=', (0, 1)), ('<', (-1,)), ('>', (1,)),
+                               ('==', (0,)), ('!=', (-1, 1))):
+        if expected_result_value.startswith(operator):
+            expected_result_value = expected_result_value[len(operator):]
+            break
     else:
         # direct comparison
-        return result_version_to_compare == LooseVersion(expected_result_value.strip())
+        accepted = (0,)
+    return _version_cmp(str(result_to_compare).strip(), expected_result_value.strip(),
+                        version_format) in accepted
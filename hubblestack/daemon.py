@@ -8,18 +8,15 @@ import argparse
 import copy
 import json
 import logging
-import math
 import traceback
 import os
 import pprint
 import re
-import random
 import signal
-import socket
 import sys
 import time
+import types
 import uuid
-from datetime import datetime
 
 import hubblestack.fileserver
 import hubblestack.fileserver.gitfs
@@ -29,17 +26,18 @@ import hubblestack.utils.platform
 import hubblestack.utils.jid
 import hubblestack.utils.gitfs
 import hubblestack.utils.path
-from croniter import croniter
 
 import hubblestack.loader
 import hubblestack.utils.signing
 import hubblestack.log
 import hubblestack.log.splunk
 import hubblestack.hec.opt
+import hubblestack.hec.registry
 import hubblestack.utils.stdrec
 from hubblestack import __version__
 from hubblestack.hangtime import hangtime_wrapper
 import hubblestack.status
+import hubblestack.scheduler
 import hubblestack.fileclient
 import hubblestack.saltoverrides
 import hubblestack.module_runner.runner
@@ -48,6 +46,7 @@ import hubblestack.module_runner.fdg_runner
 
 log = logging.getLogger(__name__)
 HSS = hubblestack.status.HubbleStatus(__name__, 'schedule', 'refresh_grains')
+SCHEDULER = hubblestack.scheduler.Scheduler()
 
 # Importing syslog fails on windows
 if not hubblestack.utils.platform.is_windows():
@@ -164,16 +163,18 @@ def main():
         sys.exit(0)
     last_grains_refresh = time.time() - __opts__['grains_refresh_frequency']
     log.info('Starting main loop')
-    pidfile_count = 0
-    # pidfile_refresh in seconds, our scheduler deals in half-seconds
-    pidfile_refresh = int(__opts__.get('pidfile_refresh', 60)) * 2
+    last_pidfile = time.time()
+    pidfile_refresh = int(__opts__.get('pidfile_refresh', 60))
+    # sleep until something is due, but wake up at least every
+    # scheduler_max_sleep seconds so the schedule counter (see
+    # hubblestack.status) keeps showing the daemon alive
+    max_sleep = float(__opts__.get('scheduler_max_sleep', 30))
     while True:
         # Check if fileserver needs update
         if time.time() - last_fc_update >= __opts__['fileserver_update_frequency']:
             last_fc_update = _update_fileserver(file_client)
-        pidfile_count += 1
-        if __opts__['daemonize'] and pidfile_count > pidfile_refresh:
-            pidfile_count = 0
+        if __opts__['daemonize'] and time.time() - last_pidfile >= pidfile_refresh:
+            last_pidfile = time.time()
             create_pidfile()
         if time.time() - last_grains_refresh >= __opts__['grains_refresh_frequency']:
             last_grains_refresh = _emit_and_refresh_grains()
@@ -184,59 +185,13 @@ def main():
             log.exception('Error executing schedule: %s', exc)
             if isinstance(exc, KeyboardInterrupt):
                 raise exc
-        time.sleep(__opts__.get('scheduler_sleep_frequency', 0.5))
-
-
-def getsecondsbycronexpression(base, cron_exp):
-    """
-    this function will return the seconds according to the cron
-    expression provided in the hubble config
-    """
-    cron_iter = croniter(cron_exp, base)
-    next_datetime = cron_iter.get_next(datetime)
-    epoch_base_datetime = time.mktime(base.timetuple())
-    epoch_datetime = time.mktime(next_datetime.timetuple())
-    seconds = int(epoch_datetime) - int(epoch_base_datetime)
-    return seconds
-
-
-def getlastrunbycron(base, seconds):
-    """
-    this function will use the cron_exp provided in the hubble config to
-    execute the hubble processes as per the scheduled cron time
-    """
-    epoch_base_datetime = time.mktime(base.timetuple())
-    epoch_datetime = epoch_base_datetime
-    current_time = time.time()
-    while (epoch_datetime + seconds) < current_time:
-        epoch_datetime = epoch_datetime + seconds
-    last_run = epoch_datetime
-    return last_run
-
-
-def getlastrunbybuckets(buckets, seconds):
-    """
-    this function will use the host's ip to place the host in a bucket
-    where each bucket executes hubble processes at a different time
-    """
-    buckets = int(buckets) if int(buckets) != 0 else 256
-    host_ip = socket.gethostbyname(socket.gethostname())
-    ips = host_ip.split('.')
-    bucket_sum = (int(ips[0]) * 256 * 256 * 256) + (int(ips[1]) * 256 * 256) + \
-                 (int(ips[2]) * 256) + int(ips[3])
-    bucket = bucket_sum % buckets
-    log.debug('bucket number is %d out of %d', bucket, buckets)
-    current_time = time.time()
-    base_time = seconds * (math.floor(current_time / seconds))
-    splay = seconds / buckets
-    seconds_between_buckets = splay
-    random_int = random.randint(0, splay - 1) if splay != 0 else 0
-    bucket_execution_time = base_time + (seconds_between_buckets * bucket) + random_int
-    if bucket_execution_time < current_time:
-        last_run = bucket_execution_time
-    else:
-        last_run = bucket_execution_time - seconds
-    return last_run
+        wake_up = [last_fc_update + __opts__['fileserver_update_frequency'],
+                   last_grains_refresh + __opts__['grains_refresh_frequency']]
+        if SCHEDULER.next_run() is not None:
+            wake_up.append(SCHEDULER.next_run())
+        if __opts__['daemonize']:
+            wake_up.append(last_pidfile + pidfile_refresh)
+        time.sleep(min(max(min(wake_up) - time.time(), 0), max_sleep))
 
 
 @HSS.watch
@@ -302,105 +257,54 @@ def schedule():
 
     run_on_start
         Whether to run the scheduled job on daemon start. Defaults to False. Optional.
+
+    missed, overlap
+        What to do with a job that fell behind, see hubblestack.scheduler. Optional.
+
+    Jobs are validated once, when the schedule or the loaded modules change,
+    and only the jobs that are due are looked at (see hubblestack.scheduler).
     """
-    sf_count = 0
-    base = datetime(2018, 1, 1, 0, 0)
-    schedule_config = __opts__.get('schedule', {})
+    schedule_config = dict(__opts__.get('schedule', {}))
     if 'user_schedule' in __opts__ and isinstance(__opts__['user_schedule'], dict):
         schedule_config.update(__opts__['user_schedule'])
-    for jobname, jobdata in schedule_config.items():
-        try:
-            # Error handling galore
-            if not jobdata or not isinstance(jobdata, dict):
-                log.error('Scheduled job %s does not have valid data', jobname)
-                continue
-            if 'function' not in jobdata or 'seconds' not in jobdata:
-                log.error('Scheduled job %s is missing a ``function`` or ``seconds`` argument', jobname)
-                continue
-            func = jobdata['function']
-            if func not in __mods__:
-                log.error('Scheduled job %s has a function %s which could not be found.', jobname, func)
-                continue
-            try:
-                if 'cron' in jobdata:
-                    seconds = getsecondsbycronexpression(base, jobdata['cron'])
-                else:
-                    seconds = int(jobdata['seconds'])
-                splay = int(jobdata.get('splay', 0))
-                min_splay = int(jobdata.get('min_splay', 0))
-            except ValueError:
-                log.error('Scheduled job %s has an invalid value for seconds or splay.', jobname)
-            args = jobdata.get('args', [])
-            if not isinstance(args, list):
-                log.error('Scheduled job %s has args not formed as a list: %s', jobname, args)
-            kwargs = jobdata.get('kwargs', {})
-            if not isinstance(kwargs, dict):
-                log.error('Scheduled job %s has kwargs not formed as a dict: %s', jobname, kwargs)
-            returners = jobdata.get('returner', [])
-            if not isinstance(returners, list):
-                returners = [returners]
-            # Actually process the job
-            run = _process_job(jobdata, splay, seconds, min_splay, base)
-            if run:
-                _execute_function(jobdata, func, returners, args, kwargs)
-                sf_count += 1
-        except:
-            log.error("Exception in running job: %s; continuing with next job...", jobname, exc_info=True)
-    return sf_count
+    SCHEDULER.load(schedule_config, __mods__, __opts__)
+    return SCHEDULER.run_pending(_run_job)
+
+
+def _run_job(job):
+    """ Run a job the scheduler found due """
+    _execute_function(job.jobdata, job.function, job.returners, job.args, job.kwargs)
 
 
 def _execute_function(jobdata, func, returners, args, kwargs):
     """ Run the scheduled function """
     log.debug('Executing scheduled function %s', func)
-    jobdata['last_run'] = time.time()
-    ret = __mods__[func](*args, **kwargs)
-    if __opts__['log_level'] == 'debug':
-        log.debug('Job returned:\n%s', ret)
-    for returner in returners:
-        returner = '{0}.returner'.format(returner)
-        if returner not in __returners__:
-            log.error('Could not find %s returner.', returner)
-            continue
-        log.debug('Returning job data to %s', returner)
-        returner_ret = {'id': __grains__['id'],
-                        'jid': hubblestack.utils.jid.gen_jid(__opts__),
-                        'fun': func,
-                        'fun_args': args + ([kwargs] if kwargs else []),
-                        'return': ret}
-        __returners__[returner](returner_ret)
-
-
-def _process_job(jobdata, splay, seconds, min_splay, base):
-    run = False
-    if 'last_run' not in jobdata:
-        if jobdata.get('run_on_start', False):
-            if splay:
-                # Run `splay` seconds in the future, by telling the scheduler we last ran it
-                # `seconds - splay` seconds ago.
-                jobdata['last_run'] = time.time() - (seconds - random.randint(min_splay, splay))
-            else:
-                # Run now
-                run = True
-                jobdata['last_run'] = time.time()
-        else:
-            if splay:
-                # Run `seconds + splay` seconds in the future by telling the scheduler we last
-                # ran it at now + `splay` seconds.
-                jobdata['last_run'] = time.time() + random.randint(min_splay, splay)
-            elif 'buckets' in jobdata:
-                # Place the host in a bucket and fix the execution time.
-                jobdata['last_run'] = getlastrunbybuckets(jobdata['buckets'], seconds)
-                log.debug('last_run according to bucket is %s', jobdata['last_run'])
-            elif 'cron' in jobdata:
-                # execute the hubble process based on cron expression
-                jobdata['last_run'] = getlastrunbycron(base, seconds)
-            else:
-                # Run in `seconds` seconds.
-                jobdata['last_run'] = time.time()
-    if jobdata['last_run'] < time.time() - seconds:
-        run = True
+    for ret in _iter_returns(__mods__[func](*args, **kwargs)):
+        if __opts__['log_level'] == 'debug':
+            log.debug('Job returned:\n%s', ret)
+        for returner in returners:
+            returner = '{0}.returner'.format(returner)
+            if returner not in __returners__:
+                log.error('Could not find %s returner.', returner)
+                continue
+            log.debug('Returning job data to %s', returner)
+            returner_ret = {'id': __grains__['id'],
+                            'jid': hubblestack.utils.jid.gen_jid(__opts__),
+                            'fun': func,
+                            'fun_args': args + ([kwargs] if kwargs else []),
+                            'return': ret}
+            __returners__[returner](returner_ret)
 
-    return run
+
+def _iter_returns(ret):
+    """
+    Functions may return a generator of partial results (e.g.
+    nebula.osqueryd_log_parser) to stream large returns; each partial result
+    is sent to the returners separately. Anything else is a single return.
+    """
+    if isinstance(ret, types.GeneratorType):
+        return ret
+    return [ret]
 
 
 def run_function():
@@ -424,18 +328,25 @@ def run_function():
         log.error('Function %s is not available, or not valid.', __opts__['function'])
         sys.exit(1)
     ret = mod_fun(*args, **kwargs)
-    if __opts__['return']:
-        returner = '{0}.returner'.format(__opts__['return'])
-        if returner not in __returners__:
-            log.error('Could not find %s returner.', returner)
-        else:
-            log.info('Returning job data to %s', returner)
-            returner_ret = {'id': __grains__['id'],
-                            'jid': hubblestack.utils.jid.gen_jid(__opts__),
-                            'fun': __opts__['function'],
-                            'fun_args': args + ([kwargs] if kwargs else []),
-                            'return': ret}
-            __returners__[returner](returner_ret)
+    streamed = isinstance(ret, types.GeneratorType)
+    batches = []
+    for batch in _iter_returns(ret):
+        batches.append(batch)
+        if __opts__['return']:
+            returner = '{0}.returner'.format(__opts__['return'])
+            if returner not in __returners__:
+                log.error('Could not find %s returner.', returner)
+            else:
+                log.info('Returning job data to %s', returner)
+                returner_ret = {'id': __grains__['id'],
+                                'jid': hubblestack.utils.jid.gen_jid(__opts__),
+                                'fun': __opts__['function'],
+                                'fun_args': args + ([kwargs] if kwargs else []),
+                                'return': batch}
+                __returners__[returner](returner_ret)
+    if streamed:
+        # print a streamed return as one list
+        ret = [x for batch in batches for x in batch]
     # TODO instantiate the salt outputter system?
     if __opts__['json_print']:
         print(json.dumps(ret))
@@ -677,6 +588,10 @@ def _setup_dirs():
 # pick it up again.  If the hang is transient, the grain will populate
 # normally.
 #
+# Non-core grains additionally run in a pool with a much shorter per-grain
+# timeout (grains_timeout, see hubblestack.loader._run_grain_pool) and fall
+# back to their last value when they hang.
+#
 # repeats=True meaning: restart the signal itimer after firing the timeout
 # exception, which salt catches. In this way, we can catch multiple hangs with
 # a single timer. Each timer restart is a new 600s timeout.
@@ -736,6 +651,11 @@ def refresh_grains(initial=False):
     # hubble_version and buildinfo.
     __grains__['hubble_marker_3'] = True
 
+    # the loaders only need rebuilding when __virtual__ decisions could change
+    virtual_grains = __opts__.get('grains_virtual_keys', hubblestack.loader.VIRTUAL_GRAINS)
+    rebuild_loaders = initial or any(old_grains.get(grain) != __grains__[grain]
+                                     for grain in virtual_grains if grain in __grains__)
+
     old_grains.update(__grains__)
     __grains__ = old_grains
 
@@ -748,10 +668,18 @@ def refresh_grains(initial=False):
     __opts__['system_uuid'] = __grains__.get('system_uuid', None)
     __pillar__ = {}
     __opts__['grains'] = __grains__
+    # lets matchers (see hubblestack.matchers.compound_match) tell when
+    # results computed against the previous grains have gone stale
+    __opts__['grains_generation'] = __opts__.get('grains_generation', 0) + 1
     __opts__['pillar'] = __pillar__
-    __utils__ = hubblestack.loader.utils(__opts__)
-    __mods__ = hubblestack.loader.modules(__opts__, utils=__utils__, context=__context__)
-    __returners__ = hubblestack.loader.returners(__opts__, __mods__)
+    if rebuild_loaders:
+        __utils__ = hubblestack.loader.utils(__opts__)
+        __mods__ = hubblestack.loader.modules(__opts__, utils=__utils__, context=__context__)
+        __returners__ = hubblestack.loader.returners(__opts__, __mods__)
+    else:
+        log.debug('virtual grains unchanged, keeping the loaded modules')
+        for loader in (__utils__, __mods__, __returners__):
+            loader.refresh_opts(__opts__)
 
     # the only things that turn up in here (and that get preserved)
     # are pulsar.queue, pulsar.notifier and cp.fileclient_###########
@@ -763,6 +691,9 @@ def refresh_grains(initial=False):
     hubblestack.hec.opt.__grains__ = __grains__
     hubblestack.hec.opt.__mods__ = __mods__
     hubblestack.hec.opt.__opts__ = __opts__
+    # splunk options may have changed; let the HEC registry drop collectors
+    # that aren't used anymore
+    hubblestack.hec.registry.refresh()
 
     hubblestack.log.splunk.__grains__ = __grains__
     hubblestack.log.splunk.__mods__ = __mods__
@@ -9,6 +9,7 @@ This fdg module allows for grepping against files and strings
 import logging
 import os.path
 
+import hubblestack.utils.pygrep
 from hubblestack.exceptions import CommandExecutionError
 
 log = logging.getLogger(__name__)
@@ -130,6 +131,11 @@ def _grep(pattern, path=None, string=None, args=None):
     if path:
         cmd += [path]
 
+    try:
+        return hubblestack.utils.pygrep.run(cmd, stdin=string)['stdout']
+    except hubblestack.utils.pygrep.GrepUnsupported as exc:
+        log.debug('running grep binary, in-process grep not possible: %s', exc)
+
     try:
         ret = __mods__['cmd.run_stdout'](cmd, python_shell=False, ignore_retcode=True, stdin=string)
     except (IOError, OSError) as exc:
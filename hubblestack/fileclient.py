@@ -6,11 +6,13 @@ Classes that manage file clients
 # Import python libs
 import contextlib
 import errno
+import json
 import logging
 import os
 import string
 import shutil
 import ftplib
+from concurrent.futures import ThreadPoolExecutor
 from tornado.httputil import parse_response_start_line, HTTPHeaders, HTTPInputError
 from urllib.parse import urlparse, urlunparse
 from urllib.error import HTTPError, URLError
@@ -224,17 +226,24 @@ class Client(object):
         log.info(
             'Caching directory \'%s\' for environment \'%s\'', path, saltenv
         )
-        # go through the list of all files finding ones that are in
-        # the target directory and caching them
-        for fn_ in self.file_list(saltenv):
-            fn_ = hubblestack.utils.data.decode(fn_)
-            if fn_.strip() and fn_.startswith(path):
-                if hubblestack.utils.stringutils.check_include_exclude(
-                        fn_, include_pat, exclude_pat):
-                    fn_ = self.cache_file(
-                        hubblestack.utils.url.create(fn_), saltenv, cachedir=cachedir)
-                    if fn_:
-                        ret.append(fn_)
+        manifest = None
+        if self.opts.get('fileclient_delta_sync', False):
+            manifest = self.file_manifest(saltenv, prefix=path)
+        if isinstance(manifest, dict):
+            ret.extend(self._cache_dir_delta(path, manifest, saltenv,
+                include_pat, exclude_pat, cachedir))
+        else:
+            # go through the list of all files finding ones that are in
+            # the target directory and caching them
+            for fn_ in self.file_list(saltenv):
+                fn_ = hubblestack.utils.data.decode(fn_)
+                if fn_.strip() and fn_.startswith(path):
+                    if hubblestack.utils.stringutils.check_include_exclude(
+                            fn_, include_pat, exclude_pat):
+                        fn_ = self.cache_file(
+                            hubblestack.utils.url.create(fn_), saltenv, cachedir=cachedir)
+                        if fn_:
+                            ret.append(fn_)
 
         if include_empty:
             # Break up the path into a list containing the bottom-level
@@ -275,6 +284,126 @@ class Client(object):
 
         return ret
 
+    def _manifest_path(self, saltenv, cachedir=None):
+        return os.path.join(self.get_cachedir(cachedir), 'file_manifests',
+                            '{0}.json'.format(saltenv))
+
+    def _load_manifest(self, saltenv, cachedir=None):
+        '''
+        Return the persisted manifest of the files cache_dir() fetched:
+        {path: {'hsum', 'hash_type', 'mtime', 'size'}} where mtime and size
+        are the local copy's after it was written
+        '''
+        try:
+            with hubblestack.utils.files.fopen(self._manifest_path(saltenv, cachedir), 'r') as fh:
+                ret = json.load(fh)
+        except (IOError, OSError, ValueError):
+            return {}
+        return ret if isinstance(ret, dict) else {}
+
+    def _save_manifest(self, manifest, saltenv, cachedir=None):
+        fname = self._manifest_path(saltenv, cachedir)
+        try:
+            if not os.path.isdir(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname))
+            with hubblestack.utils.atomicfile.atomic_open(fname, 'w') as fh:
+                json.dump(manifest, fh)
+        except (IOError, OSError) as exc:
+            log.warning('Unable to save the file manifest %s: %s', fname, exc)
+
+    def _fetch_file(self, path, saltenv, dest, entry):
+        '''
+        Download path to dest and check it against the manifest entry; returns
+        True on success
+        '''
+        for attempt in range(1, 4):
+            load = {'path': path, 'saltenv': saltenv, 'cmd': '_serve_file', 'loc': 0}
+            try:
+                with hubblestack.utils.atomicfile.atomic_open(dest, 'wb+') as fh:
+                    while True:
+                        data = decode_dict_keys_to_str(self.channel.send(load, raw=True))
+                        chunk = data['data']
+                        if not chunk:
+                            break
+                        if data.get('gzip', None):
+                            chunk = hubblestack.utils.gzip_util.uncompress(chunk)
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode()
+                        fh.write(chunk)
+                        load['loc'] = fh.tell()
+            except (IOError, OSError, TypeError, KeyError) as exc:
+                log.warning('Fetching %s failed, attempt %d of 3: %s', path, attempt, exc)
+                continue
+            if not entry.get('hash_type'):
+                return True
+            hsum = hubblestack.utils.hashutils.get_hash(dest, entry['hash_type'])
+            if hsum == entry['hsum']:
+                return True
+            log.warning('Bad download of file %s, attempt %d of 3', path, attempt)
+        return False
+
+    def _cache_dir_delta(self, path, manifest, saltenv, include_pat, exclude_pat, cachedir):
+        '''
+        Cache the files of the (fileserver) manifest under path, fetching
+        (concurrently) only those that differ from the manifest persisted by
+        the previous sync. Unchanged local copies are recognized by their
+        mtime and size rather than re-hashed.
+        '''
+        local = self._load_manifest(saltenv, cachedir)
+        ret = []
+        todo = []
+        for fn_ in sorted(manifest):
+            entry = manifest[fn_]
+            fn_ = hubblestack.utils.data.decode(fn_)
+            if not fn_.strip() or not fn_.startswith(path):
+                continue
+            if not hubblestack.utils.stringutils.check_include_exclude(
+                    fn_, include_pat, exclude_pat):
+                continue
+            with self._cache_loc(fn_, saltenv, cachedir=cachedir) as dest:
+                pass
+            try:
+                st = os.stat(dest)
+            except OSError:
+                st = None
+            known = local.get(fn_)
+            if st is not None and known is None and entry.get('hash_type') \
+                    and st.st_size == entry.get('size') \
+                    and hubblestack.utils.hashutils.get_hash(dest, entry['hash_type']) == entry['hsum']:
+                # cached before there was a manifest
+                known = local[fn_] = {'hsum': entry['hsum'], 'hash_type': entry['hash_type'],
+                                      'mtime': st.st_mtime_ns, 'size': st.st_size}
+            if st is not None and known \
+                    and known.get('hsum') == entry['hsum'] \
+                    and known.get('hash_type') == entry.get('hash_type') \
+                    and known.get('mtime') == st.st_mtime_ns and known.get('size') == st.st_size:
+                ret.append(dest)
+                continue
+            if os.path.isdir(dest):
+                hubblestack.utils.files.rm_rf(dest)
+            todo.append((fn_, entry, dest))
+
+        if todo:
+            workers = max(1, int(self.opts.get('fileclient_workers', 4)))
+            log.info('cache_dir(%s) fetching %d changed files with %d workers',
+                     path, len(todo), workers)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda x: self._fetch_file(x[0], saltenv, x[2], x[1]), todo))
+            for (fn_, entry, dest), fetched in zip(todo, results):
+                if not fetched:
+                    local.pop(fn_, None)
+                    continue
+                st = os.stat(dest)
+                local[fn_] = {'hsum': entry['hsum'], 'hash_type': entry.get('hash_type'),
+                              'mtime': st.st_mtime_ns, 'size': st.st_size}
+                ret.append(dest)
+
+        # forget the files that are gone from the fileserver
+        for fn_ in [x for x in local if x.startswith(path) and x not in manifest]:
+            del local[fn_]
+        self._save_manifest(local, saltenv, cachedir)
+        return ret
+
     def cache_local_file(self, path, **kwargs):
         '''
         Cache a local file on the minion in the localfiles cache
@@ -306,6 +435,13 @@ class Client(object):
         '''
         return []
 
+    def file_manifest(self, saltenv='base', prefix=''):
+        '''
+        Return {path: {'hsum', 'hash_type', 'size'}} for the files under
+        prefix, or None if the file server can't
+        '''
+        return None
+
     def dir_list(self, saltenv='base', prefix=''):
         '''
         This function must be overwritten
@@ -969,6 +1105,15 @@ class RemoteClient(Client):
                 'cmd': '_file_list'}
         return self.channel.send(load)
 
+    def file_manifest(self, saltenv='base', prefix=''):
+        '''
+        List the files on the master with their hash and size
+        '''
+        load = {'saltenv': saltenv,
+                'prefix': prefix,
+                'cmd': '_file_manifest'}
+        return self.channel.send(load)
+
     def file_list_emptydirs(self, saltenv='base', prefix=''):
         '''
         List the empty dirs on the master
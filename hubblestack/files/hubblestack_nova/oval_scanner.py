@@ -38,6 +38,14 @@ references based on OVAL test reference data of the definition, and then makes
 a comparison to the local packages installed on the system to identify
 potential vulnerabilities.
 
+Remote source files are kept under the ``oval_cache_dir`` option (by default
+``<cachedir>/oval``) and only downloaded again once they are older than
+``oval_feed_max_age`` seconds (a day by default). Each source file is compiled
+into an index next to it (``<source file>.idx``, an sqlite database) holding
+the vulnerable package versions keyed by package name; the index is rebuilt
+only when the sha256 of the source file changes, and a scan only loads the
+entries of the packages that are installed.
+
 This scanner currently only supports the Linux platform.
 """
 
@@ -47,12 +55,24 @@ import defusedxml.ElementTree as etree
 from xml.etree.ElementTree import Element
 import json
 import datetime
+import hashlib
 import requests
 import logging
 import os
+import time
 from os import path
 import hubblestack.utils.platform
 
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# bump when the layout of the index changes, so older indexes are rebuilt
+OVAL_INDEX_VERSION = 1
+# sqlite's default limit on the number of parameters of a statement
+_SQL_MAX_PARAMS = 999
+
 def __virtual__():
     return not hubblestack.utils.platform.is_windows()
 
@@ -82,10 +102,12 @@ def audit(data_list, tags, labels, debug=False, **kwargs):
             opt_local_sourcefile = data['oval_scanner']['opt_local_sourcefile']
             opt_output_file = data['oval_scanner']['opt_output_file']
             # Build report
-            source_content = get_source_content(distro_name, distro_release, distro_codename, opt_baseurl, opt_remote_sourcefile, opt_local_sourcefile)
-            oval_definition = build_oval(source_content)
-            oval_and_maps = map_oval_ids(oval_definition)
-            vulns = create_vulns(oval_and_maps, pkg_src_ref)
+            cache_dir = __opts__.get('oval_cache_dir') or \
+                path.join(__opts__.get('cachedir', ''), 'oval')
+            source_file = get_source_file(distro_name, distro_release, distro_codename, opt_baseurl,
+                                          opt_remote_sourcefile, opt_local_sourcefile, cache_dir,
+                                          __opts__.get('oval_feed_max_age', 86400))
+            vulns = get_vulns(source_file, cache_dir, local_pkgs, pkg_src_ref)
             report = get_impact_report(vulns, local_pkgs, distro_name)
             # Write report to file if specified
             if opt_output_file:
@@ -300,12 +322,13 @@ def build_oval(source_content, oval={}):
         'common': 'http://oval.mitre.org/XMLSchema/oval-common-5'
     }
     root = build_element_tree(source_content)
-    oval['generator'] = build_generator(root, namespace)
-    oval['definitions'] = build_definitions(root, namespace)
-    oval['tests'] = build_tests(root, namespace)
-    oval['objects'] = build_objects(root, namespace)
-    oval['states'] = build_states(root, namespace)
-    oval['vars'] = build_vars(root, namespace)
+    # start from empty maps, so nothing is left over from a previous source
+    oval['generator'] = build_generator(root, namespace, {})
+    oval['definitions'] = build_definitions(root, namespace, {})
+    oval['tests'] = build_tests(root, namespace, {})
+    oval['objects'] = build_objects(root, namespace, {})
+    oval['states'] = build_states(root, namespace, {})
+    oval['vars'] = build_vars(root, namespace, {})
     return oval
 
 
@@ -451,19 +474,185 @@ def build_element_tree(source_content):
     return etree.fromstring(source_content)
 
 
-# Get oval source
-def get_source_content(distro_name, distro_release, distro_codename, base_url, source_file, local_file=None):
-    """Get content from the source"""
-    logging.debug('get_source_content')
-    if not local_file:
-        url = get_definition_source(base_url, source_file, distro_name, distro_release, distro_codename)
-        logging.info('Reading remote file: {0}, this could take some time...'.format(url))
-        source = requests.get(url).content
-        return source
+# Compiled index of the oval source
+def get_vulns(source_file, cache_dir, local_pkgs, pkg_src_ref=None):
+    """
+    Return the vulnerabilities of the oval source that concern the installed
+    packages, from the index of the source (compiled first if need be)
+    """
+    logging.debug('get_vulns')
+    if sqlite3 is not None:
+        index_file = path.join(cache_dir, path.basename(source_file) + '.idx')
+        try:
+            get_oval_index(source_file, index_file)
+            return load_vulns(index_file, local_pkgs)
+        except (sqlite3.Error, OSError, IOError) as exc:
+            logging.warning('Unable to use the oval index {0}: {1}'.format(index_file, exc))
+    with open(source_file, 'rb') as f:
+        source_content = f.read()
+    oval_and_maps = map_oval_ids(build_oval(source_content, {}), {})
+    return create_vulns(oval_and_maps, pkg_src_ref or {})
+
+
+def _file_sig(st):
+    return '{0}:{1}:{2}'.format(st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _file_sha256(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _index_meta(index_file):
+    """Return the meta data of an index, empty if there's no usable index"""
+    if not path.isfile(index_file):
+        return {}
+    conn = sqlite3.connect(index_file)
+    try:
+        return dict(conn.execute('SELECT key, value FROM meta'))
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+
+
+def get_oval_index(source_file, index_file):
+    """
+    Make sure index_file is the index of source_file: it's only compiled again
+    when the sha256 of the source changed (which is only computed again when
+    the source was rewritten). Returns True when the index was (re)built.
+    """
+    logging.debug('get_oval_index')
+    sig = _file_sig(os.stat(source_file))
+    meta = _index_meta(index_file)
+    if meta.get('version') == str(OVAL_INDEX_VERSION):
+        if meta.get('source_sig') == sig:
+            return False
+        digest = _file_sha256(source_file)
+        if meta.get('sha256') == digest:
+            # e.g. downloaded again, but the same content
+            conn = sqlite3.connect(index_file)
+            with conn:
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'source_sig'", (sig,))
+            conn.close()
+            return False
     else:
+        digest = _file_sha256(source_file)
+    build_oval_index(source_file, index_file, digest, sig)
+    return True
+
+
+def build_oval_index(source_file, index_file, digest, sig):
+    """Compile source_file into a new index_file"""
+    logging.info('Compiling oval source {0} into {1}, this could take some time...'.format(
+        source_file, index_file))
+    with open(source_file, 'rb') as f:
+        source_content = f.read()
+    oval_and_maps = map_oval_ids(build_oval(source_content, {}), {})
+    vulns = create_vulns(oval_and_maps, {})
+    del source_content, oval_and_maps
+
+    index_dir = path.dirname(index_file)
+    if index_dir and not path.isdir(index_dir):
+        os.makedirs(index_dir)
+    tmp_file = '{0}.{1}.tmp'.format(index_file, os.getpid())
+    if path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    try:
+        with conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE definitions (id TEXT PRIMARY KEY, data TEXT)')
+            conn.execute('CREATE TABLE packages (seq INTEGER PRIMARY KEY, name TEXT, '
+                         'definition TEXT, version TEXT)')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                             [('version', str(OVAL_INDEX_VERSION)), ('sha256', digest),
+                              ('source_sig', sig)])
+            seq = 0
+            for definition, data in vulns.items():
+                pkgs = data.get('pkg', [])
+                if not pkgs:
+                    continue
+                details = dict((k, v) for k, v in data.items() if k not in ('pkg', 'tests'))
+                conn.execute('INSERT INTO definitions VALUES (?, ?)',
+                             (definition, json.dumps(details)))
+                for pkg in pkgs:
+                    conn.execute('INSERT INTO packages VALUES (?, ?, ?, ?)',
+                                 (seq, pkg['name'], definition, pkg['version']))
+                    seq += 1
+            conn.execute('CREATE INDEX packages_name ON packages (name)')
+    finally:
+        conn.close()
+    os.replace(tmp_file, index_file)
+
+
+def load_vulns(index_file, pkg_names):
+    """
+    Load the vulnerabilities of the packages pkg_names from an index, in the
+    shape (and order) create_vulns() gives them
+    """
+    logging.debug('load_vulns')
+    pkg_names = list(pkg_names)
+    rows = []
+    conn = sqlite3.connect(index_file)
+    try:
+        for idx in range(0, len(pkg_names), _SQL_MAX_PARAMS):
+            chunk = pkg_names[idx:idx + _SQL_MAX_PARAMS]
+            rows.extend(conn.execute(
+                'SELECT seq, name, definition, version FROM packages WHERE name IN ({0})'.format(
+                    ','.join('?' * len(chunk))), chunk))
+        rows.sort()
+        definitions = list(dict.fromkeys(row[2] for row in rows))
+        details = {}
+        for idx in range(0, len(definitions), _SQL_MAX_PARAMS):
+            chunk = definitions[idx:idx + _SQL_MAX_PARAMS]
+            details.update(conn.execute(
+                'SELECT id, data FROM definitions WHERE id IN ({0})'.format(
+                    ','.join('?' * len(chunk))), chunk))
+    finally:
+        conn.close()
+    vulns = {}
+    for definition in definitions:
+        vulns[definition] = json.loads(details[definition])
+        vulns[definition]['pkg'] = []
+    for _, name, definition, version in rows:
+        vulns[definition]['pkg'].append({'name': name, 'version': version})
+    return vulns
+
+
+# Get oval source
+def get_source_file(distro_name, distro_release, distro_codename, base_url, source_file,
+                    local_file=None, cache_dir=None, max_age=86400):
+    """Get the local path of the source, downloading it into cache_dir if need be"""
+    logging.debug('get_source_file')
+    if local_file:
         logging.info('Found local file: {0}'.format(local_file))
-        with open(local_file, 'rb') as f:
-            return f.read()
+        return local_file
+    url = get_definition_source(base_url, source_file, distro_name, distro_release, distro_codename)
+    cached_file = path.join(cache_dir, path.basename(url))
+    if path.isfile(cached_file) and time.time() - path.getmtime(cached_file) < max_age:
+        logging.debug('Using cached file: {0}'.format(cached_file))
+        return cached_file
+    logging.info('Reading remote file: {0}, this could take some time...'.format(url))
+    try:
+        response = requests.get(url)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as exc:
+        if path.isfile(cached_file):
+            logging.warning('Unable to read {0} ({1}), using cached file {2}'.format(
+                url, exc, cached_file))
+            return cached_file
+        raise
+    if not path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = '{0}.{1}.tmp'.format(cached_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp_file, cached_file)
+    return cached_file
 
 
 def get_definition_source(base_url, source_file, distro_name, distro_release, distro_codename):
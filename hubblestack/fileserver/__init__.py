@@ -22,24 +22,49 @@ except ImportError:
 log = logging.getLogger(__name__)
 
 
+_IGNORE_PATTERNS = {}
+
+
+def _ignore_patterns(opts):
+    """
+    Return the compiled (file_ignore_regex, file_ignore_glob) patterns,
+    compiling them only when the settings change
+    """
+    def _listify(val):
+        if not val:
+            return ()
+        if isinstance(val, str):
+            return (val,)
+        return tuple(val)
+    key = (_listify(opts['file_ignore_regex']), _listify(opts['file_ignore_glob']))
+    pats = _IGNORE_PATTERNS.get(key)
+    if pats is None:
+        _IGNORE_PATTERNS.clear()
+        pats = _IGNORE_PATTERNS[key] = (
+            [re.compile(regex) for regex in key[0]],
+            [re.compile(fnmatch.translate(os.path.normcase(glob))) for glob in key[1]])
+    return pats
+
+
 def is_file_ignored(opts, fname):
     """
     If file_ignore_regex or file_ignore_glob were given in config,
     compare the given file path against all of them and return True
     on the first match.
     """
-    if opts['file_ignore_regex']:
-        for regex in opts['file_ignore_regex']:
-            if re.search(regex, fname):
-                log.debug(
-                    'File matching file_ignore_regex. Skipping: %s',
-                    fname
-                )
-                return True
+    regexes, globs = _ignore_patterns(opts)
+    for regex in regexes:
+        if regex.search(fname):
+            log.debug(
+                'File matching file_ignore_regex. Skipping: %s',
+                fname
+            )
+            return True
 
-    if opts['file_ignore_glob']:
-        for glob in opts['file_ignore_glob']:
-            if fnmatch.fnmatch(fname, glob):
+    if globs:
+        normed = os.path.normcase(fname)
+        for glob in globs:
+            if glob.match(normed):
                 log.debug(
                     'File matching file_ignore_glob. Skipping: %s',
                     fname
@@ -48,6 +73,90 @@ def is_file_ignored(opts, fname):
     return False
 
 
+class DirIndex(object):
+    """
+    A persistent index of directory listings. walk() works like os.walk()
+    but only lists the directories whose mtime changed since the previous
+    walk; the others are served from the index. Backends may keep whatever
+    they derive from a walk in ``lists`` (with the settings it depends on in
+    ``config`` and the time of the walk in ``checked``) and rebuild it only
+    when walk() reports a change.
+    """
+
+    def __init__(self):
+        self.dirs = dict() # dirpath -> (mtime_ns, [(dirname, is_link)], [filename])
+        self.changed = False
+        self.lists = None
+        self.config = None
+        self.checked = 0
+
+    def _listing(self, path, mtime):
+        dirnames = list()
+        filenames = list()
+        for entry in os.scandir(path):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirnames.append((entry.name, entry.is_symlink()))
+            else:
+                filenames.append(entry.name)
+        return (mtime, sorted(dirnames), sorted(filenames))
+
+    def walk(self, top, followlinks=False):
+        """
+        Yield (dirpath, dirnames, filenames) for top and the directories
+        under it (top down, like os.walk). Sets changed if any listing had
+        to be read again or went away.
+        """
+        seen = set()
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                ent = self.dirs.get(path)
+                if ent is None or ent[0] != mtime:
+                    ent = self.dirs[path] = self._listing(path, mtime)
+                    self.changed = True
+            except OSError:
+                # like os.walk, skip what can't be listed
+                continue
+            seen.add(path)
+            yield path, [x[0] for x in ent[1]], list(ent[2])
+            for name, is_link in reversed(ent[1]):
+                if followlinks or not is_link:
+                    stack.append(os.path.join(path, name))
+        prefix = os.path.join(top, '')
+        for path in [x for x in self.dirs if x not in seen and (x == top or x.startswith(prefix))]:
+            del self.dirs[path]
+            self.changed = True
+
+    def is_empty(self, path):
+        """ whether the directory at path is empty (None if it isn't one) """
+        ent = self.dirs.get(path)
+        if ent is not None:
+            return not ent[1] and not ent[2]
+        try:
+            return not os.listdir(path)
+        except OSError:
+            return None
+
+
+_DIR_INDEXES = dict()
+
+
+def get_dir_index(*key):
+    """
+    Return the process-wide DirIndex for key (e.g. backend, saltenv)
+    """
+    index = _DIR_INDEXES.get(key)
+    if index is None:
+        index = _DIR_INDEXES[key] = DirIndex()
+    return index
+
+
 def wait_lock(lk_fn, dest, wait_timeout=0):
     """
     If the write lock is there, check to see if the file is actually being
@@ -184,8 +293,9 @@ def generate_mtime_map(opts, path_map):
     """
     file_map = {}
     for saltenv, path_list in iter(path_map.items()):
+        index = get_dir_index('mtime_map', saltenv)
         for path in path_list:
-            for directory, _, filenames in hubblestack.utils.path.os_walk(path):
+            for directory, _, filenames in index.walk(path, followlinks=False):
                 for item in filenames:
                     try:
                         file_path = os.path.join(directory, item)
@@ -680,6 +790,43 @@ class Fileserver(object):
         except (IndexError, TypeError):
             return '', None
 
+    def file_manifest(self, load):
+        '''
+        Return {path: {'hsum': ..., 'hash_type': ..., 'size': ...}} for the
+        files under load['prefix'] in one call, so a client can tell which of
+        its cached copies are out of date without asking about each file
+        '''
+        if 'env' in load:
+            # "env" is not supported; Use "saltenv".
+            load.pop('env')
+
+        if 'saltenv' not in load:
+            return {}
+        if not isinstance(load['saltenv'], str):
+            load['saltenv'] = str(load['saltenv'])
+
+        ret = {}
+        for path in self.file_list(dict(load)):
+            fnd = self.find_file(path, load['saltenv'])
+            if not fnd.get('back'):
+                continue
+            fstr = '{0}.file_hash'.format(fnd['back'])
+            if fstr not in self.servers:
+                continue
+            hsum = self.servers[fstr]({'path': path, 'saltenv': load['saltenv']}, fnd)
+            if not isinstance(hsum, dict) or not hsum.get('hsum'):
+                continue
+            stat_result = fnd.get('stat')
+            try:
+                size = stat_result[6]
+            except (IndexError, TypeError):
+                try:
+                    size = os.path.getsize(fnd['path'])
+                except OSError:
+                    size = None
+            ret[path] = {'hsum': hsum['hsum'], 'hash_type': hsum.get('hash_type'), 'size': size}
+        return ret
+
     def clear_file_list_cache(self, load):
         '''
         Deletes the file_lists cache files
@@ -702,6 +849,10 @@ class Fileserver(object):
 
         ret = {}
         fsb = self.backends(load.pop('fsbackend', None))
+        # the in-memory lists (see DirIndex)
+        for key, index in _DIR_INDEXES.items():
+            if key[0] in fsb and (saltenv is None or key[1] in saltenv):
+                index.lists = None
         list_cachedir = os.path.join(self.opts['cachedir'], 'file_lists')
         try:
             file_list_backends = os.listdir(list_cachedir)
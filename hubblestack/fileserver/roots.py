@@ -19,6 +19,7 @@ configuration option.
 import os
 import errno
 import logging
+import time
 
 import hubblestack.fileserver
 import hubblestack.utils.files
@@ -281,22 +282,35 @@ def _file_lists(load, form):
     if load['saltenv'] not in __opts__['file_roots']:
         return []
 
-    list_cachedir = os.path.join(__opts__['cachedir'], 'file_lists', 'roots')
-    if not os.path.isdir(list_cachedir):
-        try:
-            os.makedirs(list_cachedir)
-        except os.error:
-            log.critical('Unable to make cachedir %s', list_cachedir)
-            return []
-    list_cache = os.path.join(list_cachedir, '{0}.p'.format(load['saltenv']))
-    w_lock = os.path.join(list_cachedir, '.{0}.w'.format(load['saltenv']))
-    cache_match, refresh_cache, save_cache = \
-        hubblestack.fileserver.check_file_list_cache(
-            __opts__, form, list_cache, w_lock
-        )
-    if cache_match is not None:
-        return cache_match
-    if refresh_cache:
+    # The lists are kept in memory for fileserver_list_cache_time seconds;
+    # after that the directories are stat'd again, only those whose mtime
+    # changed are listed again, and the lists are only rebuilt if anything
+    # changed.
+    saltenv = load['saltenv']
+    index = hubblestack.fileserver.get_dir_index('roots', saltenv)
+    config = (tuple(__opts__['file_roots'][saltenv]),
+              __opts__['fileserver_followsymlinks'],
+              __opts__['fileserver_ignoresymlinks'],
+              hubblestack.fileserver._ignore_patterns(__opts__))
+    if index.config != config:
+        index.dirs.clear()
+        index.lists = None
+    now = time.time()
+    if index.lists is not None \
+            and 0 <= now - index.checked < __opts__.get('fileserver_list_cache_time', 20):
+        return index.lists.get(form, [])
+
+    walked = list()
+    for path in __opts__['file_roots'][saltenv]:
+        for root, dirs, files in index.walk(
+                path,
+                followlinks=__opts__['fileserver_followsymlinks']):
+            walked.append((path, root, dirs, files))
+    index.checked = now
+
+    if index.lists is None or index.changed:
+        index.changed = False
+        index.config = config
         ret = {
             'files': set(),
             'dirs': set(),
@@ -329,14 +343,8 @@ def _file_lists(load, form):
                 if hubblestack.fileserver.is_file_ignored(__opts__, rel_path):
                     continue
                 tgt.add(rel_path)
-                try:
-                    if not os.listdir(abs_path):
-                        ret['empty_dirs'].add(rel_path)
-                except Exception:
-                    # Generic exception because running os.listdir() on a
-                    # non-directory path raises an OSError on *NIX and a
-                    # WindowsError on Windows.
-                    pass
+                if tgt is ret['dirs'] and index.is_empty(abs_path):
+                    ret['empty_dirs'].add(rel_path)
                 if is_link:
                     link_dest = hubblestack.utils.path.readlink(abs_path)
                     log.trace(
@@ -375,28 +383,16 @@ def _file_lists(load, form):
                         # (i.e. the "path" variable)
                         ret['links'][rel_path] = link_dest
 
-        for path in __opts__['file_roots'][load['saltenv']]:
-            for root, dirs, files in hubblestack.utils.path.os_walk(
-                    path,
-                    followlinks=__opts__['fileserver_followsymlinks']):
-                _add_to(ret['dirs'], path, root, dirs)
-                _add_to(ret['files'], path, root, files)
+        for path, root, dirs, files in walked:
+            _add_to(ret['dirs'], path, root, dirs)
+            _add_to(ret['files'], path, root, files)
 
         ret['files'] = sorted(ret['files'])
         ret['dirs'] = sorted(ret['dirs'])
         ret['empty_dirs'] = sorted(ret['empty_dirs'])
+        index.lists = ret
 
-        if save_cache:
-            try:
-                hubblestack.fileserver.write_file_list_cache(
-                    __opts__, ret, list_cache, w_lock
-                )
-            except NameError:
-                # Catch msgpack error in salt-ssh
-                pass
-        return ret.get(form, [])
-    # Shouldn't get here, but if we do, this prevents a TypeError
-    return []
+    return index.lists.get(form, [])
 
 
 def file_list(load):
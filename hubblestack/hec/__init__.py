@@ -2,3 +2,4 @@
 
 from . obj import Payload, HEC, http_event_collector
 from . opt import get_splunk_options, make_hec_args
+from . registry import get_hec
@@ -1,18 +1,30 @@
 # -*- encoding: utf-8 -*-
 
 import bz2
+import gzip
 import os
 import logging
 import time
 import shutil
 import json
+import struct
+import threading
+import zlib
 from collections import deque
 from hubblestack.utils.misc import numbered_file_split_key
 from hubblestack.utils.encoding import encode_something_to_bytes, decode_something_to_string
 
+HAS_LZMA = False
+try:
+    import lzma
+    HAS_LZMA = True
+except ImportError:
+    pass
+
 __all__ = [
     'QueueTypeError', 'QueueCapacityError', 'MemQueue', 'DiskQueue',
-    'DiskBackedQueue', 'DEFAULT_MEMORY_SIZE', 'DEFAULT_DISK_SIZE',
+    'DiskBackedQueue', 'SegmentDiskQueue', 'make_disk_queue',
+    'DEFAULT_MEMORY_SIZE', 'DEFAULT_DISK_SIZE',
 ]
 
 log = logging.getLogger(__name__)
@@ -22,6 +34,94 @@ SPLUNK_MAX_MSG = 100000 # 100k
 DEFAULT_MEMORY_SIZE = SPLUNK_MAX_MSG * 5 # 500k
 DEFAULT_DISK_SIZE = DEFAULT_MEMORY_SIZE * 1000 # 0.5GB
 
+# Compressed items are stored as CODEC_TAG + <codec byte> + <compressed data>
+# so the reader doesn't have to guess. Items written before codecs were
+# pluggable are either raw or bz2 (sniffed by their "BZh" header); both still
+# decompress fine. Uncompressed items are stored raw (untagged), as before.
+CODEC_TAG = b'\x00Q'
+
+def _bz2_compress(dat, level):
+    return bz2.compress(dat, max(1, min(9, level)))
+
+def _zlib_compress(dat, level):
+    return zlib.compress(dat, level)
+
+def _gzip_compress(dat, level):
+    return gzip.compress(dat, compresslevel=level, mtime=0)
+
+def _lzma_compress(dat, level):
+    return lzma.compress(dat, preset=level)
+
+# name: (tag byte, default level, compress(data, level), decompress(data))
+CODECS = {
+    'bz2': (b'b', 5, _bz2_compress, bz2.decompress),
+    'zlib': (b'z', 1, _zlib_compress, zlib.decompress),
+    'gzip': (b'g', 1, _gzip_compress, gzip.decompress),
+}
+if HAS_LZMA:
+    CODECS['lzma'] = (b'x', 0, _lzma_compress, lzma.decompress)
+CODECS_BY_TAG = {v[0]: k for k, v in CODECS.items()}
+
+def parse_compression(compression):
+    """ turn a disk_queue_compression setting into (codec name, level)
+
+        * 0, None, False, 'none' → no compression
+        * an integer N (the historical setting) → bz2 at level N
+        * 'zlib', 'gzip', 'lzma', 'bz2' → that codec at its default level
+        * 'zlib:3' (etc) → that codec at the given level
+
+        returns (None, None) for no compression
+    """
+    if not compression:
+        return None, None
+    if isinstance(compression, str):
+        compression = compression.strip().lower()
+        if compression.isdigit():
+            return parse_compression(int(compression))
+        name, _, level = compression.partition(':')
+        if name in ('none', 'off', 'false', 'no'):
+            return None, None
+        if name not in CODECS:
+            log.error('unknown disk_queue_compression "%s", not compressing', compression)
+            return None, None
+        try:
+            level = int(level) if level else CODECS[name][1]
+        except ValueError:
+            log.error('bad disk_queue_compression level "%s", using the default', compression)
+            level = CODECS[name][1]
+        return name, level
+    if isinstance(compression, bool):
+        return 'bz2', CODECS['bz2'][1]
+    return 'bz2', int(compression)
+
+def compress(dat, codec, level=None):
+    """ compress (and tag) dat with the named codec (or not at all, for None) """
+    dat = encode_something_to_bytes(dat)
+    if not codec:
+        return dat
+    tag, default_level, func, _ = CODECS[codec]
+    return CODEC_TAG + tag + func(dat, default_level if level is None else level)
+
+def decompress(dat):
+    """ decompress dat according to its codec tag (or the legacy bz2 header) """
+    dat = encode_something_to_bytes(dat)
+    if dat.startswith(CODEC_TAG):
+        codec = CODECS_BY_TAG.get(dat[len(CODEC_TAG):len(CODEC_TAG)+1])
+        if codec is None:
+            log.error('unknown codec tag %s in disk queue item', repr(dat[:len(CODEC_TAG)+1]))
+            return dat
+        try:
+            return CODECS[codec][3](dat[len(CODEC_TAG)+1:])
+        except (IOError, EOFError, ValueError, zlib.error):
+            log.error('unable to decompress %s disk queue item', codec)
+            return dat
+    if dat.startswith(b'BZ'):
+        try:
+            return bz2.BZ2Decompressor().decompress(dat)
+        except IOError:
+            pass
+    return dat
+
 class QueueTypeError(Exception):
     pass
 
@@ -61,7 +161,8 @@ class DiskQueue(OKTypesMixin):
         self.init_types(ok_types)
         self.init_dq(directory, size)
         self.compression = compression
-        log.debug('DiskQueue.__init__(%s, compression=%d)', directory, compression)
+        self.codec, self.level = parse_compression(compression)
+        log.debug('DiskQueue.__init__(%s, compression=%s)', directory, compression)
         if fresh:
             self.clear()
         self._count()
@@ -72,14 +173,7 @@ class DiskQueue(OKTypesMixin):
     __nonzero__ = __bool__ # stupid python2
 
     def compress(self, dat):
-        dat = encode_something_to_bytes(dat)
-        if not self.compression:
-            return dat
-        def _bz2(x):
-            b = bz2.BZ2Compressor(self.compression)
-            d = b.compress(x)
-            return d + b.flush()
-        return _bz2(dat)
+        return compress(dat, self.codec, self.level)
 
     def unlink_(self, fname):
         names = (fname, fname + '.meta')
@@ -88,13 +182,7 @@ class DiskQueue(OKTypesMixin):
                 os.unlink(name)
 
     def decompress(self, dat):
-        dat = encode_something_to_bytes(dat)
-        if dat.startswith(b'BZ'):
-            try:
-                return bz2.BZ2Decompressor().decompress(dat)
-            except IOError:
-                pass
-        return dat
+        return decompress(dat)
 
     def init_dq(self, directory, size):
         self.directory = directory
@@ -277,3 +365,394 @@ class DiskQueue(OKTypesMixin):
 
     def __len__(self):
         return self.msz
+
+
+class SegmentDiskQueue(DiskQueue):
+    """ A DiskQueue stored in append-only segment files rather than one file
+        (and a .meta file) per item.
+
+        The queue directory holds:
+
+          * numbered segment files (e.g. 000000000003.seg); each is a series of
+            records: a fixed header (magic, flags, meta length, data length,
+            crc32) followed by the json meta data and the (compressed) item
+          * cursor: json {segment, offset} of the next record to read
+          * index: json {segment: [count, size]} for sealed segments, so
+            opening a big queue only has to scan the head and tail segments
+
+        put() appends to the tail segment (rolling to a new segment after
+        segment_size bytes), get()/pop() read at the cursor and advance it;
+        fully consumed segments are unlinked. On open, a partially written
+        record at the end of the tail segment (ie, we crashed mid-put) is
+        truncated away.
+
+        Instances share their state per directory (see make_disk_queue), so
+        every HEC pointed at the same queue sees the same cursor.
+    """
+    header = struct.Struct('>2sBIII')
+    magic = b'HQ'
+    segment_size = SPLUNK_MAX_MSG * 10 # 1MB
+
+    def __init__(self, directory, size=DEFAULT_DISK_SIZE, ok_types=OK_TYPES, fresh=False, compression=0,
+                 segment_size=None):
+        self.init_types(ok_types)
+        self.init_dq(directory, size)
+        self.compression = compression
+        self.codec, self.level = parse_compression(compression)
+        if segment_size:
+            self.segment_size = segment_size
+        self.lock = threading.RLock()
+        log.debug('SegmentDiskQueue.__init__(%s, compression=%s)', directory, compression)
+        if fresh:
+            self.clear()
+        else:
+            self._load()
+        self.double_check_cnsz = bool(os.environ.get('DOUBLE_CHECK_CNSZ'))
+
+    def _seg_path(self, seg):
+        return os.path.join(self.directory, '{0:012d}.seg'.format(seg))
+
+    def _read_json(self, name, default):
+        try:
+            with open(os.path.join(self.directory, name), 'r') as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return default
+
+    def _write_json(self, name, dat):
+        fname = os.path.join(self.directory, name)
+        with open(fname + '.tmp', 'w') as fh:
+            json.dump(dat, fh)
+        os.replace(fname + '.tmp', fname)
+
+    def _write_cursor(self):
+        self._write_json('cursor', {'segment': self.head_seg, 'offset': self.head_off})
+
+    def _write_index(self):
+        self._write_json('index', {str(k): v for k, v in self.index.items()})
+
+    def _list_segments(self):
+        ret = list()
+        for fname in os.listdir(self.directory):
+            if fname.endswith('.seg'):
+                try:
+                    ret.append(int(fname[:-4]))
+                except ValueError:
+                    pass
+        return sorted(ret)
+
+    def _iter_records(self, seg, offset=0, end=None, with_body=True):
+        """ generate (offset, next_offset, flags, meta_bytes, data_bytes) for the
+            records of a segment, stopping at the first short or corrupt record
+        """
+        with open(self._seg_path(seg), 'rb') as fh:
+            fh.seek(offset)
+            while end is None or offset < end:
+                hdr = fh.read(self.header.size)
+                if len(hdr) < self.header.size:
+                    return
+                magic, flags, mlen, dlen, crc = self.header.unpack(hdr)
+                if magic != self.magic:
+                    return
+                body = fh.read(mlen + dlen)
+                if len(body) < mlen + dlen or zlib.crc32(body) != crc:
+                    return
+                next_offset = offset + self.header.size + mlen + dlen
+                if with_body:
+                    yield offset, next_offset, flags, body[:mlen], body[mlen:]
+                else:
+                    yield offset, next_offset, flags, None, dlen
+                offset = next_offset
+
+    def _scan(self, seg, offset=0, truncate=False):
+        """ count the records (and their data size) in a segment from offset;
+            returns count, size, end-of-valid-data
+        """
+        cn = sz = 0
+        end = offset
+        for _, end, _, _, dlen in self._iter_records(seg, offset, with_body=False):
+            cn += 1
+            sz += dlen
+        if truncate and os.path.getsize(self._seg_path(seg)) > end:
+            log.error('truncating partial record(s) from %s at %d', self._seg_path(seg), end)
+            with open(self._seg_path(seg), 'r+b') as fh:
+                fh.truncate(end)
+        return cn, sz, end
+
+    def _load(self):
+        """ (re)build the in-memory state from the cursor, index and segments """
+        with self.lock:
+            self._mkdir()
+            cursor = self._read_json('cursor', {})
+            index = self._read_json('index', {})
+            segs = self._list_segments()
+            self.head_seg = int(cursor.get('segment', segs[0] if segs else 0))
+            self.head_off = int(cursor.get('offset', 0))
+            for seg in [x for x in segs if x < self.head_seg]:
+                # consumed, but we didn't get to unlink it
+                os.unlink(self._seg_path(seg))
+            segs = [x for x in segs if x >= self.head_seg]
+            if not segs or segs[0] != self.head_seg:
+                self.head_seg = segs[0] if segs else self.head_seg
+                self.head_off = 0
+            self.tail_seg = segs[-1] if segs else self.head_seg
+            self.index = dict()
+            self.unread = dict()
+            for seg in segs:
+                full = index.get(str(seg))
+                if seg == self.tail_seg:
+                    cn, sz, self.tail_end = self._scan(seg, truncate=True)
+                    self.tail_full = [cn, sz]
+                    full = None
+                elif not full:
+                    full = list(self._scan(seg)[:2])
+                if full:
+                    self.index[seg] = full
+                if seg == self.head_seg and self.head_off:
+                    self.unread[seg] = list(self._scan(seg, self.head_off)[:2])
+                else:
+                    self.unread[seg] = list(full or self.tail_full)
+            if not segs:
+                self.tail_end = 0
+                self.tail_full = [0, 0]
+            self.cn = sum(x[0] for x in self.unread.values())
+            self.sz = sum(x[1] for x in self.unread.values())
+            self._write_index()
+            log.debug('disk cache sizes: cn=%d sz=%d', self.cn, self.sz)
+
+    def clear(self):
+        """ clear the queue """
+        with self.lock:
+            super(SegmentDiskQueue, self).clear()
+            self._load()
+
+    def _roll(self):
+        """ seal the tail segment and start a new one """
+        self.index[self.tail_seg] = list(self.tail_full)
+        self.tail_seg += 1
+        self.tail_end = 0
+        self.tail_full = [0, 0]
+        self.unread[self.tail_seg] = [0, 0]
+        self._write_index()
+
+    def _reset(self):
+        """ the queue is empty; unlink everything and start a fresh segment """
+        for seg in self.unread:
+            if os.path.isfile(self._seg_path(seg)):
+                os.unlink(self._seg_path(seg))
+        self.head_seg = self.tail_seg = self.tail_seg + 1
+        self.head_off = self.tail_end = 0
+        self.tail_full = [0, 0]
+        self.index = dict()
+        self.unread = {self.tail_seg: [0, 0]}
+        self.cn = self.sz = 0
+        self._write_cursor()
+        self._write_index()
+
+    def put(self, item, **meta):
+        """ Put an item in the queue at the end (FIFO order)
+            put() also takes an arbitrary number of meta data items (kwargs); which,
+            if given, are stored alongside the item in its record.
+        """
+        self.check_type(item)
+        bstr = self.compress(item)
+        if not self.accept(bstr):
+            raise QueueCapacityError('refusing to accept item due to size')
+        mstr = encode_something_to_bytes(json.dumps(meta)) if meta else b''
+        body = mstr + bstr
+        rec = self.header.pack(self.magic, 0, len(mstr), len(bstr), zlib.crc32(body)) + body
+        with self.lock:
+            if self.tail_end and self.tail_end + len(rec) > self.segment_size:
+                self._roll()
+            self._mkdir()
+            with open(self._seg_path(self.tail_seg), 'ab') as fh:
+                log.debug('writing item to disk cache')
+                fh.write(rec)
+            self.tail_end += len(rec)
+            self.tail_full[0] += 1
+            self.tail_full[1] += len(bstr)
+            unread = self.unread.setdefault(self.tail_seg, [0, 0])
+            unread[0] += 1
+            unread[1] += len(bstr)
+            self.cn += 1
+            self.sz += len(bstr)
+        if self.double_check_cnsz:
+            self._count(double_check_only=True, tag='put')
+
+    def _head_end(self):
+        if self.head_seg == self.tail_seg:
+            return self.tail_end
+        return None
+
+    def _next_record(self):
+        """ return the record at the cursor (skipping exhausted or damaged segments) """
+        while self.cn > 0:
+            for rec in self._iter_records(self.head_seg, self.head_off, end=self._head_end()):
+                return rec
+            if self.head_seg == self.tail_seg:
+                break
+            if self.unread.get(self.head_seg, [0])[0]:
+                log.error('dropping unreadable remainder of %s', self._seg_path(self.head_seg))
+            self._drop_head()
+        return None
+
+    def _drop_head(self):
+        cn, sz = self.unread.pop(self.head_seg, [0, 0])
+        self.cn -= cn
+        self.sz -= sz
+        self.index.pop(self.head_seg, None)
+        if os.path.isfile(self._seg_path(self.head_seg)):
+            os.unlink(self._seg_path(self.head_seg))
+        self.head_seg += 1
+        self.head_off = 0
+        self._write_cursor()
+        self._write_index()
+
+    def _advance(self, rec):
+        _, next_offset, _, _, dat = rec
+        dlen = dat if isinstance(dat, int) else len(dat)
+        unread = self.unread.setdefault(self.head_seg, [0, 0])
+        unread[0] -= 1
+        unread[1] -= dlen
+        self.cn -= 1
+        self.sz -= dlen
+        self.head_off = next_offset
+        if self.cn < 1:
+            self._reset()
+        elif self.head_seg != self.tail_seg and unread[0] < 1:
+            self._drop_head()
+        else:
+            self._write_cursor()
+
+    @staticmethod
+    def _meta(mstr):
+        if not mstr:
+            return dict()
+        try:
+            return json.loads(decode_something_to_string(mstr))
+        except ValueError:
+            return dict()
+
+    def peek(self):
+        """ look at the next item in the queue, but don't actually remove it from the queue
+            returns: data_octets, meta_data_dict
+        """
+        with self.lock:
+            rec = self._next_record()
+            if rec is not None:
+                return decode_something_to_string(self.decompress(rec[4])), self._meta(rec[3])
+
+    def iter_peek(self):
+        ''' iterate and return all items in the disk queue (without removing any) '''
+        with self.lock:
+            segs = sorted(self.unread)
+            for seg in segs:
+                offset = self.head_off if seg == self.head_seg else 0
+                end = self.tail_end if seg == self.tail_seg else None
+                for rec in self._iter_records(seg, offset, end=end):
+                    yield self.decompress(rec[4]), self._meta(rec[3])
+
+    def get(self):
+        """ get the next item from the queue
+            returns: data_octets, meta_data_dict
+        """
+        with self.lock:
+            rec = self._next_record()
+            if rec is None:
+                return None
+            self._advance(rec)
+        if self.double_check_cnsz:
+            self._count(double_check_only=True, tag='get')
+        return decode_something_to_string(self.decompress(rec[4])), self._meta(rec[3])
+
+    def getz(self, sz=SPLUNK_MAX_MSG):
+        """ fetch items from the queue and concatenate them together using the
+            spacer ' ' until the size reaches (but does not exceed) the size
+            kwargs (sz).
+
+            kwargs:
+                sz : the maxsize of the queue fetch (default: SPLUNK_MAX_MSG=100k)
+
+            returns: data_octets, meta_data_dict
+        """
+        ret = b''
+        meta_data = dict()
+        with self.lock:
+            while True:
+                rec = self._next_record()
+                if rec is None:
+                    break
+                partial_data = self.decompress(rec[4])
+                if ret:
+                    if len(ret) + len(self.sep) + len(partial_data) > sz:
+                        break
+                    ret += self.sep
+                ret += partial_data
+                _md = self._meta(rec[3])
+                for k in _md:
+                    if k not in meta_data:
+                        meta_data[k] = list()
+                    meta_data[k].append( _md[k] )
+                self._advance(rec)
+        for k in meta_data:
+            # see DiskQueue.getz()
+            meta_data[k] = max(meta_data[k])
+        return decode_something_to_string(ret), meta_data
+
+    def pop(self):
+        """ remove the next item from the queue (do not return it); useful with .peek() """
+        with self.lock:
+            rec = self._next_record()
+            if rec is not None:
+                self._advance(rec)
+        if self.double_check_cnsz:
+            self._count(double_check_only=True, tag='pop')
+
+    @property
+    def files(self):
+        """ generate all segment filenames in the diskqueue (returns iterable) """
+        for seg in self._list_segments():
+            yield self._seg_path(seg)
+
+    def _count(self, double_check_only=False, tag='unknown'):
+        cn = 0
+        sz = 0
+        with self.lock:
+            for seg in sorted(self.unread):
+                offset = self.head_off if seg == self.head_seg else 0
+                if os.path.isfile(self._seg_path(seg)):
+                    s_cn, s_sz, _ = self._scan(seg, offset)
+                    cn += s_cn
+                    sz += s_sz
+            if double_check_only:
+                log.debug('disk cache sizes: [double check %s] presumed<cn=%d sz=%d> vs actual<cn=%d sz=%d>',
+                    tag, self.cn, self.sz, cn, sz)
+            else:
+                self.sz = sz
+                self.cn = cn
+                log.debug('disk cache sizes: cn=%d sz=%d', self.cn, self.sz)
+
+
+DISK_QUEUE_BACKENDS = {
+    'files': DiskQueue,
+    'segment': SegmentDiskQueue,
+}
+
+_SHARED_QUEUES = dict()
+
+def make_disk_queue(directory, backend='files', **kw):
+    """ build the DiskQueue for the given backend name ('files' or 'segment')
+
+        Segment queues keep the cursor in memory, so there's exactly one
+        instance per directory in the process; the 'files' backend re-reads
+        the directory on every operation and needs no such care.
+    """
+    if backend not in DISK_QUEUE_BACKENDS:
+        log.error('unknown disk_queue_backend "%s", using "files"', backend)
+        backend = 'files'
+    if backend == 'files':
+        return DiskQueue(directory, **kw)
+    directory = os.path.abspath(directory)
+    if directory not in _SHARED_QUEUES:
+        _SHARED_QUEUES[directory] = DISK_QUEUE_BACKENDS[backend](directory, **kw)
+    return _SHARED_QUEUES[directory]
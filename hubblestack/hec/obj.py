@@ -16,7 +16,7 @@ log = logging.getLogger(__name__)
 import hubblestack.status
 hubble_status = hubblestack.status.HubbleStatus(__name__)
 
-from . dq import DiskQueue, NoQueue, QueueCapacityError
+from . dq import DiskQueue, NoQueue, QueueCapacityError, make_disk_queue
 from inspect import getfullargspec
 from hubblestack.utils.stdrec import update_payload
 from hubblestack.utils.encoding import encode_something_to_bytes
@@ -180,7 +180,8 @@ class HEC(object):
                  max_bytes=_max_content_bytes, proxy=None, timeout=9.05,
                  disk_queue=False, disk_queue_size=max_diskqueue_size,
                  disk_queue_compression=5, max_queue_cycles=80, max_bad_request_cycles=40,
-                 outage_recheck_time=300, num_fails_indicate_outage=10):
+                 outage_recheck_time=300, num_fails_indicate_outage=10,
+                 disk_queue_backend='files'):
 
 
         self.max_queue_cycles = max_queue_cycles
@@ -286,10 +287,37 @@ class HEC(object):
                 md5.update(encode_something_to_bytes(u))
             actual_disk_queue = os.path.join(disk_queue, md5.hexdigest())
             log.debug("disk_queue for %s: %s", uril, actual_disk_queue)
-            self.queue = DiskQueue(actual_disk_queue, size=disk_queue_size, compression=disk_queue_compression)
+            if disk_queue_backend == 'segment':
+                # segment queues get their own directory so switching
+                # backends back and forth never mixes the two formats
+                self.queue = make_disk_queue(actual_disk_queue + '.seg', backend=disk_queue_backend,
+                    size=disk_queue_size, compression=disk_queue_compression)
+                if os.path.isdir(actual_disk_queue):
+                    self._migrate_queue(DiskQueue(actual_disk_queue, size=disk_queue_size,
+                        compression=disk_queue_compression))
+            else:
+                self.queue = make_disk_queue(actual_disk_queue, backend=disk_queue_backend,
+                    size=disk_queue_size, compression=disk_queue_compression)
         else:
             self.queue = NoQueue()
 
+    def _migrate_queue(self, old_queue):
+        """ move anything left in old_queue (e.g. a 'files' backend queue from
+            before disk_queue_backend was changed) into self.queue """
+        if old_queue.cn:
+            log.error('migrating %d queued item(s) from %s to %s',
+                old_queue.cn, old_queue.directory, self.queue.directory)
+        while old_queue.cn > 0:
+            item = old_queue.get()
+            if item is None:
+                break
+            dat, meta_data = item
+            try:
+                self.queue.put(dat, **meta_data)
+            except QueueCapacityError:
+                log.error("disk queue is full, dropping payload")
+        old_queue.clear()
+
     def _payload_msg(self, message, *a):
         event = dict(loggername='hubblestack.hec.obj', message=message % a)
         payload = dict(index=self.default_index,
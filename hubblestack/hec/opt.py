@@ -17,8 +17,9 @@
 #
 # we just look in [config.get]('hubblestack:returner:splunk')
 #
-# Additionally, the defaults for disk_queue, disk_queue_size and
-# disk_queue_compression can be set in the top level configuration -- although,
+# Additionally, the defaults for disk_queue, disk_queue_size,
+# disk_queue_compression and disk_queue_backend ('files' or 'segment', see
+# hubblestack.hec.dq) can be set in the top level configuration -- although,
 # are still overridden by per-hec configs.
 
 
@@ -74,6 +75,7 @@ def _get_splunk_options(space, modality, **kw):
         'disk_queue': confg('disk_queue', False),
         'disk_queue_size': confg('disk_queue_size', 100 * (1024 ** 2)),
         'disk_queue_compression': confg('disk_queue_compression', 5),
+        'disk_queue_backend': confg('disk_queue_backend', 'files'),
     }
 
     nicknames = kw.pop('_nick', {'sourcetype_log': 'sourcetype'})
@@ -171,6 +173,7 @@ def make_hec_args(opts):
         'disk_queue': opts['disk_queue'],
         'disk_queue_size': opts['disk_queue_size'],
         'disk_queue_compression': opts['disk_queue_compression'],
+        'disk_queue_backend': opts.get('disk_queue_backend', 'files'),
     }
 
     return (a, kw)
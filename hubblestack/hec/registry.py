@@ -0,0 +1,86 @@
+# -*- encoding: utf-8 -*-
+"""
+A process-wide registry of HEC objects
+
+The splunk returners used to build a brand new HEC for every returner call,
+which meant a new urllib3 PoolManager (new TLS handshakes), a new DiskQueue
+and a re-hashed server list each time. Returners now ask the registry instead:
+
+    args, kwargs = make_hec_args(opts)
+    hec = get_hec(*args, **kwargs)
+
+Collectors are keyed by the normalized make_hec_args() output, so a change in
+get_splunk_options() (a new token, indexer, proxy, disk_queue, ...) simply
+produces a new key and a new collector. hubblestack.daemon.refresh_grains
+calls refresh(); collectors that aren't asked for again before the following
+refresh are dropped (and their connection pools closed) at that point.
+
+NOTE: HEC objects aren't thread safe. Anything sending from another thread
+(e.g. hubblestack.log.splunk) should keep its own HEC rather than share these.
+"""
+
+import logging
+
+from . obj import HEC
+
+log = logging.getLogger(__name__)
+
+_REGISTRY = dict()
+_PREVIOUS = dict()
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(x) for x in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def hec_key(args, kwargs):
+    """ normalize HEC() arguments into a hashable registry key """
+    return (_freeze(args), _freeze(kwargs))
+
+
+def get_hec(*args, **kwargs):
+    """
+    Return the HEC for the given (make_hec_args style) arguments, creating it
+    on first use
+    """
+    key = hec_key(args, kwargs)
+    hec = _REGISTRY.get(key)
+    if hec is None:
+        hec = _PREVIOUS.pop(key, None)
+        if hec is None:
+            log.debug('creating new HEC for %s', args[2:])
+            hec = HEC(*args, **kwargs)
+        _REGISTRY[key] = hec
+    return hec
+
+
+def _close(hec):
+    try:
+        hec.flushBatch()
+        hec.pool_manager.clear()
+    except Exception: # pylint: disable=broad-except
+        log.debug('error closing unused HEC', exc_info=True)
+
+
+def refresh():
+    """
+    Note that grains/config were refreshed. Collectors still in use are kept,
+    anything unused since the previous refresh is closed and forgotten.
+    """
+    for hec in _PREVIOUS.values():
+        _close(hec)
+    _PREVIOUS.clear()
+    _PREVIOUS.update(_REGISTRY)
+    _REGISTRY.clear()
+
+
+def clear():
+    """ close and forget every registered collector """
+    for hec in list(_REGISTRY.values()) + list(_PREVIOUS.values()):
+        _close(hec)
+    _REGISTRY.clear()
+    _PREVIOUS.clear()
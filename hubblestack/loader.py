@@ -5,11 +5,12 @@ directories for python loadable code and organizes the code into the
 plugin interfaces used by Salt.
 '''
 
+import collections
+import concurrent.futures
 import os
 import re
 import sys
 import time
-import yaml
 import logging
 import inspect
 import tempfile
@@ -21,6 +22,8 @@ import types
 from zipimport import zipimporter
 
 import hubblestack.config
+import hubblestack.payload
+import hubblestack.status
 import hubblestack.syspaths
 import hubblestack.utils.args
 import hubblestack.utils.context
@@ -30,9 +33,11 @@ import hubblestack.utils.files
 import hubblestack.utils.lazy
 import hubblestack.utils.odict
 import hubblestack.utils.platform
+import hubblestack.utils.profile_store
 import hubblestack.utils.versions
 
 from hubblestack.exceptions import LoaderError
+from hubblestack.version import __version__
 from hubblestack.template import check_render_pipe_str
 from hubblestack.utils.decorators import Depends
 
@@ -53,6 +58,28 @@ log = logging.getLogger(__name__)
 HUBBLE_BASE_PATH = os.path.abspath(hubblestack.syspaths.INSTALL_DIR)
 LOADED_BASE_NAME = 'hubble.loaded'
 
+hubble_status = hubblestack.status.HubbleStatus(__name__)
+# grain function name -> (time computed, its last (dict) return value)
+_LAST_GRAINS = dict()
+# grain function name -> the future of a run that timed out and hasn't returned
+_STUCK_GRAINS = dict()
+# seconds a grain function's value is reused before it's computed again.
+# Functions (or grains modules) not listed are computed on every refresh;
+# opts['grains_ttl'] adds to and overrides these.
+GRAIN_TTLS = {
+    'core.os_data': 86400,  # os, osfinger, cpu_model, mem_total, ...
+    'core.get_machine_id': 86400,
+    'core.pythonversion': 86400,
+    'core.pythonexecutable': 86400,
+    'hubbleversion': 86400,
+    'systemuuid': 86400,
+    'cloud_details': 3600,
+}
+# grains that modules, utils and returners look at in __virtual__; the daemon
+# only rebuilds those loaders on a grains refresh when one of these changed.
+VIRTUAL_GRAINS = ('kernel', 'os', 'os_family', 'osfullname', 'osrelease', 'osrelease_info',
+                  'osmajorrelease', 'osfinger', 'cpuarch', 'virtual', 'virtual_subtype', 'init')
+
 MODULE_KIND_SOURCE = 1
 MODULE_KIND_COMPILED = 2
 MODULE_KIND_EXTENSION = 3
@@ -290,6 +317,193 @@ def grain_funcs(opts, proxy=None):
     )
 
 
+def _timed_grain(key, func, kwargs, started=None):
+    '''
+    Run a grain function, recording its duration in hubblestack.status and
+    remembering its result for _run_grain_pool
+    '''
+    hs_key = 'grain.' + key
+    hubble_status.add_resource(hs_key)
+    if started is not None:
+        started[key] = time.time()
+    stat_handle = hubble_status.mark(hs_key)
+    ret = func(**kwargs)
+    stat_handle.fin()
+    if isinstance(ret, dict):
+        _LAST_GRAINS[key] = (time.time(), ret)
+    return ret
+
+
+def _grain_worker(jobs):
+    '''
+    Run the queued (future, args) grain jobs until there are none left
+    '''
+    while True:
+        try:
+            fut, args = jobs.popleft()
+        except IndexError:
+            return
+        if not fut.set_running_or_notify_cancel():
+            continue
+        try:
+            fut.set_result(_timed_grain(*args))
+        except Exception as exc:
+            fut.set_exception(exc)
+
+
+def _grain_ttl(opts, key):
+    ''' the number of seconds the value of grain function key stays fresh '''
+    ttls = dict(GRAIN_TTLS)
+    ttls.update(opts.get('grains_ttl') or {})
+    for name in (key, key.split('.')[0]):
+        if name in ttls:
+            return float(ttls[name] or 0)
+    return 0
+
+
+def _fresh_grains(opts, keys):
+    ''' return the cached values of the grain functions in keys that haven't expired '''
+    now = time.time()
+    ret = dict()
+    for key in keys:
+        if key not in _LAST_GRAINS or key in _STUCK_GRAINS:
+            continue
+        computed, value = _LAST_GRAINS[key]
+        if computed <= now < computed + _grain_ttl(opts, key):
+            ret[key] = value
+    return ret
+
+
+def _boot_id():
+    '''
+    An id of the current boot of the host, None when it can't be told
+    '''
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as fp_:
+            return fp_.read().strip() or None
+    except (IOError, OSError):
+        pass
+    try:
+        import psutil
+        return str(int(psutil.boot_time()))
+    except Exception:
+        return None
+
+
+def _load_grains_cache(opts, cfn):
+    '''
+    Seed the grain function cache from the grains.cache.p written by an
+    earlier run of the same hubble version during the same boot. The core
+    grains (os, osrelease, cpu_model, ...) are always collected again: an
+    upgrade of the OS comes with a reboot, but not always with a new hubble.
+    '''
+    if not os.path.isfile(cfn):
+        return
+    try:
+        with hubblestack.utils.files.fopen(cfn, 'rb') as fp_:
+            data = hubblestack.payload.Serial(opts).load(fp_)
+    except Exception as e:
+        log.debug('Unable to read grains cache file %s: %s', cfn, e)
+        return
+    if not isinstance(data, dict) or data.get('hubble_version') != __version__:
+        return
+    boot_id = _boot_id()
+    if boot_id is None or data.get('boot_id') != boot_id:
+        log.debug('Ignoring grains cache file %s written before the last boot', cfn)
+        return
+    for key, (computed, value) in data.get('funcs', {}).items():
+        if key.startswith('core.'):
+            continue
+        if key not in _LAST_GRAINS and isinstance(value, dict):
+            _LAST_GRAINS[key] = (computed, value)
+
+
+def _run_grain_pool(opts, funcs, keys, kwargs):
+    '''
+    Run the grain functions named by keys concurrently and return their
+    results keyed by name (grains that failed are left out).
+
+    ``grains_max_workers`` (default 4) bounds the pool; 0 or 1 runs the
+    grains serially, without timeouts. A grain still running after
+    ``grains_timeout`` seconds (default 60) is abandoned and its last known
+    value is used instead; it isn't started again until that run returns.
+
+    The workers are daemon threads rather than a ThreadPoolExecutor, whose
+    threads are joined when the interpreter exits: a hung grain mustn't hold
+    up the shutdown of hubble.
+    '''
+    workers = int(opts.get('grains_max_workers', 4))
+    timeout = float(opts.get('grains_timeout', 60))
+    ret = dict()
+    if workers <= 1:
+        for key in keys:
+            try:
+                log.trace('Loading %s grain', key)
+                ret[key] = _timed_grain(key, funcs[key], kwargs[key])
+            except Exception:
+                log.critical('Failed to load grains defined in grain file %s in '
+                             'function %s, error:\n', key, funcs[key], exc_info=True)
+        return ret
+
+    jobs = collections.deque()
+    futures = dict()
+    started = dict()
+    for key in keys:
+        if key in _STUCK_GRAINS:
+            if not _STUCK_GRAINS[key].done():
+                log.warning('grain function %s is still running from an earlier refresh, '
+                            'using its last value', key)
+                if key in _LAST_GRAINS:
+                    ret[key] = _LAST_GRAINS[key][1]
+                continue
+            del _STUCK_GRAINS[key]
+        log.trace('Loading %s grain', key)
+        fut = concurrent.futures.Future()
+        jobs.append((fut, (key, funcs[key], kwargs[key], started)))
+        futures[fut] = key
+    # nobody waits for abandoned grains; the threads finish (or not) on their own
+    for _ in range(min(workers, len(jobs))):
+        threading.Thread(target=_grain_worker, args=(jobs,), name='grain-worker',
+                         daemon=True).start()
+
+    pending = set(futures)
+    stuck = 0
+    while pending:
+        now = time.time()
+        deadline = min(started.get(futures[fut], now) + timeout for fut in pending)
+        done, pending = concurrent.futures.wait(pending, timeout=max(deadline - now, 0),
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        for fut in done:
+            key = futures[fut]
+            try:
+                ret[key] = fut.result()
+            except Exception:
+                log.critical('Failed to load grains defined in grain file %s in '
+                             'function %s, error:\n', key, funcs[key],
+                             exc_info=fut.exception())
+        now = time.time()
+        for fut in list(pending):
+            key = futures[fut]
+            if key in started and now - started[key] >= timeout:
+                log.error('grain function %s timed out after %ds, using its last value',
+                          key, timeout)
+                pending.discard(fut)
+                _STUCK_GRAINS[key] = fut
+                stuck += 1
+                if key in _LAST_GRAINS:
+                    ret[key] = _LAST_GRAINS[key][1]
+        if stuck >= workers:
+            # every worker is tied up by a hung grain, nothing queued will start
+            for fut in list(pending):
+                if fut.cancel():
+                    key = futures[fut]
+                    log.error('grain function %s was not run, all grain workers are hung', key)
+                    pending.discard(fut)
+                    if key in _LAST_GRAINS:
+                        ret[key] = _LAST_GRAINS[key][1]
+    return ret
+
+
 def grains(opts, force_refresh=False, proxy=None):
     '''
     Return the functions for the dynamic grains and the values for the static
@@ -347,12 +561,19 @@ def grains(opts, force_refresh=False, proxy=None):
     funcs = grain_funcs(opts, proxy=None)
     if force_refresh:  # if we refresh, lets reload grain modules
         funcs.clear()
+    if opts.get('grains_cache', False) and not _LAST_GRAINS:
+        _load_grains_cache(opts, cfn)
+    # grain functions whose earlier values haven't expired (see GRAIN_TTLS)
+    cached = dict() if force_refresh else _fresh_grains(opts, list(funcs))
     # Run core grains
     for key in funcs:
         if not key.startswith('core.'):
             continue
-        log.trace('Loading %s grain', key)
-        ret = funcs[key]()
+        if key in cached:
+            ret = cached[key]
+        else:
+            log.trace('Loading %s grain', key)
+            ret = _timed_grain(key, funcs[key], dict())
         if not isinstance(ret, dict):
             continue
         if grains_deep_merge:
@@ -360,31 +581,51 @@ def grains(opts, force_refresh=False, proxy=None):
         else:
             grains_data.update(ret)
 
-    # Run the rest of the grains
-    for key in funcs:
-        if key.startswith('core.') or key == '_errors':
+    # Run the rest of the grains. Grains that look at the grains collected so
+    # far run in order, right here; the others run in a pool (see
+    # _run_grain_pool) and their results are merged in the same order.
+    keys = [key for key in funcs if not key.startswith('core.') and key != '_errors']
+    kwargs = dict()
+    for key in keys:
+        if key in cached:
             continue
         try:
-            # Grains are loaded too early to take advantage of the injected
-            # __proxy__ variable.  Pass an instance of that LazyLoader
-            # here instead to grains functions if the grains functions take
-            # one parameter.  Then the grains can have access to the
-            # proxymodule for retrieving information from the connected
-            # device.
-            log.trace('Loading %s grain', key)
             parameters = hubblestack.utils.args.get_function_argspec(funcs[key]).args
-            kwargs = {}
-            if 'proxy' in parameters:
-                kwargs['proxy'] = proxy
-            if 'grains' in parameters:
-                kwargs['grains'] = grains_data
-            ret = funcs[key](**kwargs)
         except Exception:
-            log.critical(
-                'Failed to load grains defined in grain file %s in '
-                'function %s, error:\n', key, funcs[key],
-                exc_info=True
-            )
+            log.critical('Failed to inspect grain function %s', key, exc_info=True)
+            continue
+        # Grains are loaded too early to take advantage of the injected
+        # __proxy__ variable.  Pass an instance of that LazyLoader
+        # here instead to grains functions if the grains functions take
+        # one parameter.  Then the grains can have access to the
+        # proxymodule for retrieving information from the connected
+        # device.
+        kwargs[key] = {'proxy': proxy} if 'proxy' in parameters else dict()
+        if 'grains' in parameters:
+            kwargs[key]['grains'] = None
+    pooled = _run_grain_pool(opts, funcs,
+                             [key for key in keys if key in kwargs and 'grains' not in kwargs[key]],
+                             kwargs)
+
+    for key in keys:
+        if key in cached:
+            ret = cached[key]
+        elif key in pooled:
+            ret = pooled[key]
+        elif key in kwargs:
+            if 'grains' in kwargs[key]:
+                kwargs[key]['grains'] = grains_data
+            try:
+                log.trace('Loading %s grain', key)
+                ret = _timed_grain(key, funcs[key], kwargs[key])
+            except Exception:
+                log.critical(
+                    'Failed to load grains defined in grain file %s in '
+                    'function %s, error:\n', key, funcs[key],
+                    exc_info=True
+                )
+                continue
+        else:
             continue
         if not isinstance(ret, dict):
             continue
@@ -394,7 +635,7 @@ def grains(opts, force_refresh=False, proxy=None):
             grains_data.update(ret)
 
     grains_data.update(opts['grains'])
-    # Write cache if enabled
+    # Write the grain function cache if enabled
     if opts.get('grains_cache', False):
         with hubblestack.utils.files.set_umask(0o077):
             try:
@@ -406,7 +647,9 @@ def grains(opts, force_refresh=False, proxy=None):
                 with hubblestack.utils.files.fopen(cfn, 'w+b') as fp_:
                     try:
                         serial = hubblestack.payload.Serial(opts)
-                        serial.dump(grains_data, fp_)
+                        serial.dump({'hubble_version': __version__,
+                                     'boot_id': _boot_id(),
+                                     'funcs': dict(_LAST_GRAINS)}, fp_)
                     except TypeError as e:
                         log.error('Failed to serialize grains cache: %s', e)
                         raise  # re-throw for cleanup
@@ -807,6 +1050,17 @@ class LazyLoader(hubblestack.utils.lazy.LazyDict):
                 self._refresh_file_mapping()
             self.initial_load = False
 
+    def refresh_opts(self, opts):
+        '''
+        Hand new opts (and opts['grains']) to the loaded modules, for a loader
+        that is kept rather than rebuilt after a grains refresh
+        '''
+        self.context_dict['grains'] = opts.get('grains', {})
+        self.context_dict['pillar'] = opts.get('pillar', {})
+        new_opts = self.__prep_mod_opts(opts)
+        if new_opts is not self.opts:
+            self.opts.update(new_opts)
+
     def __prep_mod_opts(self, opts):
         '''
         Strip out of the opts any logger instance
@@ -1412,7 +1666,7 @@ def _nova_xlate_funcnames(name, fpath, suffix, tgt_mod, funcname, full_funcname,
         new_funcname = 'py'
     return new_funcname, '.'.join([name, new_funcname])
 
-def nova(hubble_dir, opts, modules, context=None):
+def nova(hubble_dir, opts, modules, context=None, data=None):
     '''
     Return a nova (!lazy) loader.
 
@@ -1443,6 +1697,10 @@ def nova(hubble_dir, opts, modules, context=None):
     before anyway, which seems to be the reason for the special sync() section
     of the hubble.audit.
 
+    data, if given, is the (__data__, __missing_data__) pair already loaded
+    from hubble_dir (see hubblestack.utils.profile_store); otherwise the yaml
+    is parsed here.
+
     '''
 
     loader = LazyLoader(
@@ -1455,19 +1713,7 @@ def nova(hubble_dir, opts, modules, context=None):
         pack={ '__context__': context, '__mods__': modules }
     )
 
-    loader.__data__ = d = dict()
-    loader.__missing_data__ = md = dict()
-
-    for mod_dir in hubble_dir:
-        for path, _, filenames in os.walk(mod_dir):
-            for filename in filenames:
-                pathname = os.path.join(path, filename)
-                name = pathname[len(mod_dir):]
-                if filename.endswith('.yaml'):
-                    try:
-                        with open(pathname, 'r') as fh:
-                            d[name] = yaml.safe_load(fh)
-                    except Exception as exc:
-                        md[name] = str(exc)
-                        log.exception('Error loading yaml from %s', pathnmame)
+    if data is None:
+        data = hubblestack.utils.profile_store.ProfileStore().load_tree(hubble_dir)[:2]
+    loader.__data__, loader.__missing_data__ = data
     return loader
@@ -33,16 +33,44 @@ pillar values with complex values or they will be skipped:
             custom_fields:
               - site
               - product_group
+
+Records are not sent from the logging call itself. ``emit()`` formats the
+record and appends it to a bounded ring buffer; a background thread coalesces
+the buffered records into HEC batches (up to the collector's ``max_bytes``)
+and flushes them when a batch fills up or every ``splunklogging_flush_interval``
+seconds. When the buffer is full the oldest records are dropped. The buffer
+and flush interval are set in the top level of the config:
+
+.. code-block:: yaml
+
+    splunklogging_queue_size: 10000
+    splunklogging_flush_interval: 2
+
+Drops, backpressure (the buffer filling past its high-water mark) and flushes
+are counted in hubblestack.status under ``hubblestack.log.splunk``.
 """
+import collections
+import os
 import socket
+import threading
 
 # Imports for http event forwarder
 import copy
 import time
 import logging
 from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+import hubblestack.status
 import hubblestack.utils.stdrec
 
+hubble_status = hubblestack.status.HubbleStatus(__name__, 'dropped', 'backpressure', 'flush')
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_INTERVAL = 2
+# fraction of the ring buffer past which emit() wakes the sender early
+HIGH_WATER = 0.75
+# rough per-record payload overhead (host, index, sourcetype, std_info, ...)
+RECORD_OVERHEAD = 512
+
 
 class SplunkHandler(logging.Handler):
     """
@@ -55,6 +83,23 @@ class SplunkHandler(logging.Handler):
         self.opts_list = get_splunk_options()
         self.endpoint_list = []
 
+        try:
+            queue_size = int(__opts__.get('splunklogging_queue_size', DEFAULT_QUEUE_SIZE))
+            flush_interval = float(__opts__.get('splunklogging_flush_interval',
+                                                DEFAULT_FLUSH_INTERVAL))
+        except (TypeError, ValueError):
+            queue_size, flush_interval = DEFAULT_QUEUE_SIZE, DEFAULT_FLUSH_INTERVAL
+        self.queue_size = max(1, queue_size)
+        self.flush_interval = flush_interval
+        self.high_water = max(1, int(self.queue_size * HIGH_WATER))
+        self.queue = collections.deque(maxlen=self.queue_size)
+        self.queued_bytes = 0
+        self.wakeup = threading.Event()
+        self.send_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.sender = None
+        self.sender_pid = None
+
         for opts in self.opts_list:
             custom_fields = opts['custom_fields']
 
@@ -101,8 +146,8 @@ class SplunkHandler(logging.Handler):
 
     def emit(self, record):
         """
-        Emit a single record using the hec/event template/payload template
-        generated in __init__()
+        Queue a single record for the sender thread, which will send it using
+        the hec/event template/payload template generated in __init__()
         """
 
         # NOTE: poor man's filtering ... goal: prevent logging loops and
@@ -127,16 +172,97 @@ class SplunkHandler(logging.Handler):
                 return False
 
         log_entry = SplunkHandler.format_record(record)
-        for hec, event, payload in self.endpoint_list:
-            event = copy.deepcopy(event)
-            payload = copy.deepcopy(payload)
-            event.update(log_entry)
-            payload['event'] = event
-            # no_queue tells the hec never to queue the data to disk
-            hec.batchEvent(payload, eventtime=time.time(), no_queue=True)
-            hec.flushBatch()
+        self._start_sender()
+        if len(self.queue) >= self.queue_size:
+            # the deque drops the oldest record on append
+            hubble_status.mark('dropped')
+        self.queue.append((time.time(), log_entry))
+        self.queued_bytes += len(str(log_entry.get('message', ''))) + RECORD_OVERHEAD
+        if len(self.queue) >= self.high_water:
+            hubble_status.mark('backpressure')
+            self.wakeup.set()
+        elif self.queued_bytes >= self.max_bytes:
+            self.wakeup.set()
         return True
 
+    @property
+    def max_bytes(self):
+        """ the smallest batch size of all the configured collectors """
+        sizes = [hec.maxByteLength for hec, _, _ in self.endpoint_list]
+        return min(sizes) if sizes else 0
+
+    def _start_sender(self):
+        """
+        Start the background sender thread if it isn't running in this process
+        (threads don't survive a fork, so daemonizing needs a fresh one)
+        """
+        if self.sender is not None and self.sender_pid == os.getpid() and self.sender.is_alive():
+            return
+        if self.stopping.is_set():
+            return
+        self.sender_pid = os.getpid()
+        self.sender = threading.Thread(target=self._send_loop, name='hubble-splunk-log')
+        self.sender.daemon = True
+        self.sender.start()
+
+    def _send_loop(self):
+        """
+        Wait for emit() to signal a full batch (or for the flush interval to
+        pass) and send whatever is queued
+        """
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self._flush_queue()
+            except Exception:  # pylint: disable=broad-except
+                # the handler can't log about itself (see the filter in emit)
+                pass
+
+    def _flush_queue(self):
+        """
+        Drain the ring buffer into HEC batches; the collectors flush on their
+        own when a batch would exceed max_bytes, and we flush the remainder
+        """
+        with self.send_lock:
+            if not self.queue:
+                return
+            stat_handle = hubble_status.mark('flush')
+            self.queued_bytes = 0
+            while self.queue:
+                try:
+                    eventtime, log_entry = self.queue.popleft()
+                except IndexError:
+                    break
+                for hec, event, payload in self.endpoint_list:
+                    event = copy.deepcopy(event)
+                    payload = copy.deepcopy(payload)
+                    event.update(log_entry)
+                    payload['event'] = event
+                    # no_queue tells the hec never to queue the data to disk
+                    hec.batchEvent(payload, eventtime=eventtime, no_queue=True)
+            for hec, _, _ in self.endpoint_list:
+                hec.flushBatch()
+            stat_handle.fin()
+
+    def flush(self):
+        """
+        Send everything that's queued right now (from the calling thread).
+        logging.shutdown() calls this at exit.
+        """
+        self._flush_queue()
+
+    def close(self):
+        """
+        Stop the sender thread and send whatever is left in the buffer
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        if self.sender is not None and self.sender_pid == os.getpid():
+            self.sender.join(self.flush_interval + 1)
+        self.flush()
+        super(SplunkHandler, self).close()
+
     def update_event_std_info(self):
         """
         Update the `event` template in the `endpoint_list` object. This allows
@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 """
 This is the default compound matcher function.
+
+Compound targets are compiled once into a python code object whose leaves are
+lazily evaluated matcher calls (``_t0() and not _t1()``); the compiled form is
+cached per target so repeated checks against the same filter don't re-tokenize
+the expression. When the daemon publishes a ``grains_generation`` in opts
+(see ``hubblestack.daemon.refresh_grains``), results are also memoized per
+(target, minion id, grains generation).
 """
 
 import logging
@@ -18,53 +25,99 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
-
-def match(tgt, opts=None):
+# target key -> CompiledTarget (or None for invalid targets)
+_COMPILED = {}
+# (target key, minion id, grains generation) -> bool
+_RESULTS = {}
+_RESULTS_GENERATION = [None]
+# extension_modules -> matchers LazyLoader
+_MATCHERS = {}
+
+REF = {
+    "G": "grain",
+    "P": "grain_pcre",
+    "I": "pillar",
+    "J": "pillar_pcre",
+    "L": "list",
+    "N": None,  # Nodegroups should already be expanded
+    "S": "ipcidr",
+    "E": "pcre",
+}
+if HAS_RANGE:
+    REF["R"] = "range"
+
+OPERS = ("and", "or", "not", "(", ")")
+
+
+class CompiledTarget(object):
     """
-    Runs the compound target check
+    A compound target parsed into a code object and a list of leaf matchers.
+
+    Each leaf is a tuple of (matcher function name, pattern, delimiter); the
+    expression refers to them as ``_t0``, ``_t1``, ... so python's own
+    short-circuit evaluation decides which leaves actually run.
     """
-    if not opts:
-        opts = __opts__
-    nodegroups = opts.get("nodegroups", {})
-    matchers = hubblestack.loader.matchers(opts)
-    minion_id = opts.get("minion_id", opts["id"])
 
-    if not isinstance(tgt, str) and not isinstance(tgt, (list, tuple)):
-        log.error("Compound target received that is neither string, list nor tuple")
-        return False
-    log.debug("compound_match: %s ? %s", minion_id, tgt)
-    ref = {
-        "G": "grain",
-        "P": "grain_pcre",
-        "I": "pillar",
-        "J": "pillar_pcre",
-        "L": "list",
-        "N": None,  # Nodegroups should already be expanded
-        "S": "ipcidr",
-        "E": "pcre",
-    }
-    if HAS_RANGE:
-        ref["R"] = "range"
+    def __init__(self, tgt, expr, leaves):
+        self.tgt = tgt
+        self.expr = expr
+        self.leaves = leaves
+        self.code = compile(expr, "<compound target>", "eval")
+
+    def evaluate(self, matchers, opts):
+        """ evaluate the compiled target against the given matchers and opts """
+
+        def _leaf(funcname, pattern, delimiter):
+            def _call():
+                if funcname == "glob_match.match":
+                    return bool(matchers[funcname](pattern, opts))
+                kwargs = {"opts": opts}
+                if delimiter:
+                    kwargs["delimiter"] = delimiter
+                return bool(matchers[funcname](pattern, **kwargs))
+
+            return _call
+
+        namespace = {"__builtins__": {}}
+        for idx, leaf in enumerate(self.leaves):
+            namespace["_t{0}".format(idx)] = _leaf(*leaf)
+        return bool(eval(self.code, namespace))  # pylint: disable=W0123
+
+
+def _target_key(tgt, nodegroups):
+    key = tgt if isinstance(tgt, str) else tuple(tgt)
+    if nodegroups:
+        return (key, repr(nodegroups))
+    return key
+
+
+def compile_target(tgt, nodegroups=None):
+    """
+    Parse a compound target (string, list or tuple) into a CompiledTarget.
+    Returns None if the target is invalid.
+    """
+    if not nodegroups:
+        nodegroups = {}
 
     results = []
-    opers = ["and", "or", "not", "(", ")"]
+    leaves = []
 
     if isinstance(tgt, str):
         words = tgt.split()
     else:
         # we make a shallow copy in order to not affect the passed in arg
-        words = tgt[:]
+        words = list(tgt)
 
     while words:
         word = words.pop(0)
         target_info = hubblestack.utils.minions.parse_target(word)
 
         # Easy check first
-        if word in opers:
+        if word in OPERS:
             if results:
                 if results[-1] == "(" and word in ("and", "or"):
                     log.error('Invalid beginning operator after "(": %s', word)
-                    return False
+                    return None
                 if word == "not":
                     if not results[-1] in ("and", "or", "("):
                         results.append("and")
@@ -73,7 +126,7 @@ def match(tgt, opts=None):
                 # seq start with binary oper, fail
                 if word not in ["(", "not"]:
                     log.error("Invalid beginning operator: %s", word)
-                    return False
+                    return None
                 results.append(word)
 
         elif target_info and target_info["engine"]:
@@ -86,7 +139,7 @@ def match(tgt, opts=None):
                     words = decomposed + words
                 continue
 
-            engine = ref.get(target_info["engine"])
+            engine = REF.get(target_info["engine"])
             if not engine:
                 # If an unknown engine is called at any time, fail out
                 log.error(
@@ -94,30 +147,95 @@ def match(tgt, opts=None):
                     target_info["engine"],
                     word,
                 )
-                return False
-
-            engine_args = [target_info["pattern"]]
-            engine_kwargs = {"opts": opts}
-            if target_info["delimiter"]:
-                engine_kwargs["delimiter"] = target_info["delimiter"]
-
-            results.append(
-                str(
-                    matchers["{0}_match.match".format(engine)](
-                        *engine_args, **engine_kwargs
-                    )
-                )
-            )
+                return None
+
+            results.append("_t{0}()".format(len(leaves)))
+            leaves.append(("{0}_match.match".format(engine),
+                           target_info["pattern"], target_info["delimiter"]))
 
         else:
             # The match is not explicitly defined, evaluate it as a glob
-            results.append(str(matchers["glob_match.match"](word, opts)))
+            results.append("_t{0}()".format(len(leaves)))
+            leaves.append(("glob_match.match", word, None))
+
+    expr = " ".join(results)
+    try:
+        return CompiledTarget(tgt, expr, leaves)
+    except SyntaxError:
+        log.error("Invalid compound target: %s for results: %s", tgt, expr)
+        return None
+
+
+def get_compiled(tgt, nodegroups=None):
+    """
+    Return the (cached) CompiledTarget for tgt, compiling it on first use
+    """
+    key = _target_key(tgt, nodegroups)
+    if key not in _COMPILED:
+        _COMPILED[key] = compile_target(tgt, nodegroups)
+    return _COMPILED[key]
+
+
+def get_matchers(opts):
+    """
+    Return a matchers loader for opts, reusing the previously built one when
+    the extension_modules location hasn't changed. The loader's own __opts__
+    don't matter much here, each matcher is handed opts explicitly.
+    """
+    key = opts.get("extension_modules")
+    if key not in _MATCHERS:
+        _MATCHERS.clear()
+        _MATCHERS[key] = hubblestack.loader.matchers(opts)
+    return _MATCHERS[key]
+
+
+def clear_cache():
+    """
+    Forget all compiled targets, memoized results and the cached matchers loader
+    """
+    _COMPILED.clear()
+    _RESULTS.clear()
+    _MATCHERS.clear()
+    _RESULTS_GENERATION[0] = None
+
+
+def match(tgt, opts=None):
+    """
+    Runs the compound target check
+    """
+    if not opts:
+        opts = __opts__
+    minion_id = opts.get("minion_id", opts["id"])
+
+    if not isinstance(tgt, str) and not isinstance(tgt, (list, tuple)):
+        log.error("Compound target received that is neither string, list nor tuple")
+        return False
+
+    nodegroups = opts.get("nodegroups", {})
+    generation = opts.get("grains_generation")
+    if generation is not None:
+        if _RESULTS_GENERATION[0] != generation:
+            # new grains: previous results (and the matchers loader, which
+            # was packed with the old opts) are no longer valid
+            _RESULTS.clear()
+            _MATCHERS.clear()
+            _RESULTS_GENERATION[0] = generation
+        memo_key = (_target_key(tgt, nodegroups), minion_id, generation)
+        if memo_key in _RESULTS:
+            return _RESULTS[memo_key]
+
+    log.debug("compound_match: %s ? %s", minion_id, tgt)
+    compiled = get_compiled(tgt, nodegroups)
+    if compiled is None:
+        return False
 
-    results = " ".join(results)
-    log.debug('compound_match %s ? "%s" => "%s"', minion_id, tgt, results)
     try:
-        return eval(results)  # pylint: disable=W0123
+        ret = compiled.evaluate(get_matchers(opts), opts)
     except Exception:  # pylint: disable=broad-except
-        log.error("Invalid compound target: %s for results: %s", tgt, results)
+        log.error("Invalid compound target: %s for results: %s", tgt, compiled.expr)
         return False
-    return False
+    log.debug('compound_match %s ? "%s" => "%s"', minion_id, tgt, ret)
+
+    if generation is not None:
+        _RESULTS[memo_key] = ret
+    return ret
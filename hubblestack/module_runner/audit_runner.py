@@ -1,6 +1,10 @@
 import os
+import copy
+import json
 import logging
 import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import hubblestack.module_runner.runner
 from hubblestack.module_runner.runner import Caller
@@ -9,8 +13,10 @@ import hubblestack.module_runner.comparator
 
 from hubblestack.exceptions import HubbleCheckVersionIncompatibleError
 from hubblestack.exceptions import HubbleCheckValidationError
+from hubblestack.status import HubbleStatus
 
 log = logging.getLogger(__name__)
+hubble_status = HubbleStatus(__name__, 'memo_hit', 'memo_miss')
 CHECK_STATUS = {
     'Success': 'Success',
     'Failure': 'Failure',
@@ -19,6 +25,49 @@ CHECK_STATUS = {
 }
 
 
+class ProbeMemo(object):
+    """
+    Results of audit modules' execute(), keyed by module and arguments.
+
+    Checks of a run often stat the same path, read the same sysctl or list the
+    same packages. Modules whose execute() only depends on its args (and on
+    the state of the host, which isn't expected to change during one run)
+    declare ``__pure__ = True``; their results are kept for the lifetime of
+    the runner, i.e. one audit run.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(module_name, module_args):
+        """ the memo key of a check's items, None if its args can't be normalized """
+        try:
+            return module_name, json.dumps(module_args.get('args'), sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, key):
+        """ return (found, result) """
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                hubble_status.mark('memo_hit')
+                # comparators are free to modify what they are given
+                return True, copy.deepcopy(self._results[key])
+            self.misses += 1
+        hubble_status.mark('memo_miss')
+        return False, None
+
+    def set(self, key, result):
+        """ remember the result of key """
+        with self._lock:
+            self._results[key] = copy.deepcopy(result)
+
+
 class AuditRunner(hubblestack.module_runner.runner.Runner):
     """
     Audit runner
@@ -26,6 +75,7 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
 
     def __init__(self):
         super().__init__(Caller.AUDIT)
+        self._memo = ProbeMemo()
 
     # overridden method
     def _execute(self, audit_data_dict, audit_file, args):
@@ -34,55 +84,61 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
         tags = args.get('tags', '*')
         labels = args.get('labels', None)
         verbose = args.get('verbose', None)
+        # with max_workers > 1, non-boolean checks run on a thread pool (most
+        # of them just wait on subprocesses or I/O); the result order is kept
+        max_workers = int(args.get('max_workers', None) or 1)
+        pool = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
         result_list = []
         boolean_expr_check_list = []
         audit_profile = os.path.splitext(os.path.basename(audit_file))[0]
-        for audit_id, audit_data in audit_data_dict.items():
-            log.debug('Executing check-id: %s in audit profile: %s', audit_id, audit_profile)
-            audit_impl = self._get_matched_implementation(audit_id, audit_data, tags, labels)
-            if not audit_impl:
-                # no matched impl found
-                log.debug('No matched implementation found for check-id: %s in audit profile: %s', audit_id,
-                          audit_profile)
-                continue
+        try:
+            for audit_id, audit_data in audit_data_dict.items():
+                log.debug('Executing check-id: %s in audit profile: %s', audit_id, audit_profile)
+                audit_impl = self._get_matched_implementation(audit_id, audit_data, tags, labels)
+                if not audit_impl:
+                    # no matched impl found
+                    log.debug('No matched implementation found for check-id: %s in audit profile: %s', audit_id,
+                              audit_profile)
+                    continue
+
+                if not self._validate_audit_data(audit_id, audit_impl):
+                    continue
 
-            if not self._validate_audit_data(audit_id, audit_impl):
-                continue
+                try:
+                    # version check
+                    if not self._is_hubble_version_compatible(audit_id, audit_impl):
+                        raise HubbleCheckVersionIncompatibleError('Version not compatible')
+
+                    if self._is_boolean_expression(audit_impl):
+                        # Check is boolean expression.
+                        # Gather boolean expressions in separate list and evaluate after evaluating all other checks.
+                        log.debug('Boolean expression found. Gathering it to evaluate later.')
+                        boolean_expr_check_list.append({
+                            'check_unique_id': audit_id,
+                            'check_id': audit_data['tag'],
+                            'audit_impl': audit_impl,
+                            'audit_data': audit_data
+                        })
+                    elif pool:
+                        # handover to module, collected below
+                        result_list.append((audit_id, audit_data, pool.submit(
+                            self._execute_audit, audit_id, audit_impl, audit_data, verbose, audit_profile)))
+                    else:
+                        # handover to module
+                        audit_result = self._execute_audit(audit_id, audit_impl, audit_data, verbose, audit_profile)
+                        result_list.append(audit_result)
+                except (HubbleCheckValidationError, HubbleCheckVersionIncompatibleError) as herror:
+                    # add into error/skipped section
+                    result_list.append(self._check_error_result(audit_id, audit_data, audit_profile, herror))
+                except Exception as exc:
+                    log.error(exc)
 
-            try:
-                # version check
-                if not self._is_hubble_version_compatible(audit_id, audit_impl):
-                    raise HubbleCheckVersionIncompatibleError('Version not compatible')
-
-                if self._is_boolean_expression(audit_impl):
-                    # Check is boolean expression.
-                    # Gather boolean expressions in separate list and evaluate after evaluating all other checks.
-                    log.debug('Boolean expression found. Gathering it to evaluate later.')
-                    boolean_expr_check_list.append({
-                        'check_unique_id': audit_id,
-                        'check_id': audit_data['tag'],
-                        'audit_impl': audit_impl,
-                        'audit_data': audit_data
-                    })
-                else:
-                    # handover to module
-                    audit_result = self._execute_audit(audit_id, audit_impl, audit_data, verbose, audit_profile)
-                    result_list.append(audit_result)
-            except (HubbleCheckValidationError, HubbleCheckVersionIncompatibleError) as herror:
-                # add into error/skipped section
-                result_list.append({
-                    'check_unique_id': audit_id,
-                    'tag': audit_data['tag'],
-                    'check_id': audit_data['tag'],
-                    'description': audit_data['description'],
-                    'sub_check': audit_data.get('sub_check', False),
-                    'check_result': CHECK_STATUS['Error'] if isinstance(herror, HubbleCheckValidationError) else
-                    CHECK_STATUS['Skipped'],
-                    'audit_profile': audit_profile
-                })
-                log.error(herror)
-            except Exception as exc:
-                log.error(exc)
+            if pool:
+                # boolean expressions refer to the other checks' results, wait for all of them
+                result_list = self._collect_pool_results(result_list, audit_profile)
+        finally:
+            if pool:
+                pool.shutdown()
 
         # Evaluate boolean expressions
         boolean_expr_result_list = self._evaluate_boolean_expression(
@@ -92,6 +148,43 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
         # return list of results for a file
         return result_list
 
+    def _collect_pool_results(self, pending_list, audit_profile):
+        """
+        Replace the (audit_id, audit_data, future) entries _execute queued on
+        the thread pool with their results, handling errors the same way a
+        serial run does
+        """
+        result_list = []
+        for pending in pending_list:
+            if not isinstance(pending, tuple):
+                result_list.append(pending)
+                continue
+            audit_id, audit_data, future = pending
+            try:
+                result_list.append(future.result())
+            except (HubbleCheckValidationError, HubbleCheckVersionIncompatibleError) as herror:
+                result_list.append(self._check_error_result(audit_id, audit_data, audit_profile, herror))
+            except Exception as exc:
+                log.error(exc)
+        return result_list
+
+    def _check_error_result(self, audit_id, audit_data, audit_profile, herror):
+        """
+        Result entry for a check that failed validation (Error) or isn't
+        compatible with this hubble version (Skipped)
+        """
+        log.error(herror)
+        return {
+            'check_unique_id': audit_id,
+            'tag': audit_data['tag'],
+            'check_id': audit_data['tag'],
+            'description': audit_data['description'],
+            'sub_check': audit_data.get('sub_check', False),
+            'check_result': CHECK_STATUS['Error'] if isinstance(herror, HubbleCheckValidationError) else
+            CHECK_STATUS['Skipped'],
+            'audit_profile': audit_profile
+        }
+
     # overridden method
     def _validate_yaml_dictionary(self, yaml_dict):
         return True
@@ -208,8 +301,12 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
         overall_result = check_eval_logic == 'and'
         failure_reasons = []
         for audit_check in audit_impl['items']:
-            mod_status, module_result_local = self._execute_module(audit_impl['module'], audit_id, audit_check,
-                                                                   extra_args=result_list)
+            if result_list is None:
+                mod_status, module_result_local = self._execute_pure_module(audit_impl['module'], audit_id,
+                                                                            audit_check)
+            else:
+                mod_status, module_result_local = self._execute_module(audit_impl['module'], audit_id, audit_check,
+                                                                       extra_args=result_list)
             # Invoke Comparator
             comparator_status, comparator_result = hubblestack.module_runner.comparator.run(
                 audit_id, audit_check['comparator'], module_result_local, mod_status)
@@ -261,6 +358,31 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
                     audit_result['failure_reason'] = ', '.join(failure_reasons)
         return audit_result
 
+    def _is_pure_module(self, module_name):
+        """
+        Whether the module declares (with ``__pure__ = True``) that its
+        execute() only depends on its args
+        """
+        execute_method = hubblestack.module_runner.runner.__hmods__['{0}.execute'.format(module_name)]
+        return bool(getattr(execute_method, '__globals__', {}).get('__pure__', False))
+
+    def _execute_pure_module(self, module_name, audit_id, audit_check):
+        """
+        Execute the module, or reuse its result for the same args earlier in
+        this run if the module is pure
+        """
+        key = self._memo.key(module_name, audit_check) if self._is_pure_module(module_name) else None
+        if key is None:
+            return self._execute_module(module_name, audit_id, audit_check)
+        found, ret = self._memo.get(key)
+        if found:
+            log.debug('Reusing the result of module %s with the same args for check-id: %s',
+                      module_name, audit_id)
+            return ret
+        ret = self._execute_module(module_name, audit_id, audit_check)
+        self._memo.set(key, ret)
+        return ret
+
     def _evaluate_boolean_expression(self, boolean_expr_check_list, verbose, audit_profile, result_list):
         boolean_expr_result_list = []
         if boolean_expr_check_list:
@@ -11,6 +11,10 @@ from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
+# (type, keys of the comparator args) -> comparator command, for __comparator__
+_COMMANDS = {}
+_COMMANDS_LOADER = None
+
 
 def run(audit_id, args, module_result, module_status=True):
     """
@@ -40,10 +44,10 @@ def run(audit_id, args, module_result, module_status=True):
         # raise error when no matched command found
         raise HubbleCheckFailedError('Unknown comparator or command for: {0}'.format(args['type']))
 
-    if isinstance(module_result, int) or isinstance(module_result, float):
-        result_val = module_result
+    if isinstance(module_result, dict) and 'result' in module_result:
+        result_val = module_result['result']
     else:
-        result_val = module_result['result'] if 'result' in module_result else module_result
+        result_val = module_result
     comparator_result = __comparator__[comparator_command_method_name](audit_id, result_val, args)
 
     return comparator_result
@@ -51,7 +55,32 @@ def run(audit_id, args, module_result, module_status=True):
 
 def _find_comparator_command(args):
     """
-    Find matched comparator's command
+    Find matched comparator's command. Comparators like list::match_any call
+    run() for every element with the same kind of args, so the command found
+    for a type and set of keys is remembered.
+    """
+    global _COMMANDS_LOADER
+    if _COMMANDS_LOADER is not __comparator__:
+        # the loader was initialized again
+        _COMMANDS.clear()
+        _COMMANDS_LOADER = __comparator__
+    key = (args.get('type'), tuple(args))
+    try:
+        return _COMMANDS[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # an unhashable type
+        return _lookup_comparator_command(args)
+    method_name = _lookup_comparator_command(args)
+    if method_name:
+        _COMMANDS[key] = method_name
+    return method_name
+
+
+def _lookup_comparator_command(args):
+    """
+    Look up the comparator's command for the first key of args it provides
     """
     for comparator_key in args.keys():
         if comparator_key in ['type', 'success_on_error']:
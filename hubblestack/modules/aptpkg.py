@@ -20,6 +20,7 @@ import time
 
 import hubblestack.utils.data
 import hubblestack.utils.pkg
+import hubblestack.utils.pkg.vercmp
 import hubblestack.utils.systemd
 import hubblestack.utils.environment
 from hubblestack.exceptions import (
@@ -224,6 +225,11 @@ def version_cmp(pkg1, pkg2, ignore_epoch=False):
         except Exception:
             # Try to use shell version in case of errors w/python bindings
             pass
+    try:
+        return hubblestack.utils.pkg.vercmp.dpkg_version_cmp(pkg1, pkg2)
+    except ValueError as exc:
+        # let dpkg have the final word on versions we can't parse
+        log.debug('Asking dpkg to compare %s and %s: %s', pkg1, pkg2, exc)
     try:
         for oper, ret in (('lt', -1), ('eq', 0), ('gt', 1)):
             cmd = ['dpkg', '--compare-versions', pkg1, oper, pkg2]
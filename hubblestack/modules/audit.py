@@ -86,6 +86,16 @@ The output of this module is dict containing result of execution of checks. It c
 3. Success - A check is executed and results in a success
 4. Failure - A check is executed and results in failure
 There are additional features as verbose logging, compliance and debug which can be passed as flags.
+
+Checks spend most of their time waiting on subprocesses and files. Setting
+``hubblestack:nova:max_workers`` to more than 1 runs up to that many checks of
+a profile at once; boolean expression (bexpr) checks are still evaluated after
+the checks they refer to, and results keep the order of the profile.
+
+Within one run, checks of the modules that only depend on their args (stat,
+sysctl, pkg, readfile and grep declare ``__pure__ = True``) share the result of
+the first check with the same args; the hits and misses are counted in
+hubblestack.status (``memo_hit`` and ``memo_miss``).
 """
 
 import logging
@@ -173,13 +183,17 @@ def run(audit_files=None,
         if not audit_files:
             return result_dict
 
+        # checks run concurrently (per profile) when this is more than 1
+        max_workers = __mods__['config.get']('hubblestack:nova:max_workers', 1)
+
         # initialize loader
         audit_runner.init_loader()
         for audit_file in audit_files:
             ret = audit_runner.execute(audit_file, {
                 'tags': tags,
                 'labels': labels,
-                'verbose': verbose
+                'verbose': verbose,
+                'max_workers': max_workers
             })
             combined_dict[audit_file] = ret
 
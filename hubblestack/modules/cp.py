@@ -189,6 +189,11 @@ def cache_dir(
         Files that don't exist int he source location will be automatically
         removed from the destination
 
+    With ``fileclient_delta_sync: True`` in the config, the file server's
+    manifest (the hash and size of every file under path) is fetched in one
+    call and compared with the one saved by the previous sync, so unchanged
+    files aren't hashed again and only changed ones are downloaded, by up to
+    ``fileclient_workers`` (default 4) threads at a time.
 
     CLI Examples:
 
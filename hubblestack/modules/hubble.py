@@ -23,12 +23,14 @@ from hubblestack.exceptions import CommandExecutionError
 from hubblestack import __version__
 from hubblestack.status import HubbleStatus
 from hubblestack.loader import nova as NovaLazyLoader
+import hubblestack.utils.profile_store
 
 log = logging.getLogger(__name__)
 
 hubble_status = HubbleStatus(__name__, 'top', 'audit')
 
 __nova__ = {}
+_NOVA_SIG = None
 
 @hubble_status.watch
 def audit(configs=None,
@@ -658,27 +660,57 @@ def sync(clean=True):
 def load():
     """
     Load the synced audit modules.
+
+    Profiles are parsed through hubblestack.utils.profile_store, so only new
+    or changed yaml is parsed again; when neither the profiles nor the nova
+    modules changed since the last load, the loaded modules are reused.
     """
     if __mods__['config.get']('hubblestack:nova:autosync', True):
         sync()
 
-    for nova_dir in _hubble_dir():
+    hubble_dir = _hubble_dir()
+    for nova_dir in hubble_dir:
         if not os.path.isdir(nova_dir):
             return False, 'No synced nova modules/profiles found in nova_dir={}'.format(nova_dir)
 
-    log.debug('loading nova modules')
-
     global __nova__
-    __nova__ = NovaLazyLoader(_hubble_dir(), __opts__, __mods__)
+    global _NOVA_SIG
+    profiles = hubblestack.utils.profile_store.PROFILES
+    data, missing_data, changed = profiles.load_tree(hubble_dir)
+    sig = (hubble_dir, _module_sig(hubble_dir[0]))
+    if not changed and sig == _NOVA_SIG:
+        log.debug('reusing loaded nova modules')
+        __nova__.__data__, __nova__.__missing_data__ = data, missing_data
+    else:
+        log.debug('loading nova modules')
+        __nova__ = NovaLazyLoader(hubble_dir, __opts__, __mods__, data=(data, missing_data))
+        _NOVA_SIG = sig
 
     ret = {'loaded': list(__nova__),
            'missing': __nova__.missing_modules,
            'data': list(__nova__.__data__),
-           'missing_data': __nova__.__missing_data__}
+           'missing_data': __nova__.__missing_data__,
+           'profile_cache': dict(profiles.stats)}
 
     return True, ret
 
 
+def _module_sig(module_dir):
+    """
+    The (name, mtime, size) of the nova modules, to tell whether they changed
+    """
+    ret = []
+    for path, _, filenames in os.walk(module_dir):
+        for filename in filenames:
+            if filename.endswith('.py'):
+                try:
+                    st = os.stat(os.path.join(path, filename))
+                except OSError:
+                    continue
+                ret.append((os.path.join(path, filename), st.st_mtime_ns, st.st_size))
+    return tuple(sorted(ret))
+
+
 def version():
     """
     Report the version of this module
@@ -11,6 +11,20 @@ import hubblestack.loader
 log = logging.getLogger(__name__)
 
 
+def _matchers():
+    """
+    Return the matchers loader for __opts__, building it once per grains
+    generation and keeping it in the context so the compound matcher's
+    compiled targets survive between calls.
+    """
+    key = (id(__opts__), __opts__.get("grains_generation"))
+    cached = __context__.get("match.matchers")
+    if cached is None or cached[0] != key:
+        cached = (key, hubblestack.loader.matchers(__opts__))
+        __context__["match.matchers"] = cached
+    return cached[1]
+
+
 def compound(tgt, minion_id=None):
     """
     Return True if the minion ID matches the given compound target
@@ -31,9 +45,9 @@ def compound(tgt, minion_id=None):
         if not isinstance(minion_id, str):
             minion_id = str(minion_id)
         opts["id"] = minion_id
+        matchers = hubblestack.loader.matchers(opts)
     else:
-        opts = __opts__
-    matchers = hubblestack.loader.matchers(opts)
+        matchers = _matchers()
     try:
         return matchers["compound_match.match"](tgt)
     except Exception as exc:  # pylint: disable=broad-except
@@ -37,9 +37,11 @@ import hashlib
 import yaml
 import zlib
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from inspect import getfullargspec
 
 import hubblestack.utils.files
+import hubblestack.utils.osquery_lib
 import hubblestack.utils.platform
 
 from hubblestack.exceptions import CommandExecutionError
@@ -50,6 +52,9 @@ from hubblestack.status import HubbleStatus
 log = logging.getLogger(__name__)
 
 CRC_BYTES = 256
+OSQUERYI_TIMEOUT = 600
+OSQUERY_GROUP_TIMEOUT = 3600
+OSQUERYD_LOG_BATCH_SIZE = 1000
 hubble_status = HubbleStatus(__name__, 'top', 'queries', 'osqueryd_monitor', 'osqueryd_log_parser')
 
 __virtualname__ = 'nebula'
@@ -192,25 +197,87 @@ def _build_baseline_osquery_data(report_version_with_day):
     return ret
 
 
-def _run_osqueryi_query(query, query_sql, timing, verbose):
+def _osqueryi_cmd(query_sql=None):
     """
-    Run the osqueryi query in query_sql and return the result
+    Build the osqueryi command line, for query_sql or (without it) for an
+    interactive session reading queries from stdin
     """
     max_file_size = 104857600
     augeas_lenses = '/opt/osquery/lenses'
-    query_ret = {'result': True}
 
-    # Run the osqueryi query
     cmd = [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json',
-          '--augeas_lenses', augeas_lenses, query_sql]
+          '--augeas_lenses', augeas_lenses]
     
     if hubblestack.utils.platform.is_windows():
         # augeas_lenses are not available on windows
-        cmd = [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json',
-                query_sql]
+        cmd = [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json']
+
+    if query_sql:
+        cmd.append(query_sql)
+    return cmd
 
+
+def _run_osqueryi_batch(batch, timing, verbose, deadline=None):
+    """
+    Run a list of (name, query, query_sql) in a single osqueryi session and
+    return their results, in order. Queries the session doesn't produce a
+    result for (errors, or the session dying part way) are re-run on their
+    own with _run_osqueryi_query so they fail (or succeed) exactly as they
+    would have unbatched. Every query in the batch is charged an equal share
+    of the session time in timing.
+    """
+    timeout = OSQUERYI_TIMEOUT
     time_start = time.time()
-    res = __mods__['cmd.run_all'](cmd, timeout=600)
+    if deadline is not None:
+        timeout = min(timeout, deadline - time_start)
+    results = [None] * len(batch)
+    if timeout > 0:
+        results = hubblestack.utils.osquery_lib.run_batch(
+            _osqueryi_cmd(), [query_sql for _, _, query_sql in batch], timeout=timeout,
+            run_all=__mods__['cmd.run_all'])
+    share = (time.time() - time_start) / len(batch)
+
+    ret = []
+    for (name, query, query_sql), data in zip(batch, results):
+        if data is None:
+            log.debug('osqueryi batch produced no result for %s, running it alone', name)
+            ret.append(_run_osqueryi_query(query, query_sql, timing, verbose, deadline=deadline))
+            continue
+        timing[name] = share
+        query_ret = {'result': True, 'data': data}
+        if verbose:
+            tmp = copy.deepcopy(query)
+            tmp['query_result'] = query_ret
+        else:
+            tmp = {name: query_ret}
+        ret.append(tmp)
+    return ret
+
+
+def _run_osqueryi_query(query, query_sql, timing, verbose, deadline=None):
+    """
+    Run the osqueryi query in query_sql and return the result
+
+    deadline
+        Optional ``time.time()`` by which the whole query group must be done.
+        The osqueryi timeout is cut short to fit it, and the query isn't
+        started at all (result False) once it has passed.
+    """
+    query_ret = {'result': True}
+
+    # Run the osqueryi query
+    cmd = _osqueryi_cmd(query_sql)
+
+    timeout = OSQUERYI_TIMEOUT
+    time_start = time.time()
+    if deadline is not None:
+        timeout = min(timeout, deadline - time_start)
+    if timeout <= 0:
+        log.error('query group deadline passed before osqueryi execution name=%s',
+                  query['query_name'])
+        res = {'retcode': 1, 'stdout': '', 'stderr': 'query group deadline exceeded'}
+    else:
+        res = __mods__['cmd.run_all'](cmd, timeout=timeout)
     time_end = time.time()
     timing[query['query_name']] = time_end - time_start
     if res['retcode'] == 0:
@@ -234,10 +301,20 @@ def _run_osquery_queries(query_data, verbose):
     """
     Go over the query data in the osquery query file, run each query
     and return the aggregated results.
+
+    Up to ``osquery_max_parallel`` (default 1, i.e. serially) queries run at
+    once; results come back in query file order either way. The whole group
+    has to finish within ``osquery_group_timeout`` seconds (default 3600),
+    queries that would start after that fail like any other osqueryi error.
+
+    With ``osquery_batch_mode`` set, the group is fed through one osqueryi
+    session (one per worker when running in parallel) instead of starting
+    osqueryi once per query.
     """
     ret = []
     timing = {}
     success = True
+    to_run = []
     for name, query in query_data.items():
         query['query_name'] = name
         query_sql = query.get('query')
@@ -248,9 +325,34 @@ def _run_osquery_queries(query_data, verbose):
                          'which contains either \'attach\' or \'curl\': %s',
                          name, query_sql)
             continue
+        to_run.append((name, query, query_sql))
+
+    max_parallel = max(1, int(__opts__.get('osquery_max_parallel', 1)))
+    group_timeout = __opts__.get('osquery_group_timeout', OSQUERY_GROUP_TIMEOUT)
+    deadline = time.time() + float(group_timeout) if group_timeout else None
+
+    def _run(chunk):
+        return [_run_osqueryi_query(query, query_sql, timing, verbose, deadline=deadline)
+                for _, query, query_sql in chunk]
+
+    def _run_batch(chunk):
+        return _run_osqueryi_batch(chunk, timing, verbose, deadline=deadline)
+
+    work, func = [[item] for item in to_run], _run
+    if __opts__.get('osquery_batch_mode') and to_run:
+        # split into contiguous chunks, one session per worker
+        size = -(-len(to_run) // max_parallel)
+        work = [to_run[idx:idx + size] for idx in range(0, len(to_run), size)]
+        func = _run_batch
+
+    # Run osquery queries
+    if max_parallel > 1 and len(work) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(work))) as pool:
+            results = [x for chunk in pool.map(func, work) for x in chunk]
+    else:
+        results = [x for chunk in map(func, work) for x in chunk]
 
-        # Run osquery query
-        query_ret = _run_osqueryi_query(query, query_sql, timing, verbose)
+    for (name, _, _), query_ret in zip(to_run, results):
         try:
             if query_ret['query_result']['result'] is False or \
                query_ret[name]['result'] is False:
@@ -379,7 +481,6 @@ def osqueryd_monitor(configfile=None,
                               databasepath, hashfile, servicename)
 
 
-@hubble_status.watch
 def osqueryd_log_parser(osqueryd_logdir=None,
                         backuplogdir=None,
                         maxlogfilesizethreshold=None,
@@ -419,8 +520,12 @@ def osqueryd_log_parser(osqueryd_logdir=None,
         Defaults to False. If set to True, passwords mentioned in the
         return object are masked
 
+    The logs are read incrementally: this returns a generator yielding lists
+    of at most ``osquery_log_parser_batch_size`` (default 1000) parsed and
+    masked events. Each log's cached offset only moves past a batch once the
+    consumer asks for the next one (i.e. once the batch has been handed to
+    the returners), so memory use doesn't depend on the size of the log.
     """
-    ret = []
     if not osqueryd_logdir:
         osqueryd_logdir = __opts__.get('osquerylogpath')
     result_logfile = os.path.normpath(os.path.join(osqueryd_logdir, 'osqueryd.results.log'))
@@ -435,40 +540,55 @@ def osqueryd_log_parser(osqueryd_logdir=None,
         'osquery_logfile_maxbytes_toparse')
     backuplogfilescount = backuplogfilescount or __opts__.get('osquery_backuplogs_count')
 
-    if os.path.exists(result_logfile):
-        logfile_offset = _get_file_offset(result_logfile)
-        event_data = _parse_log(result_logfile,
-                                logfile_offset,
-                                backuplogdir,
-                                logfilethresholdinbytes,
-                                maxlogfilesizethreshold,
-                                backuplogfilescount,
-                                enablediskstatslogging)
-        if event_data:
-            ret += event_data
-    else:
-        log.warn("Specified osquery result log file doesn't exist: %s", result_logfile)
-
-    if os.path.exists(snapshot_logfile):
-        logfile_offset = _get_file_offset(snapshot_logfile)
-        event_data = _parse_log(snapshot_logfile,
-                                logfile_offset,
-                                backuplogdir,
-                                logfilethresholdinbytes,
-                                maxlogfilesizethreshold,
-                                backuplogfilescount,
-                                enablediskstatslogging)
-        if event_data:
-            ret += event_data
-    else:
-        log.warn("Specified osquery snapshot log file doesn't exist: %s", snapshot_logfile)
+    batch_size = __opts__.get('osquery_log_parser_batch_size', OSQUERYD_LOG_BATCH_SIZE)
 
-    ret = _update_event_data(ret)
+    return _osqueryd_log_batches([result_logfile, snapshot_logfile],
+                                 backuplogdir,
+                                 logfilethresholdinbytes,
+                                 maxlogfilesizethreshold,
+                                 backuplogfilescount,
+                                 enablediskstatslogging,
+                                 batch_size,
+                                 topfile_for_mask if mask_passwords else False)
 
-    if mask_passwords:
-        log.info("Perform masking")
-        _mask_object(ret, topfile_for_mask)
-    return ret
+
+def _osqueryd_log_batches(logfiles,
+                          backuplogdir,
+                          logfilethresholdinbytes,
+                          maxlogfilesizethreshold,
+                          backuplogfilescount,
+                          enablediskstatslogging,
+                          batch_size,
+                          topfile_for_mask=False):
+    """
+    Generator behind osqueryd_log_parser: yield batches of parsed (and, unless
+    topfile_for_mask is False, masked) events from each of the logfiles
+
+    The osqueryd_log_parser status counter times the whole pass over the logs,
+    until the generator is exhausted or closed.
+    """
+    stat_handle = hubble_status.mark('osqueryd_log_parser')
+    try:
+        for logfile in logfiles:
+            if not os.path.exists(logfile):
+                log.warn("Specified osquery log file doesn't exist: %s", logfile)
+                continue
+            logfile_offset = _get_file_offset(logfile)
+            for event_data in _parse_log(logfile,
+                                         logfile_offset,
+                                         backuplogdir,
+                                         logfilethresholdinbytes,
+                                         maxlogfilesizethreshold,
+                                         backuplogfilescount,
+                                         enablediskstatslogging,
+                                         batch_size):
+                ret = _update_event_data(event_data)
+                if topfile_for_mask is not False:
+                    log.info("Perform masking")
+                    _mask_object(ret, topfile_for_mask)
+                yield ret
+    finally:
+        stat_handle.fin()
 
 
 def _update_event_data(ret):
@@ -1364,71 +1484,89 @@ def _parse_log(path_to_logfile,
                logfilethresholdinbytes,
                maxlogfilesizethreshold,
                backuplogfilescount,
-               enablediskstatslogging):
+               enablediskstatslogging,
+               batch_size=None):
     """
     Parse logs generated by osquery daemon.
     Path to log file to be parsed should be specified
+
+    This is a generator yielding lists of (at most batch_size) raw events. The
+    cached offset is moved past each batch when the next one is requested.
     """
-    event_data = []
+    batch_size = batch_size or OSQUERYD_LOG_BATCH_SIZE
     file_offset = offset
-    rotate_log = False
-    if os.path.exists(path_to_logfile):
-        with open(path_to_logfile, "r") as file_des:
-            if file_des:
-                if os.stat(path_to_logfile).st_size > maxlogfilesizethreshold:
-                    # This is done to handle scenarios where hubble process was in stopped state and
-                    # osquery daemon was generating logs for that time frame.
-                    # When hubble is started and this function gets executed,
-                    # it might be possible that the log file is now huge.
-                    # In this scenario hubble might take too much time to process the logs
-                    # which may not be required
-                    # To handle this, log file size is validated against max threshold size.
-                    log.info(
-                        "Log file size is above max threshold size that can be parsed by Hubble.")
-                    log.info("Log file size: %f, max threshold: %f",
-                             os.stat(path_to_logfile).st_size,
-                             maxlogfilesizethreshold)
-                    log.info("Rotating log and skipping parsing for this iteration")
-                    # Closing explicitly to handle File in Use exception in windows
-                    file_des.close()
-                    _perform_log_rotation(path_to_logfile,
-                                          file_offset,
-                                          backuplogdir,
-                                          backuplogfilescount,
-                                          enablediskstatslogging,
-                                          False)
-                    # Reset file offset to start of file in case original file is rotated
-                    file_offset = 0
-                else:
-                    if os.stat(path_to_logfile).st_size > logfilethresholdinbytes:
-                        rotate_log = True
-                    file_des.seek(offset)
-                    for event in file_des.readlines():
-                        event_data.append(event)
-                    file_offset = file_des.tell()
-                    # Closing explicitly to handle File in Use exception in windows
-                    file_des.close()
-                    if rotate_log:
-                        log.info('Log file size above threshold, '
-                                 'going to rotate log file: %s', path_to_logfile)
-                        residue_events = _perform_log_rotation(path_to_logfile,
-                                                               file_offset,
-                                                               backuplogdir,
-                                                               backuplogfilescount,
-                                                               enablediskstatslogging,
-                                                               True)
-                        if residue_events:
-                            log.info("Found few residue logs, updating the data object")
-                            event_data += residue_events
-                        # Reset file offset to start of file in case original file is rotated
-                        file_offset = 0
-                _set_cache_offset(path_to_logfile, file_offset)
-            else:
-                log.error('Unable to open log file for reading: %s', path_to_logfile)
-    else:
+    if not os.path.exists(path_to_logfile):
         log.error("Log file doesn't exists: %s", path_to_logfile)
-
-    return event_data
+        return
+
+    if os.stat(path_to_logfile).st_size > maxlogfilesizethreshold:
+        # This is done to handle scenarios where hubble process was in stopped state and
+        # osquery daemon was generating logs for that time frame.
+        # When hubble is started and this function gets executed,
+        # it might be possible that the log file is now huge.
+        # In this scenario hubble might take too much time to process the logs
+        # which may not be required
+        # To handle this, log file size is validated against max threshold size.
+        log.info(
+            "Log file size is above max threshold size that can be parsed by Hubble.")
+        log.info("Log file size: %f, max threshold: %f",
+                 os.stat(path_to_logfile).st_size,
+                 maxlogfilesizethreshold)
+        log.info("Rotating log and skipping parsing for this iteration")
+        _perform_log_rotation(path_to_logfile,
+                              file_offset,
+                              backuplogdir,
+                              backuplogfilescount,
+                              enablediskstatslogging,
+                              False)
+        # Reset file offset to start of file in case original file is rotated
+        _set_cache_offset(path_to_logfile, 0)
+        return
+
+    rotate_log = os.stat(path_to_logfile).st_size > logfilethresholdinbytes
+    for event_data, file_offset in _read_log_batches(path_to_logfile, offset, batch_size,
+                                                     complete_lines_only=not rotate_log):
+        yield event_data
+        _set_cache_offset(path_to_logfile, file_offset)
+
+    if rotate_log:
+        log.info('Log file size above threshold, '
+                 'going to rotate log file: %s', path_to_logfile)
+        residue_events = _perform_log_rotation(path_to_logfile,
+                                               file_offset,
+                                               backuplogdir,
+                                               backuplogfilescount,
+                                               enablediskstatslogging,
+                                               True)
+        if residue_events:
+            log.info("Found few residue logs, updating the data object")
+            for idx in range(0, len(residue_events), batch_size):
+                yield residue_events[idx:idx + batch_size]
+        # Reset file offset to start of file in case original file is rotated
+        _set_cache_offset(path_to_logfile, 0)
+
+
+def _read_log_batches(path_to_logfile, offset, batch_size, complete_lines_only=True):
+    """
+    Read path_to_logfile from offset, yielding (lines, offset after lines) in
+    batches of at most batch_size lines. The file is only held open while a
+    batch is read (File in Use on windows). With complete_lines_only, a last
+    line that osqueryd hasn't finished writing is left for the next run.
+    """
+    while True:
+        event_data = []
+        with open(path_to_logfile, 'rb') as file_des:
+            file_des.seek(offset)
+            while len(event_data) < batch_size:
+                line = file_des.readline()
+                if not line or (complete_lines_only and not line.endswith(b'\n')):
+                    break
+                offset += len(line)
+                if line.strip():
+                    event_data.append(line.decode('utf-8', 'replace'))
+        if not event_data:
+            return
+        yield event_data, offset
 
 
 def _set_cache_offset(path_to_logfile, offset):
@@ -16,10 +16,14 @@ import types
 import base64
 import collections
 import fnmatch
+import hashlib
 import os
 import re
+import stat
+import threading
 import yaml
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from hubblestack.exceptions import CommandExecutionError
 import hubblestack.utils.platform
@@ -81,9 +85,103 @@ def _maskname_filter(name):
         return 'IN_DELETE'
     return name
 
+# top level config keys that aren't paths
+NON_PATH_KEYS = ('return', 'checksum', 'stats', 'batch', 'verbose',
+                 'paths', 'refresh_interval', 'contents_size',
+                 'checksum_size', 'checksum_workers', 'checksum_debounce',
+                 'checksum_bytes_per_sec', 'checksum_deadline',
+                 'coalesce_seconds', 'coalesce_max_paths')
+
+class PathConfig(object):
+    """ The settings of one configured path, with its excludes compiled and
+        its mask resolved; see ConfigIndex
+    """
+    __slots__ = ('path', 'config', 'excludes', 'mask', 'recurse', 'auto_add',
+                 'watch_files', 'watch_new_files', 'contents')
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        if isinstance(config, dict):
+            mask = config.get('mask', DEFAULT_MASK)
+            if isinstance(mask, list):
+                r_mask = 0
+                for sub in mask:
+                    r_mask |= _get_mask(sub)
+            elif isinstance(mask, bytes):
+                r_mask = _get_mask(mask)
+            else:
+                r_mask = mask
+            mask = r_mask
+            self.watch_files = config.get('watch_files', False)
+            if self.watch_files:
+                # we're going to get dup modify events if watch_files is set
+                # and we still monitor modify for the dir
+                mask_and_modify = mask & pyinotify.IN_MODIFY
+                if mask_and_modify:
+                    log.debug("mask={0} -= mask & pyinotify.IN_MODIFY={1}" \
+                        " ==> {2}".format(
+                            mask,
+                            mask_and_modify,
+                            mask-mask_and_modify))
+                    mask -= mask_and_modify
+            self.mask = mask
+            self.excludes = _preprocess_excludes( config.get('exclude') )
+            self.recurse = config.get('recurse', False)
+            self.auto_add = config.get('auto_add', False)
+            self.watch_new_files = config.get('watch_new_files', False)
+            self.contents = config.get('contents', [])
+        else:
+            self.excludes = _no_excludes
+            self.mask = DEFAULT_MASK
+            self.recurse = self.auto_add = False
+            self.watch_files = self.watch_new_files = False
+            self.contents = []
+
+class ConfigIndex(object):
+    """ Everything process() needs to know about the configured paths,
+        computed once per config refresh rather than once per event:
+
+        * a PathConfig for each configured path
+        * a prefix trie of path components, resolving any path to the
+          configured path it falls under
+    """
+
+    def __init__(self, config):
+        self.entries = dict()
+        self.trie = dict()
+        for path in config:
+            if path in NON_PATH_KEYS:
+                continue
+            self.entries[path] = PathConfig(path, config[path])
+            if path.startswith('/') and path != '/':
+                node = self.trie
+                for part in path.split('/')[1:]:
+                    node = node.setdefault(part, {})
+                node[None] = path
+
+    def path_of_config(self, path):
+        """ the deepest configured path containing (absolute) path, or '/' """
+        node = self.trie
+        found = '/'
+        for part in path.split('/')[1:]:
+            node = node.get(part)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def get(self, path):
+        """ the PathConfig for a configured path (an empty one if unknown) """
+        entry = self.entries.get(path)
+        if entry is None:
+            entry = self.entries[path] = PathConfig(path, {})
+        return entry
+
 class ConfigManager(object):
     _config = {}
     _last_update = 0
+    _index = None
 
     @property
     def config(self):
@@ -101,8 +199,18 @@ class ConfigManager(object):
 
     @config.setter
     def config(self, v):
+        self.__class__._index = None
         return self.nc_config.update(v)
 
+    @property
+    def index(self):
+        """ the ConfigIndex of the current config (built on first use after
+            each refresh)
+        """
+        if self.__class__._index is None:
+            self.__class__._index = ConfigIndex(self.nc_config)
+        return self.__class__._index
+
     @property
     def last_update(self):
         return self.__class__._last_update
@@ -136,10 +244,9 @@ class ConfigManager(object):
         return c
 
     def path_of_config(self, path):
-        ncc = self.nc_config
-        while len(path)>1 and path not in ncc:
-            path = os.path.dirname(path)
-        return path
+        if path in self.nc_config:
+            return path
+        return self.index.path_of_config(path)
 
     def _abspathify(self):
         c = self.nc_config
@@ -148,6 +255,7 @@ class ConfigManager(object):
                 l = os.path.abspath(k)
                 if k != l:
                     c[l] = c.pop(k)
+                    self.__class__._index = None
 
     def update(self):
         config = self.nc_config
@@ -169,6 +277,7 @@ class ConfigManager(object):
         to_set['paths'] = config.get('paths')
         self.nc_config = to_set
         self._abspathify()
+        self.__class__._index = None
         if config.get('verbose'):
             log.debug('Pulsar config updated')
 
@@ -200,6 +309,16 @@ class PulsarWatchManager(pyinotify.WatchManager):
 
             for path in path_list:
                 wd = wm.get_wd(i) # search watch-list in an internal for loop
+
+        The watches are indexed both ways so that adding, removing and pruning
+        watches costs time in the number of watches affected, not the number
+        of watches held:
+
+        * watch_db:  path -> wd
+        * wd_db:     wd -> path
+        * parent_db: parent path -> set(child paths)
+        * child_db:  child path -> parent path
+        * root_db:   the watched paths that have no parent
     """
 
     def __init__(self, *a, **kw):
@@ -211,7 +330,10 @@ class PulsarWatchManager(pyinotify.WatchManager):
 
         self.__super.__init__(*a, **kw)
         self.watch_db  = dict()
+        self.wd_db     = dict()
         self.parent_db = dict()
+        self.child_db  = dict()
+        self.root_db   = set()
 
         self._last_config_update = 0
         self.update_config()
@@ -247,25 +369,49 @@ class PulsarWatchManager(pyinotify.WatchManager):
         for i in items:
             if items[i] > 0:
                 todo[i] = items[i]
-        self.watch_db.update(todo)
+        for path, wd in todo.items():
+            old_wd = self.watch_db.get(path)
+            if old_wd is not None and old_wd != wd and self.wd_db.get(old_wd) == path:
+                del self.wd_db[old_wd]
+            self.watch_db[path] = wd
+            self.wd_db[wd] = path
         if parent in todo:
             del todo[parent]
+            if parent not in self.child_db:
+                self.root_db.add(parent)
         if todo:
             if parent not in self.parent_db:
                 self.parent_db[parent] = set()
             self.parent_db[parent].update(todo)
+            for child in todo:
+                old_parent = self.child_db.get(child)
+                if old_parent is not None and old_parent != parent:
+                    self._unparent(child, old_parent)
+                self.child_db[child] = parent
+                self.root_db.discard(child)
+
+    def _unparent(self, child, parent):
+        children = self.parent_db.get(parent)
+        if children is not None:
+            children.discard(child)
+            if not children:
+                del self.parent_db[parent]
 
     def _get_wdl(self, *pathlist):
-        """ inverse pathlist and return a flat list of wd's for the paths and their child paths
-            probably O( (N+M)^2 ); use sparingly
+        """ translate pathlist (paths and/or wds) into a flat list of wd's for
+            the paths and their child paths
         """
-        super_list = self._listify_anything(pathlist,
-            [ x if isinstance(x,int) else self.parent_db.get(x) for x in self._iterate_anything(pathlist) ])
-        return self._listify_anything([ x if isinstance(x,int) else self.watch_db.get(x) for x in super_list ])
+        wdl = list()
+        for x in self._iterate_anything(pathlist):
+            if isinstance(x, int):
+                wdl.append(x)
+                continue
+            wdl.append(self.watch_db.get(x))
+            wdl.extend( self.watch_db.get(child) for child in self.parent_db.get(x, ()) )
+        return self._listify_anything(wdl)
 
     def _get_paths(self, *wdl):
-        wdl = self._listify_anything(wdl)
-        return self._listify_anything([ k for k,v in self.watch_db.items() if v in wdl ])
+        return self._listify_anything([ self.wd_db.get(wd) for wd in self._iterate_anything(wdl) ])
 
     def update_config(self):
         """ (re)check the config files for inotify_limits:
@@ -455,11 +601,9 @@ class PulsarWatchManager(pyinotify.WatchManager):
         return res
 
     def _prune_paths_to_stop_watching(self):
-        inverse_parent_db = {}
-        for k,v in self.parent_db.items():
-            for i in v:
-                inverse_parent_db[i] = k
-        for dirpath in self.watch_db:
+        # only parents and parentless watches can be unconfigured; the
+        # children are decided by their parent's config
+        for dirpath in set(self.parent_db).union(self.root_db):
             pc = self.cm.path_config(dirpath, falsifyable=True)
             if pc is False:
                 if dirpath in self.parent_db:
@@ -468,17 +612,21 @@ class PulsarWatchManager(pyinotify.WatchManager):
                     for item in self.parent_db[dirpath]:
                         yield item
                     yield dirpath
-                elif dirpath not in inverse_parent_db:
+                elif dirpath not in self.child_db:
                     # this doesn't seem to be in parent_db or the reverse
                     # probably nolonger configured
                     yield dirpath
             elif dirpath in self.parent_db:
+                keep_dirs = pc['recurse']
+                keep_files = pc['watch_files'] or pc['watch_new_files']
+                if keep_dirs and keep_files:
+                    continue
                 for item in self.parent_db[dirpath]:
                     if os.path.isdir(item):
-                        if not pc['recurse']:
+                        if not keep_dirs:
                             # there's config for this dir, but it nolonger recurses
                             yield item
-                    elif not pc['watch_files'] and not pc['watch_new_files']:
+                    elif not keep_files:
                         # there's config for this dir, but it nolonger watches files
                         yield item
 
@@ -491,29 +639,26 @@ class PulsarWatchManager(pyinotify.WatchManager):
         self.rm_watch(to_rm)
 
     def _rm_db(self, wd):
-        plist = set( self._get_paths(wd) )
-        for dirpath in plist:
-            if dirpath in self.watch_db:
-                del self.watch_db[dirpath]
-            if dirpath in self.parent_db:
-                del self.parent_db[dirpath]
-
-        # in the interests of being really really thourough make sure none of
-        # the parent_db sets contain any of the removed dirpaths
-        # and then make sure there's no empty sets in the parent_db
-        to_fully_delete = set()
-        for d,s in self.parent_db.items():
-            s -= plist
-            if not s:
-                to_fully_delete.add(d)
-        for item in to_fully_delete:
-            del self.parent_db[item]
+        for dirpath in self._get_paths(wd):
+            wd = self.watch_db.pop(dirpath, None)
+            if self.wd_db.get(wd) == dirpath:
+                del self.wd_db[wd]
+            self.root_db.discard(dirpath)
+            # children of a removed parent are left without one
+            for child in self.parent_db.pop(dirpath, ()):
+                if self.child_db.get(child) == dirpath:
+                    del self.child_db[child]
+                    if child in self.watch_db:
+                        self.root_db.add(child)
+            parent = self.child_db.pop(dirpath, None)
+            if parent is not None:
+                self._unparent(dirpath, parent)
 
     def del_watch(self, wd):
         """ remove a watch from the watchmanager database
         """
         if not isinstance(wd, int):
-            wd = self._get_wdl(wd)[0]
+            wd = self.watch_db[wd]
         self.__super.del_watch(wd)
         self._rm_db(wd)
 
@@ -536,6 +681,298 @@ def _get_notifier():
         __context__['pulsar.notifier'] = pyinotify.Notifier(wm, _enqueue)
     return __context__['pulsar.notifier']
 
+def _stat_key(st):
+    """ the part of a stat result that tells us a file's contents may have changed """
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+class _ByteBudget(object):
+    """ share a bytes-per-second read budget between the hashing threads
+        (a rate of 0 or less means unlimited)
+    """
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + count / float(self.rate)
+        if start > now:
+            time.sleep(start - now)
+
+def _hash_file(path, sum_type, budget, chunk_size=65536):
+    """ return ((ino,size,mtime), checksum) of path, or None if it can't be read """
+    try:
+        hash_obj = hashlib.new(sum_type)
+        with open(path, 'rb') as fh:
+            key = _stat_key(os.fstat(fh.fileno()))
+            for chunk in iter(lambda: fh.read(chunk_size), b''):
+                budget.consume(len(chunk))
+                hash_obj.update(chunk)
+        return key, hash_obj.hexdigest()
+    except Exception as e:
+        log.debug('Could not checksum {0}: {1}'.format(path, e))
+        return None
+
+class ChecksumWorker(object):
+    """ Checksum files for process() on a small thread pool rather than in
+        the event loop.
+
+        Events that need a checksum are held back with request() and handed
+        back by poll() once their checksum is ready, or after the deadline
+        with checksum_pending set. Requests for the same path within the
+        debounce window share one hash, checksums are cached by path and
+        reused while (inode, size, mtime) are unchanged, and the hashing
+        threads together read at most bytes_per_sec.
+
+        With workers=0 the files are hashed inside poll() instead.
+    """
+    max_cached = 10000
+
+    def __init__(self, workers=2, debounce=1, bytes_per_sec=0, deadline=30):
+        self.workers = workers
+        self.debounce = debounce
+        self.deadline = deadline
+        self.budget = _ByteBudget(bytes_per_sec)
+        self.pool = None
+        self.seq = 0
+        self.sums = dict()    # path -> ((ino,size,mtime), sum_type, checksum)
+        self.waiting = dict() # path -> [due, sum_type, seq]
+        self.running = dict() # path -> (sum_type, seq, future)
+        self.held = list()    # events waiting for their checksum, in order
+
+    def configure(self, config):
+        workers = max(0, int(config.get('checksum_workers', 2)))
+        if workers != self.workers and self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        self.workers = workers
+        self.debounce = config.get('checksum_debounce', 1)
+        self.deadline = config.get('checksum_deadline', 30)
+        self.budget.rate = config.get('checksum_bytes_per_sec', 0)
+
+    def cached(self, path, key, sum_type):
+        """ the known checksum of path if it hasn't changed since, else None """
+        ent = self.sums.get(path)
+        if ent and ent[0] == key and ent[1] == sum_type:
+            return ent[2]
+
+    def request(self, sub, path, sum_type, contents_size=None, now=None):
+        """ hold sub until path is checksummed; with a contents_size, also
+            fetch the contents of files smaller than that whose checksum changed
+        """
+        if now is None:
+            now = time.time()
+        self.seq += 1
+        ent = self.waiting.get(path)
+        if ent is None:
+            self.waiting[path] = [now + self.debounce, sum_type, self.seq]
+        else:
+            ent[1] = sum_type
+            ent[2] = self.seq
+        self.held.append({'sub': sub, 'path': path, 'sum_type': sum_type, 'seq': self.seq,
+            'expires': now + self.deadline, 'contents_size': contents_size})
+
+    def _store(self, path, sum_type, seq, res):
+        old = self.sums.get(path)
+        if res is not None:
+            if len(self.sums) >= self.max_cached:
+                self.sums.clear()
+            self.sums[path] = (res[0], sum_type, res[1])
+        for item in self.held:
+            if item['path'] == path and item['seq'] <= seq and 'result' not in item:
+                item['result'] = res
+                item['old'] = old[2] if old else None
+
+    def _start(self, now):
+        for path, sum_type, seq, future in [ (k,) + v for k,v in self.running.items() ]:
+            if future.done():
+                del self.running[path]
+                self._store(path, sum_type, seq, future.result())
+        for path in sorted(self.waiting, key=lambda x: self.waiting[x][0]):
+            due, sum_type, seq = self.waiting[path]
+            if due > now:
+                break
+            if path in self.running:
+                # wait for the current hash of this path to finish first
+                continue
+            if self.workers < 1:
+                del self.waiting[path]
+                self._store(path, sum_type, seq, _hash_file(path, sum_type, self.budget))
+                continue
+            if len(self.running) >= self.workers:
+                break
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.workers)
+            del self.waiting[path]
+            self.running[path] = (sum_type, seq,
+                self.pool.submit(_hash_file, path, sum_type, self.budget))
+
+    def _finish(self, item):
+        sub = item['sub']
+        sub['checksum_type'] = item['sum_type']
+        if item['result'] is None:
+            return sub
+        key, checksum = item['result']
+        sub['checksum'] = checksum
+        # File contents? Don't fetch contents for any file over
+        # contents_size or where the checksum is unchanged
+        if item['contents_size'] is not None and key[1] < item['contents_size'] \
+                and item['old'] != checksum:
+            pathname = item['path']
+            try:
+                with open(pathname, 'r') as f:
+                    sub['contents'] = base64.b64encode(f.read())
+            except Exception as e:
+                log.debug('Could not get file contents for {0}: {1}'.format(pathname, e))
+        return sub
+
+    def poll(self, now=None):
+        """ start the hashes that are due and return the held events that are
+            done (or past their deadline)
+        """
+        if now is None:
+            now = time.time()
+        self._start(now)
+        ret = list()
+        held = list()
+        for item in self.held:
+            if 'result' in item:
+                ret.append(self._finish(item))
+            elif item['expires'] <= now:
+                item['sub']['checksum_type'] = item['sum_type']
+                item['sub']['checksum_pending'] = True
+                ret.append(item['sub'])
+            else:
+                held.append(item)
+        self.held = held
+        return ret
+
+def _get_checksum_worker(config):
+    """
+    Check the context for the checksum worker and construct it if not present
+    """
+    if 'pulsar.checksum_worker' not in __context__:
+        __context__['pulsar.checksum_worker'] = ChecksumWorker()
+    worker = __context__['pulsar.checksum_worker']
+    worker.configure(config)
+    return worker
+
+def _add_file_info(sub, pconf, config):
+    """
+    Add the checksum, stats and size of sub['path'] to the event (as
+    configured). Returns False when the event was handed to the checksum
+    worker, which emits it once the checksum is ready.
+    """
+    pathname = sub['path']
+    # one stat for the checksum, stats and size
+    try:
+        st = os.stat(pathname)
+    except OSError:
+        st = None
+    is_file = st is not None and stat.S_ISREG(st.st_mode)
+    emit = True
+
+    if config.get('checksum', False) and is_file:
+        # Don't checksum any file over 100MB
+        if st.st_size < config.get('checksum_size', 104857600):
+            sum_type = config['checksum']
+            if not isinstance(sum_type, str):
+                sum_type = 'sha256'
+            worker = _get_checksum_worker(config)
+            checksum = worker.cached(pathname, _stat_key(st), sum_type)
+            if checksum is None:
+                # emitted by worker.poll() (in this or a later sweep)
+                contents_size = None
+                if pathname in pconf.contents or os.path.dirname(pathname) in pconf.contents:
+                    contents_size = config.get('contents_size', 20480)
+                worker.request(sub, pathname, sum_type, contents_size)
+                emit = False
+            else:
+                # unchanged since it was last checksummed, so no contents either
+                sub['checksum'] = checksum
+                sub['checksum_type'] = sum_type
+
+    if config.get('stats', False):
+        if st is not None:
+            sub['stats'] = __mods__['file.stats'](pathname)
+        else:
+            sub['stats'] = {}
+        if is_file:
+            sub['size'] = st.st_size
+
+    return emit
+
+class EventCoalescer(object):
+    """ Merge the events for a path that arrive within window seconds of its
+        first one into a single event: the latest one, with the set of
+        changes seen and their count. At most max_paths paths are held; past
+        that the oldest are let go early.
+    """
+
+    def __init__(self, window=0, max_paths=10000):
+        self.window = window
+        self.max_paths = max_paths
+        self.held = collections.OrderedDict() # path -> [first_seen, sub, pconf, changes, count]
+
+    def add(self, sub, pconf, now=None):
+        """ hold (or merge) an event; returns the [(sub, pconf)] pushed out
+            by the max_paths limit
+        """
+        if now is None:
+            now = time.time()
+        path = sub['path']
+        ent = self.held.get(path)
+        if ent is None:
+            self.held[path] = [now, sub, pconf, set([sub['change']]), 1]
+        else:
+            ent[1:3] = sub, pconf
+            ent[3].add(sub['change'])
+            ent[4] += 1
+        ret = list()
+        while len(self.held) > self.max_paths:
+            ret.append(self._pop())
+        return ret
+
+    def _pop(self):
+        _, (_, sub, pconf, changes, count) = self.held.popitem(last=False)
+        sub['changes'] = sorted(changes)
+        sub['count'] = count
+        return sub, pconf
+
+    def flush(self, now=None):
+        """ return the [(sub, pconf)] whose window has passed """
+        if now is None:
+            now = time.time()
+        ret = list()
+        # the windows are all the same length, so the oldest are first to go
+        while self.held and next(iter(self.held.values()))[0] + self.window <= now:
+            ret.append(self._pop())
+        return ret
+
+def _get_coalescer(config):
+    """
+    Return the event coalescer from the context (constructing it if
+    coalesce_seconds is set), or None when coalescing is off and nothing is
+    left in it
+    """
+    window = config.get('coalesce_seconds', 0)
+    coalescer = __context__.get('pulsar.coalescer')
+    if coalescer is None:
+        if not window:
+            return None
+        coalescer = __context__['pulsar.coalescer'] = EventCoalescer()
+    coalescer.window = window
+    coalescer.max_paths = config.get('coalesce_max_paths', 10000)
+    return coalescer
+
+def _no_excludes(_):
+    return False
+
 def _preprocess_excludes(excludes):
     """
     Wrap excludes in simple decision curry functions.
@@ -543,7 +980,7 @@ def _preprocess_excludes(excludes):
 
     # silently discard non-list excludes
     if not isinstance(excludes, (list,tuple)) or not excludes:
-        return lambda x: False
+        return _no_excludes
 
     # wrap whatever in a decision problem
     def re_wrapper(robj):
@@ -553,8 +990,9 @@ def _preprocess_excludes(excludes):
         return _wrapped
     def fn_wrapper(rpat):
         # log.debug('wrapping fnmatch {0}'.format(rpat))
+        robj = re.compile(fnmatch.translate(rpat))
         def _wrapped(val):
-            return bool(fnmatch.fnmatch(rpat, val))
+            return bool(robj.match(val))
         return _wrapped
     def str_wrapper(rstr):
         # log.debug('wrapping strmatch {0}'.format(rstr))
@@ -665,6 +1103,12 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
           slack:
             batch: False  # overrides the global setting
         checksum: sha256
+        checksum_workers: 2
+        checksum_debounce: 1
+        checksum_bytes_per_sec: 0
+        checksum_deadline: 30
+        coalesce_seconds: 0
+        coalesce_max_paths: 10000
         stats: True
         batch: True
         contents_size: 20480
@@ -718,6 +1162,22 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
       decide, "Don't fetch contents for any file over contents_size or where
       the checksum is unchanged."
 
+    Checksums are computed in the background by checksum_workers threads
+    (default 2) and the events wait for them: changes to the same file within
+    checksum_debounce seconds (default 1) share one checksum, the threads read
+    at most checksum_bytes_per_sec bytes per second between them (default 0,
+    unlimited), and events still without a checksum after checksum_deadline
+    seconds (default 30) are sent with checksum_pending: True instead.
+    Checksums are remembered and reused while a file's inode, size and mtime
+    are unchanged. checksum_workers: 0 with checksum_debounce: 0 computes them
+    during the sweep instead, as older versions did.
+
+    With coalesce_seconds set, the events for a path within that many seconds
+    of its first one are sent as one event (the latest) listing the changes
+    seen and how many events were merged. Checksums and stats are taken when
+    the window closes. At most coalesce_max_paths (default 10000) paths are
+    held at once; beyond that the oldest are sent early.
+
     If pillar/grains/minion config key `hubblestack:pulsar:maintenance` is set to
     True, then changes will be discarded.
     """
@@ -738,6 +1198,7 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
 
     ret = []
     notifier = _get_notifier()
+    coalescer = _get_coalescer(config)
     wm = notifier._watch_manager
     update_watches = cm.freshness(2)
     initial_count = len(wm.watch_db)
@@ -778,7 +1239,8 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
             # wpath = event.path : the path of the watch that triggered (not actually populated
             #                    : in wpath)
 
-            excludes = _preprocess_excludes( config[cpath].get('exclude') )
+            pconf = cm.index.get(cpath)
+            excludes = pconf.excludes
             _append = not excludes(pathname)
 
             if _append:
@@ -790,48 +1252,18 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
                         'name': basename, # goes to file_name in splunk
                         'pulsar_config': pulsar_config}
 
-                if config.get('checksum', False) and os.path.isfile(pathname):
-                    if 'pulsar_checksums' not in __context__:
-                        __context__['pulsar_checksums'] = {}
-                    # Don't checksum any file over 100MB
-                    if os.path.getsize(pathname) < config.get('checksum_size', 104857600):
-                        sum_type = config['checksum']
-                        if not isinstance(sum_type, str):
-                            sum_type = 'sha256'
-                        old_checksum = __context__['pulsar_checksums'].get(pathname)
-                        new_checksum = __mods__['file.get_hash'](pathname, sum_type)
-                        __context__['pulsar_checksums'][pathname] = new_checksum
-                        sub['checksum'] = __context__['pulsar_checksums'][pathname]
-                        sub['checksum_type'] = sum_type
-
-                        # File contents? Don't fetch contents for any file over
-                        # 20KB or where the checksum is unchanged
-                        if (pathname in config[cpath].get('contents', []) or
-                                os.path.dirname(pathname) in config[cpath].get('contents', [])) \
-                                and os.path.getsize(pathname) < config.get('contents_size', 20480) \
-                                and old_checksum != new_checksum:
-                            try:
-                                with open(pathname, 'r') as f:
-                                    sub['contents'] = base64.b64encode(f.read())
-                            except Exception as e:
-                                log.debug('Could not get file contents for {0}: {1}'
-                                          .format(pathname, e))
-
-                if cm.config.get('stats', False):
-                    if os.path.exists(pathname):
-                        sub['stats'] = __mods__['file.stats'](pathname)
-                    else:
-                        sub['stats'] = {}
-                    if os.path.isfile(pathname):
-                        sub['size'] = os.path.getsize(pathname)
-
                 if event.mask != pyinotify.IN_IGNORED:
-                    ret.append(sub)
+                    if coalescer is not None and coalescer.window > 0:
+                        # file info is added once the merged event leaves the window
+                        for csub, cpconf in coalescer.add(sub, pconf):
+                            if _add_file_info(csub, cpconf, config):
+                                ret.append(csub)
+                    elif _add_file_info(sub, pconf, config):
+                        ret.append(sub)
 
                 if not event.mask & pyinotify.IN_ISDIR:
                     if event.mask & pyinotify.IN_CREATE:
-                        watch_this = config[cpath].get('watch_new_files', False) \
-                            or config[cpath].get('watch_files', False)
+                        watch_this = pconf.watch_new_files or pconf.watch_files
                         if watch_this:
                             if not excludes(pathname):
                                 log.debug("add file-watch path={0} mask={1}".format(pathname,
@@ -843,46 +1275,28 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
                 log.debug('Excluding {0} from event for {1}'.format(pathname, cpath))
         dt.fin()
 
+    if coalescer is not None:
+        for sub, pconf in coalescer.flush():
+            if _add_file_info(sub, pconf, config):
+                ret.append(sub)
+
+    if 'pulsar.checksum_worker' in __context__:
+        dt.mark('checksums')
+        ret.extend(__context__['pulsar.checksum_worker'].poll())
+        dt.fin()
+
     if update_watches:
         dt.mark('update_watches')
         log.debug("update watches")
         # Update existing watches and add new ones
         for path in config:
-            excludes = lambda x: False
-            if path in ['return', 'checksum', 'stats', 'batch', 'verbose',
-                        'paths', 'refresh_interval', 'contents_size',
-                        'checksum_size']:
+            if path in NON_PATH_KEYS:
                 continue
-            if isinstance(config[path], dict):
-                mask = config[path].get('mask', DEFAULT_MASK)
-                watch_files = config[path].get('watch_files', False)
-                if watch_files:
-                    # we're going to get dup modify events if watch_files is set
-                    # and we still monitor modify for the dir
-                    mask_and_modify = mask & pyinotify.IN_MODIFY
-                    if mask_and_modify:
-                        log.debug("mask={0} -= mask & pyinotify.IN_MODIFY={1}" \
-                            " ==> {2}".format(
-                                mask,
-                                mask_and_modify,
-                                mask-mask_and_modify))
-                        mask -= mask_and_modify
-                excludes = _preprocess_excludes( config[path].get('exclude') )
-                if isinstance(mask, list):
-                    r_mask = 0
-                    for sub in mask:
-                        r_mask |= _get_mask(sub)
-                elif isinstance(mask, bytes):
-                    r_mask = _get_mask(mask)
-                else:
-                    r_mask = mask
-                mask = r_mask
-                rec = config[path].get('recurse', False)
-                auto_add = config[path].get('auto_add', False)
-            else:
-                mask = DEFAULT_MASK
-                rec = False
-                auto_add = False
+            pconf = cm.index.get(path)
+            excludes = pconf.excludes
+            mask = pconf.mask
+            rec = pconf.recurse
+            auto_add = pconf.auto_add
 
             if os.path.isfile(path) and not wm.get_wd(path):
                 # We were not previously watching this file generate a fake
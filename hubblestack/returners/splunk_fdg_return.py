@@ -46,7 +46,7 @@ import socket
 import re
 import json
 import logging
-from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+from hubblestack.hec import get_hec, get_splunk_options, make_hec_args
 
 
 _MAX_CONTENT_BYTES = 100000
@@ -90,7 +90,7 @@ def returner(ret):
                 pass
 
             args, kwargs = make_hec_args(opts)
-            hec = http_event_collector(*args, **kwargs)
+            hec = get_hec(*args, **kwargs)
 
             for fdg_info, fdg_results in data.items():
 
@@ -18,7 +18,7 @@ event collector. Required config/pillar settings:
 
 import time
 import hubblestack.utils.stdrec as stdrec
-from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+from hubblestack.hec import get_hec, get_splunk_options, make_hec_args
 
 
 def _get_key(dat, key, default_value=None):
@@ -44,14 +44,14 @@ def _get_key(dat, key, default_value=None):
 
 def _build_hec(opts):
     """
-    Extract the appropriate parameters from opts,
-    create and return the http_event_collector
+    Extract the appropriate parameters from opts and return the (shared)
+    http_event_collector for them from hubblestack.hec.registry
 
     opts
         dict containing Splunk options to be passed to the `http_event_collector`
     """
     args, kwargs = make_hec_args(opts)
-    hec = http_event_collector(*args, **kwargs)
+    hec = get_hec(*args, **kwargs)
     return hec
 
 
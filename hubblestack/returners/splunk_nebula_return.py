@@ -44,7 +44,7 @@ import json
 import logging
 import time
 from datetime import datetime
-from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+from hubblestack.hec import get_hec, get_splunk_options, make_hec_args
 
 
 _MAX_CONTENT_BYTES = 100000
@@ -81,7 +81,7 @@ def returner(ret):
 
             # Set up the collector
             args, kwargs = make_hec_args(opts)
-            hec = http_event_collector(*args, **kwargs)
+            hec = get_hec(*args, **kwargs)
 
             for query in ret['return']:
                 for query_name, query_results in query.items():
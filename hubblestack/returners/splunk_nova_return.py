@@ -44,7 +44,7 @@ import socket
 import json
 import logging
 
-from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+from hubblestack.hec import get_hec, get_splunk_options, make_hec_args
 
 log = logging.getLogger(__name__)
 
@@ -71,7 +71,7 @@ def returner(ret):
             custom_fields = opts['custom_fields']
             # Set up the collector
             args, kwargs = make_hec_args(opts)
-            hec = http_event_collector(*args, **kwargs)
+            hec = get_hec(*args, **kwargs)
             host_args['hec'] = hec
 
             # Failure checks
@@ -45,7 +45,7 @@ import logging
 import time
 import copy
 from datetime import datetime
-from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+from hubblestack.hec import get_hec, get_splunk_options, make_hec_args
 
 _MAX_CONTENT_BYTES = 100000
 HTTP_EVENT_COLLECTOR_DEBUG = False
@@ -72,7 +72,7 @@ def returner(ret):
             logging.debug('Options: %s', json.dumps(opts))
             # Set up the collector
             args, kwargs = make_hec_args(opts)
-            hec = http_event_collector(*args, **kwargs)
+            hec = get_hec(*args, **kwargs)
             for query_results in data:
                 event = _generate_event(host_args=host_args, query_name=query_results['name'],
                                         query_results=query_results, cloud_details=cloud_details)
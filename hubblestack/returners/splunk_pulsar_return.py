@@ -45,7 +45,7 @@ import json
 import logging
 import os
 from collections import defaultdict
-from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
+from hubblestack.hec import get_hec, get_splunk_options, make_hec_args
 
 log = logging.getLogger(__name__)
 
@@ -83,7 +83,7 @@ def returner(ret):
                 pass
             # Set up the collector
             args, kwargs = make_hec_args(opts)
-            hec = http_event_collector(*args, **kwargs)
+            hec = get_hec(*args, **kwargs)
 
             for alert in alerts:
                 if 'change' in alert:  # Linux, normal pulsar
@@ -241,6 +241,10 @@ def _build_linux_event(alert, change):
              'pulsar_config': alert['pulsar_config']}
     if 'contents' in alert:
         event['contents'] = alert['contents']
+    if 'count' in alert:
+        # coalesced events
+        event['change_count'] = alert['count']
+        event['changes'] = [actions.get(x, x) for x in alert.get('changes', [])]
     # Gather more data if the change wasn't a delete
     if 'stats' in alert and isinstance(alert['stats'], dict):
         stats = alert['stats']
@@ -256,6 +260,9 @@ def _build_linux_event(alert, change):
             if chk:
                 event['file_hash'] = chk
                 event['file_hash_type'] = alert.get('checksum_type', 'unknown')
+            elif alert.get('checksum_pending'):
+                event['file_hash_pending'] = True
+                event['file_hash_type'] = alert.get('checksum_type', 'unknown')
 
     return event
 
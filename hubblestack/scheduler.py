@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+The job scheduler behind hubblestack.daemon.schedule
+
+The daemon used to walk every job of the schedule each
+scheduler_sleep_frequency (0.5s), validating it again and, for cron jobs,
+parsing the cron expression again. Jobs are now validated and compiled once,
+whenever the schedule (or the loaded modules) change, and kept in a heap
+ordered by their next run time, so the daemon can sleep until the earliest
+one is due:
+
+    SCHEDULER.load(schedule_config, __mods__, __opts__)
+    SCHEDULER.run_pending(execute)
+    time.sleep(SCHEDULER.next_run() - time.time())
+
+On top of the job options described in hubblestack.daemon.schedule, a job
+can say what happens when it falls behind:
+
+    missed
+        ``run_once`` (the default) runs a job that is late, however many
+        runs it missed, once; ``skip`` skips a run that is more than one
+        interval late and waits for the next one. Defaults to the
+        ``schedule_missed`` option.
+
+    overlap
+        ``queue`` (the default) runs a job that took longer than its interval
+        again right away; ``skip`` skips the runs that fell due while it was
+        running. Defaults to the ``schedule_overlap`` option.
+
+hubblestack.status tracks the runs of each job (``job.<name>``), how late they
+started (the duration of ``job.<name>.lag``) and how many took longer than
+the job's interval (the count of ``job.<name>.overrun``). stats() returns the
+same figures.
+"""
+
+import copy
+import heapq
+import logging
+import math
+import random
+import socket
+import time
+from datetime import datetime
+
+from croniter import croniter
+
+import hubblestack.status
+
+log = logging.getLogger(__name__)
+hubble_status = hubblestack.status.HubbleStatus(__name__)
+
+# cron expressions are turned into an interval from this point in time
+CRON_BASE = datetime(2018, 1, 1, 0, 0)
+MISSED_POLICIES = ('run_once', 'skip')
+OVERLAP_POLICIES = ('queue', 'skip')
+
+
+class ScheduleError(Exception):
+    """ raised for a scheduled job that can't be run as configured """
+
+
+def getsecondsbycronexpression(base, cron_exp):
+    """
+    this function will return the seconds according to the cron
+    expression provided in the hubble config
+    """
+    cron_iter = croniter(cron_exp, base)
+    next_datetime = cron_iter.get_next(datetime)
+    epoch_base_datetime = time.mktime(base.timetuple())
+    epoch_datetime = time.mktime(next_datetime.timetuple())
+    seconds = int(epoch_datetime) - int(epoch_base_datetime)
+    return seconds
+
+
+def getlastrunbycron(base, seconds, current_time=None):
+    """
+    this function will use the cron_exp provided in the hubble config to
+    execute the hubble processes as per the scheduled cron time
+    """
+    epoch_base_datetime = time.mktime(base.timetuple())
+    if current_time is None:
+        current_time = time.time()
+    # the last whole interval since base that ends at or after current_time
+    steps = max(0, int(math.ceil((current_time - epoch_base_datetime) / float(seconds))) - 1)
+    return epoch_base_datetime + steps * seconds
+
+
+def getlastrunbybuckets(buckets, seconds):
+    """
+    this function will use the host's ip to place the host in a bucket
+    where each bucket executes hubble processes at a different time
+    """
+    buckets = int(buckets) if int(buckets) != 0 else 256
+    host_ip = socket.gethostbyname(socket.gethostname())
+    ips = host_ip.split('.')
+    bucket_sum = (int(ips[0]) * 256 * 256 * 256) + (int(ips[1]) * 256 * 256) + \
+                 (int(ips[2]) * 256) + int(ips[3])
+    bucket = bucket_sum % buckets
+    log.debug('bucket number is %d out of %d', bucket, buckets)
+    current_time = time.time()
+    base_time = seconds * (math.floor(current_time / seconds))
+    splay = seconds / buckets
+    seconds_between_buckets = splay
+    random_int = random.randint(0, splay - 1) if splay != 0 else 0
+    bucket_execution_time = base_time + (seconds_between_buckets * bucket) + random_int
+    if bucket_execution_time < current_time:
+        last_run = bucket_execution_time
+    else:
+        last_run = bucket_execution_time - seconds
+    return last_run
+
+
+class Job(object):
+    """ a validated scheduled job and its run statistics """
+
+    def __init__(self, name, jobdata, functions, opts):
+        if not jobdata or not isinstance(jobdata, dict):
+            raise ScheduleError('does not have valid data')
+        if 'function' not in jobdata or 'seconds' not in jobdata:
+            raise ScheduleError('is missing a ``function`` or ``seconds`` argument')
+        self.name = name
+        self.jobdata = jobdata
+        self.function = jobdata['function']
+        if self.function not in functions:
+            raise ScheduleError('has a function {0} which could not be found.'.format(self.function))
+        try:
+            if 'cron' in jobdata:
+                seconds = getsecondsbycronexpression(CRON_BASE, jobdata['cron'])
+            else:
+                seconds = int(jobdata['seconds'])
+            self.splay = int(jobdata.get('splay', 0))
+            self.min_splay = int(jobdata.get('min_splay', 0))
+        except (ValueError, KeyError, TypeError):
+            raise ScheduleError('has an invalid value for seconds, splay or cron.')
+        # a job can't come due more often than the daemon used to look at it
+        self.seconds = max(seconds, float(opts.get('scheduler_sleep_frequency', 0.5)))
+        self.args = jobdata.get('args', [])
+        if not isinstance(self.args, list):
+            raise ScheduleError('has args not formed as a list: {0}'.format(self.args))
+        self.kwargs = jobdata.get('kwargs', {})
+        if not isinstance(self.kwargs, dict):
+            raise ScheduleError('has kwargs not formed as a dict: {0}'.format(self.kwargs))
+        returners = jobdata.get('returner', [])
+        self.returners = returners if isinstance(returners, list) else [returners]
+        self.missed = jobdata.get('missed', opts.get('schedule_missed', 'run_once'))
+        self.overlap = jobdata.get('overlap', opts.get('schedule_overlap', 'queue'))
+        if self.missed not in MISSED_POLICIES or self.overlap not in OVERLAP_POLICIES:
+            raise ScheduleError('has an invalid missed or overlap policy.')
+
+        self.next_run = None
+        self.stats = {'runs': 0, 'last_run': None, 'lag': 0, 'max_lag': 0, 'duration': 0,
+                      'overruns': 0, 'skipped': 0}
+        for resource in ('', '.lag', '.overrun'):
+            hubble_status.add_resource('job.' + name + resource)
+
+    def first_run(self, now):
+        """ when the job should run first after the daemon starts """
+        seconds = self.seconds
+        if self.jobdata.get('run_on_start', False):
+            if self.splay:
+                # Run `splay` seconds in the future
+                return now + random.randint(self.min_splay, self.splay)
+            # Run now
+            return now
+        if self.splay:
+            # Run `seconds + splay` seconds in the future
+            return now + random.randint(self.min_splay, self.splay) + seconds
+        if 'buckets' in self.jobdata:
+            # Place the host in a bucket and fix the execution time.
+            last_run = getlastrunbybuckets(self.jobdata['buckets'], seconds)
+            log.debug('last_run according to bucket is %s', last_run)
+            return last_run + seconds
+        if 'cron' in self.jobdata:
+            # execute the hubble process based on cron expression
+            return getlastrunbycron(CRON_BASE, seconds, now) + seconds
+        # Run in `seconds` seconds.
+        return now + seconds
+
+
+class Scheduler(object):
+    """ scheduled jobs in a heap ordered by their next run time """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.jobs = dict()
+        self.heap = list()
+        self._config = None
+        self._functions = None
+
+    def load(self, schedule_config, functions, opts):
+        """
+        Compile the jobs of schedule_config, unless neither it nor functions
+        (the loaded modules) changed since the last load. Jobs whose
+        definition didn't change keep their next run time and statistics.
+        """
+        if functions is self._functions and schedule_config == self._config:
+            return
+        now = self.clock()
+        jobs = dict()
+        for jobname, jobdata in schedule_config.items():
+            try:
+                job = Job(jobname, jobdata, functions, opts)
+            except ScheduleError as exc:
+                log.error('Scheduled job %s %s', jobname, exc)
+                continue
+            old = self.jobs.get(jobname)
+            if old is not None and (self._config or {}).get(jobname) == jobdata:
+                job.next_run = old.next_run
+                job.stats = old.stats
+            else:
+                job.next_run = job.first_run(now)
+            jobs[jobname] = job
+        self.jobs = jobs
+        self.heap = [(job.next_run, name) for name, job in jobs.items()]
+        heapq.heapify(self.heap)
+        self._config = copy.deepcopy(schedule_config)
+        self._functions = functions
+
+    def next_run(self):
+        """ the time the next job is due, or None without any jobs """
+        return self.heap[0][0] if self.heap else None
+
+    def _pop_due(self, now):
+        if self.heap and self.heap[0][0] <= now:
+            _, name = heapq.heappop(self.heap)
+            return self.jobs[name]
+        return None
+
+    def run_pending(self, execute):
+        """
+        Run the jobs that are due, each at most once, in the order they fell
+        due; execute(job) does the actual work. Returns the number of jobs run.
+        """
+        count = 0
+        # jobs that come due again while this runs wait for the next call
+        due_by = self.clock()
+        job = self._pop_due(due_by)
+        while job is not None:
+            start = self.clock()
+            lag = start - job.next_run
+            stats = job.stats
+            if job.missed == 'skip' and lag > job.seconds:
+                log.info('Scheduled job %s is %ds late, skipping this run', job.name, lag)
+                stats['skipped'] += 1
+                job.next_run += math.ceil(lag / job.seconds) * job.seconds
+            else:
+                hubble_status.mark('job.{0}.lag'.format(job.name), timestamp=job.next_run).fin()
+                stat_handle = hubble_status.mark('job.' + job.name)
+                try:
+                    execute(job)
+                except Exception:
+                    log.error('Exception in running job: %s; continuing with next job...',
+                              job.name, exc_info=True)
+                stat_handle.fin()
+                count += 1
+                duration = self.clock() - start
+                stats['runs'] += 1
+                stats['last_run'] = start
+                stats['lag'] = lag
+                stats['max_lag'] = max(stats['max_lag'], lag)
+                stats['duration'] = duration
+                job.next_run = start + job.seconds
+                if duration > job.seconds:
+                    log.warning('Scheduled job %s took %ds, longer than its %ds interval',
+                                job.name, duration, job.seconds)
+                    hubble_status.mark('job.{0}.overrun'.format(job.name))
+                    stats['overruns'] += 1
+                    if job.overlap == 'skip':
+                        skipped = int(duration // job.seconds)
+                        stats['skipped'] += skipped
+                        job.next_run += skipped * job.seconds
+            heapq.heappush(self.heap, (job.next_run, job.name))
+            job = self._pop_due(due_by)
+        return count
+
+    def stats(self):
+        """ return the next run time and run statistics of each job """
+        ret = dict()
+        for name, job in self.jobs.items():
+            ret[name] = dict(job.stats, next_run=job.next_run)
+        return ret
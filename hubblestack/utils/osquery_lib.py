@@ -4,6 +4,7 @@ Author - Mudit Agarwal (muagarwa@adobe.com)
 """
 import logging
 import os
+import uuid
 import hubblestack.modules.cmdmod
 import json
 
@@ -39,3 +40,110 @@ def query(query_sql='', osquery_path='/opt/osquery/osqueryi', args=None, max_fil
   except Exception as e:
     log.exception('An exception occurred while executing query {0} - {1}'.format(query_sql, e))
     return None
+
+
+BATCH_MARKER = 'hubble_osquery_batch'
+
+def batch_stdin(queries, token):
+  """
+  Build the osqueryi shell input for a batch: each query is wrapped in a pair
+  of marker selects so its output can be told apart from its neighbours'
+  """
+  lines = []
+  for idx, query_sql in enumerate(queries):
+    query_sql = query_sql.strip().rstrip(';').strip()
+    lines.append("select '{0}:{1}:begin' as {2};".format(token, idx, BATCH_MARKER))
+    lines.append(query_sql + ';')
+    lines.append("select '{0}:{1}:end' as {2};".format(token, idx, BATCH_MARKER))
+  return '\n'.join(lines) + '\n'
+
+def _marker(rows, token):
+  if isinstance(rows, list) and len(rows) == 1 and isinstance(rows[0], dict) \
+      and list(rows[0]) == [BATCH_MARKER]:
+    parts = str(rows[0][BATCH_MARKER]).split(':')
+    if len(parts) == 3 and parts[0] == token:
+      return int(parts[1]), parts[2]
+  return None
+
+def parse_batch_output(stdout, token, count):
+  """
+  Split the concatenated json output of a batch session back into one result
+  per query. Queries that errored (osqueryi prints nothing to stdout for
+  them) or never finished come back as None.
+  """
+  ret = [None] * count
+  decoder = json.JSONDecoder()
+  current = None
+  data = None
+  pos = 0
+  while True:
+    pos = stdout.find('[', pos)
+    if pos < 0:
+      break
+    try:
+      rows, pos = decoder.raw_decode(stdout, pos)
+    except ValueError:
+      # not json, skip whatever this was
+      pos += 1
+      continue
+    marker = _marker(rows, token)
+    if marker is None:
+      if current is not None:
+        data = (data or []) + rows
+      continue
+    idx, which = marker
+    if which == 'begin':
+      current, data = idx, None
+    elif idx == current:
+      if data is not None and 0 <= idx < count:
+        ret[idx] = data
+      current, data = None, None
+  return ret
+
+def run_batch(cmd, queries, timeout=10000, run_all=None, **kwargs):
+  """
+  Run all queries in a single osqueryi session started with cmd (which must
+  not contain a query itself) and return one result per query, in order;
+  None for queries that failed. A failing query doesn't stop the others.
+  """
+  if not queries:
+    return []
+  run_all = run_all or __mods__['cmd.run_all']
+  token = uuid.uuid4().hex
+  res = run_all(cmd, stdin=batch_stdin(queries, token), timeout=timeout, **kwargs)
+  ret = parse_batch_output(res.get('stdout') or '', token, len(queries))
+  if res.get('retcode') != 0:
+    log.debug('osqueryi batch session exited with %s: %s', res.get('retcode'), res.get('stderr'))
+  return ret
+
+def query_batch(queries, osquery_path='/opt/osquery/osqueryi', args=None, max_file_size=104857600, timeout=10000, output_loglevel='quiet'):
+  """
+  Batched version of query(): run several queries through one osqueryi
+  process, paying its startup cost once. Returns a list with the result (or
+  None) of each query, in order.
+  """
+  ret = [None] * len(queries)
+  try:
+    if not os.path.isfile(osquery_path):
+      log.error('osquery binary not found: %s', osquery_path)
+      return ret
+    todo = []
+    for idx, query_sql in enumerate(queries):
+      if not query_sql:
+        continue
+      if 'attach' in query_sql.lower() or 'curl' in query_sql.lower():
+        log.critical('Skipping potentially malicious osquery query '
+                     'which contains either \'attach\' or \'curl\': {0}'
+                     .format(query_sql))
+        continue
+      todo.append(idx)
+    cmd = [osquery_path, '--read_max', max_file_size, '--json']
+    if isinstance(args, (list, tuple)):
+      cmd.extend(args)
+    results = run_batch(cmd, [queries[idx] for idx in todo], timeout=timeout,
+                        python_shell=False, output_loglevel=output_loglevel)
+    for idx, result in zip(todo, results):
+      ret[idx] = result
+  except Exception as e:
+    log.exception('An exception occurred while executing query batch - {0}'.format(e))
+  return ret
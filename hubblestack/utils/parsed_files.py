@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+A cache of parsed files for the readfile audit module and pygrep.
+
+Profiles hold dozens of readfile checks against the same sshd_config or json
+daemon config, and each of them used to open and parse the file again. The
+cache keeps what a parse function made of a file, keyed by the path and the
+kind of parse, and validated against the file's inode, mtime and size; the
+file is only read and parsed again once it changes:
+
+    data = PARSED_FILES.get('/etc/docker/daemon.json', 'json', load_json)
+
+Entries are evicted least recently used first once the files they were made
+from add up to more than ``max_bytes``; results of bigger files aren't kept.
+Callers must not modify what get() returns.
+
+Files on pseudo filesystems (/proc, /sys, /dev, or anything else that isn't a
+regular file with a size) keep their inode, mtime and size while their content
+changes, so they're parsed on every get() and never kept.
+"""
+
+import collections
+import os
+import stat
+import threading
+
+# the combined size of the files whose results are kept
+MAX_CACHED_BYTES = 32 * 1024 * 1024
+# what an entry costs on top of the size of its file
+ENTRY_OVERHEAD = 512
+# files under these are generated on read
+PSEUDO_FS_DIRS = ('/proc/', '/sys/', '/dev/')
+
+
+def _cacheable(path, st):
+    """ whether the stat of path tells when its content changes """
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        return False
+    return not os.path.abspath(path).startswith(PSEUDO_FS_DIRS)
+
+
+class ParsedFiles(object):
+    """ results of parsing files, keyed by path and kind, in LRU order """
+
+    def __init__(self, max_bytes=MAX_CACHED_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # (path, kind) -> ((st_ino, st_mtime_ns, st_size), result, cost)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, path, kind, parse):
+        """
+        Return parse(path), from the cache while the file is unchanged. kind
+        tells apart the results of different parse functions (or arguments)
+        for the same file. Errors of os.stat() and parse() are raised, and
+        None results aren't kept.
+        """
+        st = os.stat(path)
+        if not _cacheable(path, st):
+            with self._lock:
+                self.stats['misses'] += 1
+            return parse(path)
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        key = (path, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+        result = parse(path)
+        cost = st.st_size + ENTRY_OVERHEAD
+        with self._lock:
+            self._discard(key)
+            if result is not None and cost <= self.max_bytes:
+                self._entries[key] = (signature, result, cost)
+                self.size += cost
+                while self.size > self.max_bytes:
+                    self._discard(next(iter(self._entries)))
+                    self.stats['evictions'] += 1
+        return result
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        """ forget every result """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+PARSED_FILES = ParsedFiles()
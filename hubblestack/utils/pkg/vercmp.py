@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+'''
+In-process dpkg and rpm version comparison
+
+Without the apt_pkg (or rpm) python bindings, aptpkg.version_cmp forked
+``dpkg --compare-versions`` (and rpm_lowpkg.version_cmp ``rpmdev-vercmp``) for
+every comparison; an OVAL scan compares every installed package against every
+definition. These implement the same algorithms (dpkg's verrevcmp and rpm's
+rpmvercmp) in python, and remember the results for the most recent pairs:
+
+    dpkg_version_cmp('1:2.30-1ubuntu1', '2.31-0~rc1')  # => 1
+    rpm_version_cmp('3.28.0-1.el7', '3.28.0-1.el7_9')  # => -1
+
+dpkg_version_cmp raises ValueError for a version dpkg itself would reject,
+so the caller can still ask dpkg.
+'''
+
+import functools
+import re
+
+# the number of version pairs remembered by each comparison
+MAX_CACHED_PAIRS = 16384
+
+_DIGITS = frozenset('0123456789')
+_ALPHA = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_ALNUM = _DIGITS | _ALPHA
+_EPOCH = re.compile(r'^([0-9]+):')
+
+
+def _cmp(val1, val2):
+    return (val1 > val2) - (val1 < val2)
+
+
+def _dpkg_order(char):
+    if char in _DIGITS:
+        return 0
+    if char in _ALPHA:
+        return ord(char)
+    if char == '~':
+        return -1
+    return ord(char) + 256
+
+
+def verrevcmp(val1, val2):
+    ''' dpkg's comparison of two upstream versions (or two revisions) '''
+    len1, len2 = len(val1), len(val2)
+    idx1 = idx2 = 0
+    while idx1 < len1 or idx2 < len2:
+        first_diff = 0
+        while (idx1 < len1 and val1[idx1] not in _DIGITS) or \
+                (idx2 < len2 and val2[idx2] not in _DIGITS):
+            order1 = _dpkg_order(val1[idx1]) if idx1 < len1 else 0
+            order2 = _dpkg_order(val2[idx2]) if idx2 < len2 else 0
+            if order1 != order2:
+                return _cmp(order1, order2)
+            idx1 += 1
+            idx2 += 1
+        while idx1 < len1 and val1[idx1] == '0':
+            idx1 += 1
+        while idx2 < len2 and val2[idx2] == '0':
+            idx2 += 1
+        while idx1 < len1 and idx2 < len2 and val1[idx1] in _DIGITS and val2[idx2] in _DIGITS:
+            if not first_diff:
+                first_diff = _cmp(val1[idx1], val2[idx2])
+            idx1 += 1
+            idx2 += 1
+        if idx1 < len1 and val1[idx1] in _DIGITS:
+            return 1
+        if idx2 < len2 and val2[idx2] in _DIGITS:
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def parse_dpkg_version(version):
+    '''
+    Split a dpkg version into (epoch, upstream version, revision) the way
+    dpkg does (None for no version); raise ValueError where dpkg would
+    refuse the version
+    '''
+    version = str(version).strip()
+    if version in ('', '<unknown>'):
+        # dpkg --compare-versions takes these as "no version"
+        return None
+    if ' ' in version or '\t' in version:
+        raise ValueError('version string {0!r} has embedded spaces'.format(version))
+    epoch = 0
+    if ':' in version:
+        match = _EPOCH.match(version)
+        if not match:
+            raise ValueError('epoch in version {0!r} is not a number'.format(version))
+        epoch = int(match.group(1))
+        version = version[match.end():]
+        if not version:
+            raise ValueError('nothing after colon in version number')
+    upstream, hyphen, revision = version.rpartition('-')
+    if not hyphen:
+        upstream, revision = version, ''
+    elif not revision:
+        raise ValueError('revision number is empty')
+    if not upstream:
+        raise ValueError('version number is empty')
+    return epoch, upstream, revision
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_PAIRS)
+def dpkg_version_cmp(ver1, ver2):
+    '''
+    Compare two dpkg versions like ``dpkg --compare-versions``; returns -1, 0
+    or 1
+    '''
+    parsed1 = parse_dpkg_version(ver1)
+    parsed2 = parse_dpkg_version(ver2)
+    if parsed1 is None or parsed2 is None:
+        # no version is older than any version
+        return _cmp(parsed1 is not None, parsed2 is not None)
+    epoch1, upstream1, revision1 = parsed1
+    epoch2, upstream2, revision2 = parsed2
+    if epoch1 != epoch2:
+        return _cmp(epoch1, epoch2)
+    return verrevcmp(upstream1, upstream2) or verrevcmp(revision1, revision2)
+
+
+def rpmvercmp(val1, val2):
+    ''' rpm's comparison of two versions (or two releases) '''
+    if val1 == val2:
+        return 0
+    len1, len2 = len(val1), len(val2)
+    idx1 = idx2 = 0
+    while idx1 < len1 or idx2 < len2:
+        while idx1 < len1 and val1[idx1] not in _ALNUM and val1[idx1] not in '~^':
+            idx1 += 1
+        while idx2 < len2 and val2[idx2] not in _ALNUM and val2[idx2] not in '~^':
+            idx2 += 1
+        char1 = val1[idx1] if idx1 < len1 else ''
+        char2 = val2[idx2] if idx2 < len2 else ''
+
+        # the tilde separator sorts before everything else
+        if char1 == '~' or char2 == '~':
+            if char1 != '~':
+                return 1
+            if char2 != '~':
+                return -1
+            idx1 += 1
+            idx2 += 1
+            continue
+        # the caret sorts after the end of a version but before anything else
+        if char1 == '^' or char2 == '^':
+            if not char1:
+                return -1
+            if not char2:
+                return 1
+            if char1 != '^':
+                return 1
+            if char2 != '^':
+                return -1
+            idx1 += 1
+            idx2 += 1
+            continue
+        if not (char1 and char2):
+            break
+
+        kind = _DIGITS if char1 in _DIGITS else _ALPHA
+        end1, end2 = idx1, idx2
+        while end1 < len1 and val1[end1] in kind:
+            end1 += 1
+        while end2 < len2 and val2[end2] in kind:
+            end2 += 1
+        seg1, seg2 = val1[idx1:end1], val2[idx2:end2]
+        if not seg2:
+            # a numeric segment is newer than an alpha one
+            return 1 if kind is _DIGITS else -1
+        if kind is _DIGITS:
+            seg1 = seg1.lstrip('0')
+            seg2 = seg2.lstrip('0')
+            if len(seg1) != len(seg2):
+                return _cmp(len(seg1), len(seg2))
+        if seg1 != seg2:
+            return _cmp(seg1, seg2)
+        idx1, idx2 = end1, end2
+    if idx1 >= len1 and idx2 >= len2:
+        return 0
+    return -1 if idx1 >= len1 else 1
+
+
+def parse_rpm_version(version):
+    ''' split an rpm version into (epoch, version, release) '''
+    version = str(version)
+    epoch = 0
+    if ':' in version:
+        epoch, _, version = version.partition(':')
+        # like hubblestack.utils.pkg.rpm.version_to_evr, garbage is epoch 0
+        epoch = int(epoch) if epoch.isdigit() else 0
+    version, _, release = version.partition('-')
+    return epoch, version, release
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_PAIRS)
+def rpm_version_cmp(ver1, ver2):
+    '''
+    Compare two rpm [epoch:]version[-release] strings like rpm.labelCompare;
+    returns -1, 0 or 1. Like rpm_lowpkg.version_cmp, the release is only
+    compared when both have one (so 3.2 is satisfied by 3.2-1).
+    '''
+    epoch1, version1, release1 = parse_rpm_version(ver1)
+    epoch2, version2, release2 = parse_rpm_version(ver2)
+    if epoch1 != epoch2:
+        return _cmp(epoch1, epoch2)
+    ret = rpmvercmp(version1, version2)
+    if ret or not (release1 and release2):
+        return ret
+    return rpmvercmp(release1, release2)
+
+
+def clear_cache():
+    ''' forget the remembered comparisons '''
+    dpkg_version_cmp.cache_clear()
+    rpm_version_cmp.cache_clear()
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+"""
+A cache of parsed nova profiles (yaml).
+
+hubble.load() used to yaml.safe_load every profile under the nova directories
+on every run, even though they rarely change. The store keeps each file's
+parsed data keyed by path and validated by the sha256 of its content (files
+whose stat is unchanged aren't even read), so only new and changed files are
+parsed again:
+
+    data, missing, changed = PROFILES.load_tree(hubble_dir)
+
+``changed`` says whether anything was added, re-parsed or removed since the
+previous load_tree() of the same directories. ``stats`` counts the hits,
+misses, errors and the time spent parsing.
+
+The nova modules change the profile data they're given (e.g. pop the tag out
+of each check), so every load hands out a deep copy and the cached data stay
+as parsed.
+"""
+
+import copy
+import hashlib
+import logging
+import os
+import time
+
+import yaml
+
+log = logging.getLogger(__name__)
+
+
+def _stat_sig(st):
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ProfileStore(object):
+    """ parsed yaml profiles keyed by path and content hash """
+
+    def __init__(self):
+        # pathname -> (stat signature, sha256, data, error)
+        self.files = dict()
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0, 'parse_time': 0.0}
+        self._last_tree = None
+
+    def load(self, pathname):
+        """
+        Return (data, error, changed) for the yaml file at pathname; error is
+        None unless it couldn't be read or parsed, changed is False when the
+        cached data were reused. data is a copy the caller may change.
+        """
+        try:
+            st = os.stat(pathname)
+        except OSError as exc:
+            self.files.pop(pathname, None)
+            self.stats['errors'] += 1
+            return None, str(exc), True
+        cached = self.files.get(pathname)
+        sig = _stat_sig(st)
+        if cached and cached[0] == sig:
+            self.stats['hits'] += 1
+            return copy.deepcopy(cached[2]), cached[3], False
+        try:
+            with open(pathname, 'rb') as fh:
+                content = fh.read()
+        except (IOError, OSError) as exc:
+            self.files.pop(pathname, None)
+            self.stats['errors'] += 1
+            return None, str(exc), True
+        digest = hashlib.sha256(content).hexdigest()
+        if cached and cached[1] == digest:
+            # rewritten (e.g. by a sync) but not changed
+            self.files[pathname] = (sig, digest, cached[2], cached[3])
+            self.stats['hits'] += 1
+            return copy.deepcopy(cached[2]), cached[3], False
+
+        self.stats['misses'] += 1
+        t0 = time.time()
+        data, error = None, None
+        try:
+            data = yaml.safe_load(content.decode('utf-8'))
+        except Exception as exc: # pylint: disable=broad-except
+            error = str(exc)
+            self.stats['errors'] += 1
+            log.exception('Error loading yaml from %s', pathname)
+        self.stats['parse_time'] += time.time() - t0
+        self.files[pathname] = (sig, digest, data, error)
+        return copy.deepcopy(data), error, True
+
+    def load_tree(self, dirs):
+        """
+        Load every .yaml file under dirs. Returns (data, missing, changed):
+        data and missing map the name of each file (its path under the
+        directory) to its data or its error, like nova's __data__ and
+        __missing_data__.
+        """
+        data = dict()
+        missing = dict()
+        changed = False
+        seen = set()
+        for mod_dir in dirs:
+            for path, _, filenames in os.walk(mod_dir):
+                for filename in filenames:
+                    if not filename.endswith('.yaml'):
+                        continue
+                    pathname = os.path.join(path, filename)
+                    name = pathname[len(mod_dir):]
+                    seen.add(pathname)
+                    res, error, file_changed = self.load(pathname)
+                    changed = changed or file_changed
+                    if error is None:
+                        data[name] = res
+                    else:
+                        missing[name] = error
+        tree = (tuple(dirs), frozenset(seen))
+        if tree != self._last_tree:
+            changed = True
+            self._last_tree = tree
+        # forget files that went away
+        for pathname in set(self.files) - seen:
+            if pathname.startswith(tuple(dirs)):
+                del self.files[pathname]
+        return data, missing, changed
+
+
+PROFILES = ProfileStore()
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+An in-process grep for the audit and fdg grep modules.
+
+Profiles issue hundreds of greps against a handful of files; forking grep for
+each of them costs far more than the search itself. run() takes the same
+command the modules would hand to cmd.run_all and returns the same
+retcode/stdout/stderr, for the flags profiles actually use:
+
+    -E -F -i -v -w -x -c -l -A NUM -B NUM -C NUM (and their long forms)
+
+Anything else (other flags, binary, undecodable or big files, directories,
+missing files, patterns python can't express the same way) raises
+GrepUnsupported and the caller should run the real grep instead.
+
+Compiled patterns are cached, and the lines of files are kept in
+hubblestack.utils.parsed_files (shared with the readfile module) until the
+file changes, so a file is only read again once it changes. Files under /proc
+and /sys are read every time.
+"""
+
+import logging
+import os
+import re
+import shlex
+
+from hubblestack.utils.parsed_files import PARSED_FILES
+
+log = logging.getLogger(__name__)
+
+# files bigger than this are left to the real grep rather than read into memory
+MAX_FILE_SIZE = 8 * 1024 * 1024
+READ_SIZE = 64 * 1024
+MAX_CACHED_PATTERNS = 1024
+
+# (pattern, extended, fixed, ignore_case, word, line) -> compiled regex
+_PATTERNS = {}
+
+_SHORT_FLAGS = {'E': 'extended', 'F': 'fixed', 'i': 'ignore_case', 'y': 'ignore_case',
+                'v': 'invert', 'w': 'word', 'x': 'line', 'c': 'count', 'l': 'files_with_matches'}
+_LONG_FLAGS = {'extended-regexp': 'extended', 'fixed-strings': 'fixed',
+               'ignore-case': 'ignore_case', 'invert-match': 'invert', 'word-regexp': 'word',
+               'line-regexp': 'line', 'count': 'count', 'files-with-matches': 'files_with_matches'}
+_CONTEXT_FLAGS = {'A': 'after', 'B': 'before', 'C': 'context',
+                  'after-context': 'after', 'before-context': 'before', 'context': 'context'}
+
+_CLASSES = {'alpha': 'a-zA-Z', 'digit': '0-9', 'alnum': '0-9a-zA-Z', 'upper': 'A-Z',
+            'lower': 'a-z', 'space': r' \t\n\r\f\v', 'blank': r' \t', 'xdigit': '0-9A-Fa-f',
+            'punct': re.escape('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'),
+            'cntrl': r'\x00-\x1f\x7f', 'print': r'\x20-\x7e', 'graph': r'\x21-\x7e'}
+
+
+class GrepUnsupported(Exception):
+    """ raised for anything run() can't do exactly like grep; use the binary """
+
+
+def clear_cache():
+    """ forget cached file contents and compiled patterns """
+    PARSED_FILES.clear()
+    _PATTERNS.clear()
+
+
+def _parse_args(argv):
+    opts = {'after': 0, 'before': 0, 'context_given': False}
+    positional = []
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '--':
+            positional.extend(args)
+            break
+        if arg.startswith('--'):
+            name, _, value = arg[2:].partition('=')
+            if name in _LONG_FLAGS and not value:
+                opts[_LONG_FLAGS[name]] = True
+            elif name in _CONTEXT_FLAGS and value:
+                _set_context(opts, _CONTEXT_FLAGS[name], value)
+            else:
+                raise GrepUnsupported('option {0}'.format(arg))
+        elif arg.startswith('-') and len(arg) > 1:
+            idx = 1
+            while idx < len(arg):
+                flag = arg[idx]
+                idx += 1
+                if flag in _SHORT_FLAGS:
+                    opts[_SHORT_FLAGS[flag]] = True
+                elif flag in _CONTEXT_FLAGS:
+                    value = arg[idx:]
+                    if not value:
+                        if not args:
+                            raise GrepUnsupported('option -{0} without a value'.format(flag))
+                        value = args.pop(0)
+                    _set_context(opts, _CONTEXT_FLAGS[flag], value)
+                    break
+                else:
+                    raise GrepUnsupported('option -{0}'.format(flag))
+        else:
+            positional.append(arg)
+    if not positional:
+        raise GrepUnsupported('no pattern')
+    if opts.get('extended') and opts.get('fixed'):
+        raise GrepUnsupported('conflicting matchers')
+    if opts.get('count') and opts.get('files_with_matches'):
+        raise GrepUnsupported('-c with -l')
+    return opts, positional[0], positional[1:]
+
+
+def _set_context(opts, which, value):
+    try:
+        value = int(value)
+    except ValueError:
+        raise GrepUnsupported('context value {0}'.format(value))
+    if value < 0:
+        raise GrepUnsupported('context value {0}'.format(value))
+    opts['context_given'] = True
+    if which == 'context':
+        opts['after'] = opts['before'] = value
+    else:
+        opts[which] = value
+
+
+def _bracket(pattern, idx):
+    """ translate the POSIX bracket expression starting at pattern[idx] """
+    end = len(pattern)
+    pos = idx + 1
+    ret = ['[']
+    if pos < end and pattern[pos] == '^':
+        ret.append('^')
+        pos += 1
+    if pos < end and pattern[pos] == ']':
+        ret.append(r'\]')
+        pos += 1
+    while pos < end and pattern[pos] != ']':
+        if pattern.startswith('[:', pos):
+            close = pattern.find(':]', pos + 2)
+            name = pattern[pos + 2:close] if close > 0 else None
+            if name not in _CLASSES:
+                raise GrepUnsupported('character class in {0}'.format(pattern))
+            ret.append(_CLASSES[name])
+            pos = close + 2
+        elif pattern.startswith('[.', pos) or pattern.startswith('[=', pos):
+            raise GrepUnsupported('collating element in {0}'.format(pattern))
+        else:
+            char = pattern[pos]
+            ret.append('\\' + char if char in '\\[^&~|' else char)
+            pos += 1
+    if pos >= end:
+        raise GrepUnsupported('unterminated bracket in {0}'.format(pattern))
+    ret.append(']')
+    return ''.join(ret), pos + 1
+
+
+def translate(pattern, extended=False):
+    """
+    Translate a grep basic (or, with extended, extended) regular expression
+    into an equivalent python one. Raises GrepUnsupported where the two
+    wouldn't agree.
+    """
+    ret = []
+    idx = 0
+    end = len(pattern)
+    # in a BRE, * is literal and ^ an anchor right at the start of a (sub)expression;
+    # * is also literal right after that anchor, but another ^ isn't an anchor
+    sub_start = True
+    anchored = False
+    # whether the last thing emitted ended a quantifier: another one right
+    # after it would be lazy (or possessive) in python, but applies to the
+    # quantified atom in grep
+    quantified = False
+    while idx < end:
+        char = pattern[idx]
+        at_start, sub_start = sub_start, False
+        after_anchor, anchored = anchored, False
+        after_quantifier, quantified = quantified, False
+        if char == '\\':
+            if idx + 1 >= end:
+                raise GrepUnsupported('trailing backslash in {0}'.format(pattern))
+            nxt = pattern[idx + 1]
+            idx += 2
+            if nxt == '<':
+                ret.append(r'\b(?=\w)')
+            elif nxt == '>':
+                ret.append(r'\b(?<=\w)')
+            elif not extended and nxt in '(){}|+?':
+                if nxt in '{+?' and after_quantifier:
+                    raise GrepUnsupported('repeated quantifier in {0}'.format(pattern))
+                ret.append(nxt)
+                sub_start = nxt in '(|'
+                quantified = nxt in '}+?'
+            elif nxt in 'wWsSbB' or nxt.isdigit():
+                ret.append('\\' + nxt)
+            elif nxt.isalnum():
+                raise GrepUnsupported('escape \\{0} in {1}'.format(nxt, pattern))
+            else:
+                ret.append(re.escape(nxt))
+            continue
+        idx += 1
+        if char == '[':
+            part, idx = _bracket(pattern, idx - 1)
+            ret.append(part)
+        elif extended:
+            if char == '(' and pattern.startswith('?', idx):
+                raise GrepUnsupported('(? in {0}'.format(pattern))
+            if char in '*+?{' and after_quantifier:
+                raise GrepUnsupported('repeated quantifier in {0}'.format(pattern))
+            ret.append(char)
+            quantified = char in '*+?}'
+        elif char in '(){}|+?':
+            ret.append('\\' + char)
+        elif char == '*' and (at_start or after_anchor):
+            ret.append(r'\*')
+        elif char == '*':
+            if after_quantifier:
+                raise GrepUnsupported('repeated quantifier in {0}'.format(pattern))
+            ret.append(char)
+            quantified = True
+        elif char == '^':
+            ret.append('^' if at_start else r'\^')
+            anchored = at_start
+        elif char == '$':
+            at_end = idx == end or pattern.startswith(r'\)', idx) or pattern.startswith(r'\|', idx)
+            ret.append('$' if at_end else r'\$')
+        else:
+            ret.append(char)
+    return ''.join(ret)
+
+
+def compile_pattern(pattern, extended=False, fixed=False, ignore_case=False, word=False, line=False):
+    """ return the (cached) compiled python regex for a grep pattern """
+    key = (pattern, extended, fixed, ignore_case, word, line)
+    regex = _PATTERNS.get(key)
+    if regex is None:
+        if '\n' in pattern:
+            raise GrepUnsupported('multiple patterns')
+        expr = re.escape(pattern) if fixed else translate(pattern, extended)
+        if word:
+            expr = r'(?<!\w)(?:{0})(?!\w)'.format(expr)
+        if line:
+            expr = r'^(?:{0})\Z'.format(expr)
+        try:
+            regex = re.compile(expr, re.IGNORECASE if ignore_case else 0)
+        except re.error as exc:
+            raise GrepUnsupported('pattern {0}: {1}'.format(pattern, exc))
+        if len(_PATTERNS) >= MAX_CACHED_PATTERNS:
+            _PATTERNS.clear()
+        _PATTERNS[key] = regex
+    return regex
+
+
+def _split(content, name):
+    if '\0' in content:
+        raise GrepUnsupported('binary input {0}'.format(name))
+    lines = content.split('\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def read_lines(path):
+    """
+    return the lines of path, from the cache while the file is unchanged; the
+    list is shared and must not be modified
+    """
+    if not os.path.isfile(path):
+        if not os.path.exists(path):
+            raise GrepUnsupported('{0}: no such file'.format(path))
+        raise GrepUnsupported('{0} is not a regular file'.format(path))
+    try:
+        return PARSED_FILES.get(path, 'grep-lines', _load_lines)
+    except (IOError, OSError) as exc:
+        raise GrepUnsupported('{0}: {1}'.format(path, exc))
+
+
+def _load_lines(path):
+    try:
+        with open(path, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size > MAX_FILE_SIZE:
+                raise GrepUnsupported('{0} is too big'.format(path))
+            # files on /proc and /sys report no size (and some refuse big
+            # reads), so read in chunks and count
+            chunks = []
+            size = 0
+            for chunk in iter(lambda: fh.read(READ_SIZE), b''):
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise GrepUnsupported('{0} is too big'.format(path))
+                chunks.append(chunk)
+            content = b''.join(chunks).decode('utf-8')
+    except UnicodeDecodeError as exc:
+        raise GrepUnsupported('{0}: {1}'.format(path, exc))
+    return _split(content, path)
+
+
+def grep(argv, stdin=None):
+    """
+    Run grep (argv, without the leading 'grep') in-process. Returns a dict
+    with retcode, stdout (right stripped, like cmd.run_all) and stderr.
+    """
+    opts, pattern, paths = _parse_args(argv)
+    regex = compile_pattern(pattern, extended=opts.get('extended', False),
+                            fixed=opts.get('fixed', False),
+                            ignore_case=opts.get('ignore_case', False),
+                            word=opts.get('word', False), line=opts.get('line', False))
+    if paths:
+        sources = [(path, read_lines(path)) for path in paths]
+    elif stdin is not None:
+        sources = [('(standard input)', _split(stdin, 'stdin'))]
+    else:
+        raise GrepUnsupported('nothing to read')
+
+    invert = opts.get('invert', False)
+    multi = len(sources) > 1
+    out = []
+    found = False
+    printed_any = False
+    for name, lines in sources:
+        selected = [bool(regex.search(line)) != invert for line in lines]
+        count = sum(selected)
+        found = found or count > 0
+        prefix = name + '{0}' if multi else ''
+        if opts.get('count'):
+            out.append(prefix.format(':') + str(count))
+            continue
+        if opts.get('files_with_matches'):
+            if count:
+                out.append(name)
+            continue
+
+        before, after = opts['before'], opts['after']
+        last = -1
+        after_until = -1
+        for idx, is_selected in enumerate(selected):
+            if is_selected:
+                start = max(idx - before, last + 1)
+                if opts['context_given'] and printed_any and (last == -1 or start > last + 1):
+                    out.append('--')
+                for ctx in range(start, idx):
+                    out.append(prefix.format('-') + lines[ctx])
+                out.append(prefix.format(':') + lines[idx])
+                last = idx
+                after_until = idx + after
+                printed_any = True
+            elif idx <= after_until:
+                out.append(prefix.format('-') + lines[idx])
+                last = idx
+
+    return {'retcode': 0 if found else 1, 'stdout': '\n'.join(out).rstrip(), 'stderr': ''}
+
+
+def run(cmd, stdin=None):
+    """
+    Run a grep command line (a string, split like cmd.run does, or a list
+    starting with 'grep') in-process
+    """
+    argv = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    if not argv or argv[0] != 'grep':
+        raise GrepUnsupported('not a grep command')
+    return grep(argv[1:], stdin=stdin)
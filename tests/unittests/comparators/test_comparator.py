@@ -95,3 +95,23 @@ class TestComparatorMatch(TestCase):
         with pytest.raises(HubbleCheckFailedError) as exception:
             status, result = comparator.run('test', args, module_result, module_status)
             pytest.fail('Should not have come here')
+
+    def test_command_remembered(self):
+        """
+        The command of a type and keys is only looked up once per loader
+        """
+        lookups = []
+        class Loader(dict):
+            def __contains__(self, key):
+                lookups.append(key)
+                return dict.__contains__(self, key)
+        comparator.__comparator__ = Loader({"string.match": lambda audit_id, value, args: (value == args['match'], '')})
+
+        for value in ("abc", "xyz"):
+            status, result = comparator.run('test', {"type": "string", "match": "abc"}, value)
+            self.assertEqual(status, value == "abc")
+        self.assertEqual(lookups, ["string.match"])
+
+        comparator.__comparator__ = Loader(comparator.__comparator__)
+        comparator.run('test', {"type": "string", "match": "abc"}, {"result": "abc"})
+        self.assertEqual(lookups, ["string.match", "string.match"])
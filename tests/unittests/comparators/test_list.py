@@ -278,6 +278,27 @@ class TestListMatchAny(TestCase):
             self.assertFalse(status)
 
 
+    def test_match_any_index(self):
+        """
+        Primitive entries are looked up in an index, ignoring case if asked to
+        """
+        result_to_compare = ["rsh%d" % i for i in range(1000)] + ["Splunk"]
+        args = {
+            "type": "list",
+            "match_any": ["abc%d" % i for i in range(1000)] + [["not", "hashable"], "splunk"],
+            "ignore_case": True
+        }
+        with patch('hubblestack.module_runner.comparator') as comparator_mock:
+            status, result = list_comparator.match_any("test-1", result_to_compare, args)
+            self.assertTrue(status)
+            comparator_mock.run.assert_not_called()
+            args["ignore_case"] = False
+            status, result = list_comparator.match_any("test-1", result_to_compare, args)
+            self.assertFalse(status)
+            status, result = list_comparator.match_any("test-1", [["not", "hashable"]], args)
+            self.assertTrue(status)
+
+
 class TestListMatchAnyIfKeyMatches(TestCase):
     """
     Unit tests for list::match_any_if_keyvalue_matches comparator
@@ -424,6 +445,25 @@ class TestListMatchAll(TestCase):
             self.assertFalse(status)
 
 
+    def test_match_all_index(self):
+        """
+        Every primitive entry is looked up in an index of the list
+        """
+        result_to_compare = ["pkg%d" % i for i in range(1000)]
+        args = {
+            "type": "list",
+            "match_all": ["PKG%d" % i for i in range(0, 1000, 7)],
+            "ignore_case": True
+        }
+        with patch('hubblestack.module_runner.comparator') as comparator_mock:
+            status, result = list_comparator.match_all("test-1", result_to_compare, args)
+            self.assertTrue(status)
+            args["match_all"].append("pkg1000")
+            status, result = list_comparator.match_all("test-1", result_to_compare, args)
+            self.assertFalse(status)
+            comparator_mock.run.assert_not_called()
+
+
 class TestListFilterCompare(TestCase):
     """
     Unit tests for list::filter_compare comparator
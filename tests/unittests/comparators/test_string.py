@@ -136,3 +136,18 @@ class TestStringMatchAny(TestCase):
         }
         status, result = string_comparator.match_any("test-1", result_to_compare, args)
         self.assertTrue(status)
+
+    def test_regex_compiled_once(self):
+        """
+        A pattern is compiled once for all the values it is matched against
+        """
+        string_comparator._PATTERNS.clear()
+        args = {"type": "string", "match": "^ro+t$", "is_regex": True, "is_multiline": False}
+        for value, expected in (("root", True), ("rooot", True), ("rt", False), ("boot\nroot", False)):
+            status, result = string_comparator.match("test-1", value, args)
+            self.assertEqual(status, expected)
+        self.assertEqual(list(string_comparator._PATTERNS), [("^ro+t$", 0)])
+        # multiline is a different pattern
+        status, result = string_comparator.match("test-1", "boot\nroot", dict(args, is_multiline=True))
+        self.assertTrue(status)
+        self.assertEqual(len(string_comparator._PATTERNS), 2)
@@ -97,6 +97,19 @@ class TestVersionMatch(TestCase):
         status, result = version_comparator.match('id', '8.0', args)
         self.assertTrue(status)
 
+    def test_package_versions(self):
+        """
+        Versions are compared like package managers compare them
+        """
+        for version, match in (('1.0~rc1', '< 1.0'), ('1.10', '> 1.9'), ('1.0a', '< 1.0.1'),
+                               ('2:1.0', '> 1:9.9'), ('1.0-1ubuntu1', '> 1.0-1')):
+            status, result = version_comparator.match("test-1", version, {"match": match})
+            self.assertTrue(status, match)
+        args = {"match": '3.2', "format": "rpm"}
+        status, result = version_comparator.match("test-1", '3.2-1.el7', args)
+        self.assertTrue(status)
+
+
 class TestVersionMatchAny(TestCase):
     """
     Unit tests for version::match_any comparator
@@ -4,6 +4,7 @@
 """
 import hubblestack.loader
 import hubblestack.matchers.compound_match as compound_match
+import hubblestack.matchers.glob_match as glob_match
 import hubblestack.matchers.grain_match as grain_match
 import hubblestack.matchers.list_match as list_match
 import hubblestack.matchers.pcre_match as pcre_match
@@ -16,6 +17,7 @@ from tests.support.unit import TestCase
 
 MATCHERS_DICT = {
     "compound_match.match": compound_match.match,
+    "glob_match.match": glob_match.match,
     "list_match.match": list_match.match,
     "pcre_match.match": pcre_match.match,
     "grain_match.match": grain_match.match
@@ -112,3 +114,43 @@ class MatchTestCase(TestCase, LoaderModuleMockMixin):
         self.assertTrue(compound_match.match("L@rest03", {"id": "rest03"}))
         self.assertFalse(compound_match.match("L@rest03"))
         self.assertFalse(compound_match.match("G@bar03"))
+
+    def test_compound_match_compiled_target(self):
+        """
+        Targets are compiled once and evaluated with the usual boolean
+        semantics; invalid targets compile to None and never match
+        """
+        compound_match.clear_cache()
+        opts = {"id": MINION_ID, "grains": {"os": "Ubuntu", "kernel": "Linux"}}
+        self.assertTrue(compound_match.match("G@os:Ubuntu and bar*", opts))
+        self.assertTrue(compound_match.match("G@os:CentOS or L@bar03,bar04", opts))
+        self.assertFalse(compound_match.match("G@os:Ubuntu not G@kernel:Linux", opts))
+        self.assertTrue(compound_match.match(["not", "G@os:CentOS"], opts))
+        self.assertFalse(compound_match.match("and G@os:Ubuntu", opts))
+        self.assertFalse(compound_match.match("( G@os:Ubuntu", opts))
+
+        compiled = compound_match.get_compiled("G@os:Ubuntu and bar*")
+        self.assertIs(compiled, compound_match.get_compiled("G@os:Ubuntu and bar*"))
+        self.assertEqual(compiled.expr, "_t0() and _t1()")
+        self.assertIsNone(compound_match.get_compiled("( G@os:Ubuntu"))
+
+    def test_compound_match_memoized_per_grains_generation(self):
+        """
+        With a grains_generation in opts, results are memoized until the
+        generation changes
+        """
+        compound_match.clear_cache()
+        grain_mock = MagicMock(return_value=True)
+        matchers = dict(MATCHERS_DICT)
+        matchers["grain_match.match"] = grain_mock
+        opts = {"id": MINION_ID, "grains": {"os": "Ubuntu"}, "grains_generation": 1}
+        with patch.object(hubblestack.loader, "matchers", return_value=matchers):
+            self.assertTrue(compound_match.match("G@os:Ubuntu", opts))
+            self.assertTrue(compound_match.match("G@os:Ubuntu", opts))
+            self.assertEqual(grain_mock.call_count, 1)
+
+            opts["grains_generation"] = 2
+            grain_mock.return_value = False
+            self.assertFalse(compound_match.match("G@os:Ubuntu", opts))
+            self.assertEqual(grain_mock.call_count, 2)
+        compound_match.clear_cache()
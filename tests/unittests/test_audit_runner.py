@@ -0,0 +1,97 @@
+# coding: utf-8
+
+import threading
+import time
+
+import mock
+import pytest
+
+from hubblestack.exceptions import HubbleCheckValidationError
+from hubblestack.module_runner.audit_runner import AuditRunner
+
+def _profile(count, bexpr_at=None):
+    ret = dict()
+    for i in range(count):
+        module = 'bexpr' if i == bexpr_at else 'grep'
+        ret['check{0}'.format(i)] = {'tag': 'TAG-{0}'.format(i), 'description': 'check {0}'.format(i),
+            'implementations': [{'filter': {'grains': '*'}, 'module': module, 'items': []}]}
+    return ret
+
+@pytest.fixture
+def runner():
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0, 'bexpr_saw': None}
+
+    def execute_audit(audit_id, audit_impl, audit_data, verbose, audit_profile, result_list=None):
+        if audit_impl['module'] == 'bexpr':
+            state['bexpr_saw'] = [ x['check_unique_id'] for x in result_list ]
+            return {'check_unique_id': audit_id, 'check_result': 'Success'}
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['running'], state['max_running'])
+        # later checks finish first
+        time.sleep(0.2 - 0.02 * int(audit_id[5:]))
+        with lock:
+            state['running'] -= 1
+        if audit_id == 'check3':
+            raise HubbleCheckValidationError('bad params')
+        if audit_id == 'check4':
+            raise ValueError('module blew up')
+        return {'check_unique_id': audit_id, 'check_result': 'Success'}
+
+    ret = AuditRunner()
+    ret.state = state
+    with mock.patch.object(ret, '_get_matched_implementation',
+                lambda audit_id, audit_data, tags, labels: audit_data['implementations'][0]), \
+            mock.patch.object(ret, '_is_hubble_version_compatible', lambda *a: True), \
+            mock.patch.object(ret, '_execute_audit', execute_audit):
+        yield ret
+
+@pytest.mark.parametrize('max_workers', [None, 4])
+def test_execute_keeps_order_and_buckets(runner, max_workers):
+    ret = runner._execute(_profile(7, bexpr_at=1), 'salt://profiles/cis.yaml',
+        {'tags': '*', 'max_workers': max_workers})
+    assert [ x['check_unique_id'] for x in ret ] == ['check0', 'check2', 'check3', 'check5', 'check6', 'check1']
+    assert ret[2]['check_result'] == 'Error'
+    assert ret[2]['audit_profile'] == 'cis'
+    assert runner.state['bexpr_saw'] == ['check0', 'check2', 'check3', 'check5', 'check6']
+    assert runner.state['max_running'] == (4 if max_workers else 1)
+
+def test_pure_module_results_are_reused(monkeypatch):
+    import hubblestack.audit.stat
+    import hubblestack.audit.bexpr
+    import hubblestack.module_runner.runner
+    import hubblestack.module_runner.comparator
+
+    calls = []
+    def file_stats(path):
+        calls.append(path)
+        return {'uid': 0, 'mode': '0644'}
+    monkeypatch.setattr(hubblestack.audit.stat, '__mods__', {'file.stats': file_stats}, raising=False)
+    hmods = dict()
+    for func in ('execute', 'validate_params', 'get_filtered_params_to_log', 'get_failure_reason'):
+        hmods['stat.' + func] = getattr(hubblestack.audit.stat, func)
+        hmods['bexpr.' + func] = getattr(hubblestack.audit.bexpr, func)
+    monkeypatch.setattr(hubblestack.module_runner.runner, '__hmods__', hmods)
+    def compare(audit_id, args, module_result, module_status=True):
+        # comparators may modify the module result, later checks don't see it
+        assert module_result['result']['mode'] == '0644'
+        module_result['result']['mode'] = 'seen'
+        return module_status, None
+    monkeypatch.setattr(hubblestack.module_runner.comparator, 'run', compare)
+
+    def impl(path):
+        return {'module': 'stat', 'filter': {}, 'items': [{'args': {'path': path}, 'comparator': {}}]}
+    audit_data = {'tag': 'TAG', 'description': 'stat'}
+    runner = AuditRunner()
+    for path in ('/etc/passwd', '/etc/passwd', '/etc/group', '/etc/passwd'):
+        ret = runner._execute_audit('check', impl(path), audit_data, False, 'cis')
+        assert ret['check_result'] == 'Success'
+    assert calls == ['/etc/passwd', '/etc/group']
+    assert (runner._memo.hits, runner._memo.misses) == (2, 2)
+    assert not runner._is_pure_module('bexpr')
+
+    # a new run starts from scratch
+    runner = AuditRunner()
+    runner._execute_audit('check', impl('/etc/passwd'), audit_data, False, 'cis')
+    assert calls == ['/etc/passwd', '/etc/group', '/etc/passwd']
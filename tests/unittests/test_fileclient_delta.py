@@ -0,0 +1,63 @@
+# coding: utf-8
+
+import os
+
+import pytest
+
+import hubblestack.fileclient
+
+@pytest.fixture
+def client(__opts__, tmp_path):
+    roots = tmp_path / 'roots'
+    (roots / 'profiles' / 'sub').mkdir(parents=True)
+    (roots / 'profiles' / 'a.yaml').write_text('a: 1\n')
+    (roots / 'profiles' / 'sub' / 'b.yaml').write_text('b: 2\n')
+    (roots / 'other.yaml').write_text('other: 3\n')
+    __opts__.update({'file_client': 'local', 'fileserver_backend': ['roots'],
+        'file_roots': {'base': [str(roots)]}, 'cachedir': str(tmp_path / 'cache'),
+        'fileclient_delta_sync': True, 'fileclient_workers': 2})
+    client = hubblestack.fileclient.get_file_client(__opts__)
+    client.roots = roots
+    client.dest = tmp_path / 'cache' / 'files' / 'base' / 'profiles'
+    return client
+
+def test_delta_sync(client, monkeypatch):
+    fetched = list()
+    fetch = client._fetch_file
+    def _fetch_file(path, *a):
+        fetched.append(path)
+        return fetch(path, *a)
+    monkeypatch.setattr(client, '_fetch_file', _fetch_file)
+
+    ret = client.cache_dir('salt://profiles')
+    assert sorted(ret) == [str(client.dest / 'a.yaml'), str(client.dest / 'sub' / 'b.yaml')]
+    assert sorted(fetched) == ['profiles/a.yaml', 'profiles/sub/b.yaml']
+    assert (client.dest / 'sub' / 'b.yaml').read_text() == 'b: 2\n'
+    assert not os.path.exists(str(client.dest / '..' / 'other.yaml'))
+
+    # nothing changed: nothing fetched, the same files returned
+    del fetched[:]
+    assert sorted(client.cache_dir('salt://profiles')) == sorted(ret)
+    assert fetched == []
+
+    # one changed, one removed on the file server
+    (client.roots / 'profiles' / 'a.yaml').write_text('a: 10\n')
+    os.unlink(str(client.roots / 'profiles' / 'sub' / 'b.yaml'))
+    assert client.cache_dir('salt://profiles') == [str(client.dest / 'a.yaml')]
+    assert fetched == ['profiles/a.yaml']
+    assert (client.dest / 'a.yaml').read_text() == 'a: 10\n'
+    assert not os.path.exists(str(client.dest / 'sub' / 'b.yaml'))
+    assert list(client._load_manifest('base')) == ['profiles/a.yaml']
+
+def test_local_changes_are_replaced(client):
+    client.cache_dir('salt://profiles')
+    (client.dest / 'a.yaml').write_text('tampered\n')
+    client.cache_dir('salt://profiles')
+    assert (client.dest / 'a.yaml').read_text() == 'a: 1\n'
+
+def test_adopts_copies_cached_without_manifest(client, monkeypatch):
+    client.opts['fileclient_delta_sync'] = False
+    client.cache_dir('salt://profiles')
+    client.opts['fileclient_delta_sync'] = True
+    monkeypatch.setattr(client, '_fetch_file', lambda *a: pytest.fail('fetched'))
+    assert len(client.cache_dir('salt://profiles')) == 2
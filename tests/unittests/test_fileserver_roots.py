@@ -0,0 +1,73 @@
+# coding: utf-8
+
+import os
+
+import pytest
+
+import hubblestack.fileserver
+import hubblestack.fileserver.roots as roots
+
+@pytest.fixture
+def fs(monkeypatch, tmp_path):
+    root = tmp_path / 'root'
+    (root / 'a' / 'b').mkdir(parents=True)
+    (root / 'empty').mkdir()
+    (root / 'top.nova').write_text('x')
+    (root / 'a' / 'one.yaml').write_text('x')
+    (root / 'a' / 'b' / 'two.yaml').write_text('x')
+    (root / 'a' / 'b' / 'skip.pyc').write_text('x')
+    os.symlink('a/one.yaml', str(root / 'link.yaml'))
+    opts = {'file_roots': {'base': [str(root)]}, 'cachedir': str(tmp_path / 'cache'),
+            'fileserver_followsymlinks': True, 'fileserver_ignoresymlinks': False,
+            'file_ignore_regex': [], 'file_ignore_glob': ['*.pyc'],
+            'fileserver_list_cache_time': 20}
+    monkeypatch.setattr(roots, '__opts__', opts, raising=False)
+    monkeypatch.setattr(hubblestack.fileserver, '_DIR_INDEXES', dict())
+    return root
+
+def _listings(monkeypatch):
+    listed = list()
+    scandir = os.scandir
+    def _scandir(path):
+        listed.append(path)
+        return scandir(path)
+    monkeypatch.setattr(hubblestack.fileserver.os, 'scandir', _scandir)
+    return listed
+
+def test_file_lists(fs):
+    load = {'saltenv': 'base'}
+    assert roots.file_list(load) == ['a/b/two.yaml', 'a/one.yaml', 'link.yaml', 'top.nova']
+    assert roots.dir_list(load) == ['a', 'a/b', 'empty']
+    assert roots.file_list_emptydirs(load) == ['empty']
+    assert roots.symlink_list(load) == {'link.yaml': 'a/one.yaml'}
+
+def test_only_changed_dirs_are_listed(fs, monkeypatch):
+    load = {'saltenv': 'base'}
+    roots.file_list(load)
+    listed = _listings(monkeypatch)
+
+    # served from memory within fileserver_list_cache_time
+    (fs / 'a' / 'b' / 'three.yaml').write_text('x')
+    assert 'a/b/three.yaml' not in roots.file_list(load)
+    assert listed == []
+
+    roots.__opts__['fileserver_list_cache_time'] = 0
+    assert 'a/b/three.yaml' in roots.file_list(load)
+    assert listed == [str(fs / 'a' / 'b')]
+
+    # nothing changed: nothing listed, the same lists
+    del listed[:]
+    files = roots.file_list(load)
+    assert listed == []
+    assert roots.file_list(load) is files
+
+    (fs / 'empty' / 'new.yaml').write_text('x')
+    assert roots.file_list_emptydirs(load) == []
+
+def test_ignore_patterns_compiled_once(fs):
+    opts = dict(roots.__opts__, file_ignore_regex=r'\.bak$', file_ignore_glob=['*.pyc'])
+    first = hubblestack.fileserver._ignore_patterns(opts)
+    assert hubblestack.fileserver._ignore_patterns(opts) is first
+    assert hubblestack.fileserver.is_file_ignored(opts, 'x/y.bak')
+    assert hubblestack.fileserver.is_file_ignored(opts, 'x/y.pyc')
+    assert not hubblestack.fileserver.is_file_ignored(opts, 'x/y.yaml')
@@ -3,7 +3,7 @@
 import pytest
 import os
 
-from hubblestack.hec.dq import DiskQueue
+from hubblestack.hec.dq import DiskQueue, SegmentDiskQueue
 from hubblestack.hec.dq import QueueTypeError, QueueCapacityError
 
 TEST_DQ_DIR = os.environ.get('TEST_DQ_DIR', '/tmp/dq.{0}'.format(os.getuid()))
@@ -20,6 +20,14 @@ def dq():
 def dqc():
     return DiskQueue(TEST_DQ_DIR + ".bz2", fresh=True, compression=9)
 
+@pytest.fixture
+def sdq():
+    return SegmentDiskQueue(TEST_DQ_DIR + ".seg", fresh=True)
+
+@pytest.fixture
+def sdqc():
+    return SegmentDiskQueue(TEST_DQ_DIR + ".seg.bz2", fresh=True, compression=9)
+
 def _test_disk_queue(dq):
     borked = False
 
@@ -58,6 +66,12 @@ def test_disk_queue(dq):
 def test_disk_queue_with_compression(dqc):
     _test_disk_queue(dqc)
 
+def test_segment_disk_queue(sdq):
+    _test_disk_queue(sdq)
+
+def test_segment_disk_queue_with_compression(sdqc):
+    _test_disk_queue(sdqc)
+
 def _test_pop(samp,q):
     for i in samp:
         q.put(i)
@@ -68,6 +82,9 @@ def _test_pop(samp,q):
 def test_dq_pop(samp,dq):
     _test_pop(samp,dq)
 
+def test_sdq_pop(samp,sdq):
+    _test_pop(samp,sdq)
+
 def test_disk_queue_put_estimator(dq):
     for item in ['hi-there-{}'.format(x) for x in range(20)]:
         pre = dq.cn, dq.sz
@@ -77,3 +94,71 @@ def test_disk_queue_put_estimator(dq):
         dq._count()
         more = dq.cn, dq.sz
         assert post == more
+
+def test_segment_disk_queue_put_estimator(sdq):
+    test_disk_queue_put_estimator(sdq)
+
+def test_segment_disk_queue_rolls_and_reopens():
+    dq = SegmentDiskQueue(TEST_DQ_DIR + ".seg", fresh=True, segment_size=64)
+    items = ['item-number-{0}'.format(x) for x in range(20)]
+    for i,item in enumerate(items):
+        dq.put(item, idx=i)
+    assert len(list(dq.files)) > 1
+    assert dq.get() == (items[0], {'idx': 0})
+    assert dq.get() == (items[1], {'idx': 1})
+
+    # a second instance (eg, after a restart) picks up at the cursor
+    dq2 = SegmentDiskQueue(TEST_DQ_DIR + ".seg", segment_size=64)
+    assert (dq2.cn, dq2.sz) == (dq.cn, dq.sz)
+    assert [ x for x,_ in dq2.iter_peek() ] == [ x.encode() for x in items[2:] ]
+
+    for i,item in enumerate(items[2:], 2):
+        assert dq2.get() == (item, {'idx': i})
+    assert dq2.cn == 0 and dq2.sz == 0
+    assert dq2.get() is None
+    assert len(list(dq2.files)) <= 1
+
+def test_segment_disk_queue_truncates_partial_records():
+    dq = SegmentDiskQueue(TEST_DQ_DIR + ".seg", fresh=True)
+    dq.put('one')
+    dq.put('two')
+    fname = list(dq.files)[-1]
+    with open(fname, 'ab') as fh:
+        # pretend we died half way through writing a record
+        fh.write(SegmentDiskQueue.header.pack(SegmentDiskQueue.magic, 0, 0, 100, 0) + b'thr')
+    size = os.path.getsize(fname)
+
+    dq2 = SegmentDiskQueue(TEST_DQ_DIR + ".seg")
+    assert os.path.getsize(fname) < size
+    assert dq2.cn == 2
+    dq2.put('three')
+    assert dq2.getz() == ('one two three', {})
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'gzip:1', 'lzma', 'bz2:9', 5])
+def test_disk_queue_codecs(compression):
+    for cls in (DiskQueue, SegmentDiskQueue):
+        dq = cls(TEST_DQ_DIR + '.codec', fresh=True, compression=compression)
+        _test_disk_queue(dq)
+
+def test_disk_queue_codec_tags():
+    from hubblestack.hec import dq as dq_mod
+    dat = '{"some": "payload"}' * 10
+    assert dq_mod.parse_compression(0) == (None, None)
+    assert dq_mod.parse_compression(5) == ('bz2', 5)
+    assert dq_mod.parse_compression('zlib:3') == ('zlib', 3)
+    assert dq_mod.compress(dat, None) == dat.encode()
+    for codec in dq_mod.CODECS:
+        stored = dq_mod.compress(dat, codec)
+        assert stored.startswith(dq_mod.CODEC_TAG + dq_mod.CODECS[codec][0])
+        assert dq_mod.decompress(stored) == dat.encode()
+
+def test_disk_queue_drains_legacy_bz2_items():
+    import bz2
+    dq = DiskQueue(TEST_DQ_DIR, fresh=True, compression='zlib')
+    dq.put('new')
+    # an item written by the old hard-coded bz2 compressor
+    fname = os.path.join(dq._mkdir('0000'), '000001.0')
+    with open(fname, 'wb') as fh:
+        fh.write(bz2.compress(b'old', 5))
+    dq._count()
+    assert sorted(dq.getz()[0].split()) == ['new', 'old']
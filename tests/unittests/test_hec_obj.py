@@ -38,3 +38,24 @@ def test_queue_things_with_compression(mock_send, __opts__, __mods__):
     cat_gz = ' '.join(gz)
 
     assert cat_rez == cat_gz
+
+def test_hec_registry_reuses_collectors():
+    import hubblestack.hec.registry as registry
+    from hubblestack.hec import get_hec
+
+    registry.clear()
+    kw = dict(http_event_port='8088', proxy=None, timeout=9.05)
+    hec1 = get_hec('token', 'index', ['server1', 'server2'], **kw)
+    hec2 = get_hec('token', 'index', ['server1', 'server2'], **dict(kw))
+    assert hec1 is hec2
+    assert get_hec('token', 'index', 'server3', **kw) is not hec1
+
+    # still in use after a refresh: kept
+    registry.refresh()
+    assert get_hec('token', 'index', ['server1', 'server2'], **kw) is hec1
+
+    # unused for a whole refresh cycle: dropped
+    registry.refresh()
+    registry.refresh()
+    assert get_hec('token', 'index', ['server1', 'server2'], **kw) is not hec1
+    registry.clear()
@@ -121,7 +121,9 @@ def added_opts():
     # environment that would populate the field in __opts__; so it's been
     # spuriously added to __opts__ during config build to cover vestigial edge
     # cases.
-    return {'skip_file_logger', '__role'}
+    # 'grains_generation' is bumped by hubblestack.daemon.refresh_grains so
+    # matchers can tell when grains changed.
+    return {'skip_file_logger', '__role', 'grains_generation'}
 
 @pytest.fixture
 def salt_config_opts(intentionally_removed_opts):
@@ -34,3 +34,105 @@ def test_can_find_hubblestack_module_file(module_dirs):
 
 def test_can_find_hubblestack_module(__mods__):
     assert 'pulsar.canary' in __mods__
+
+def test_grain_pool_timeout_and_fallback():
+    import threading
+    import time
+
+    release = threading.Event()
+    calls = {'slow': 0}
+    def fast():
+        return {'fast': True}
+    def slow():
+        calls['slow'] += 1
+        release.wait(5)
+        return {'slow': calls['slow']}
+    def broken():
+        raise Exception('nope')
+    funcs = {'x.fast': fast, 'x.slow': slow, 'x.broken': broken}
+    kwargs = dict((k, {}) for k in funcs)
+    opts = {'grains_max_workers': 3, 'grains_timeout': 0.2}
+
+    L._LAST_GRAINS['x.slow'] = (0, {'slow': 'old'})
+    try:
+        t0 = time.time()
+        ret = L._run_grain_pool(opts, funcs, sorted(funcs), kwargs)
+        assert time.time() - t0 < 2
+        assert ret == {'x.fast': {'fast': True}, 'x.slow': {'slow': 'old'}}
+        assert 'x.slow' in L._STUCK_GRAINS
+
+        # still running: not started again, the last value is used
+        ret = L._run_grain_pool(opts, funcs, ['x.slow'], kwargs)
+        assert ret == {'x.slow': {'slow': 'old'}} and calls['slow'] == 1
+
+        release.set()
+        L._STUCK_GRAINS['x.slow'].result(5)
+        assert L._LAST_GRAINS['x.slow'][1] == {'slow': 1}
+        ret = L._run_grain_pool(opts, funcs, ['x.slow'], kwargs)
+        assert ret == {'x.slow': {'slow': 2}}
+        assert 'hubblestack.loader.grain.x.fast' in L.hubble_status.resources
+    finally:
+        for key in funcs:
+            L._LAST_GRAINS.pop(key, None)
+            L._STUCK_GRAINS.pop(key, None)
+
+def test_hung_grain_does_not_block_exit():
+    import subprocess
+    import sys
+
+    # the interpreter exits while the abandoned grain is still sleeping
+    script = """
+import time
+import hubblestack.loader as L
+def hung():
+    time.sleep(60)
+ret = L._run_grain_pool({'grains_timeout': 0.1}, {'x.hung': hung}, ['x.hung'], {'x.hung': {}})
+assert ret == {} and 'x.hung' in L._STUCK_GRAINS
+"""
+    proc = subprocess.run([sys.executable, '-c', script], timeout=30,
+                          cwd=os.path.dirname(os.path.dirname(L.__file__)))
+    assert proc.returncode == 0
+
+def test_grain_ttls_and_cache_file(tmpdir, monkeypatch):
+    import time
+
+    monkeypatch.setattr(L, '_LAST_GRAINS', dict())
+    opts = {'grains_ttl': {'x.slow': 60, 'other': 0}}
+    assert L._grain_ttl(opts, 'core.os_data') == 86400
+    assert L._grain_ttl(opts, 'cloud_details.get_cloud_details') == 3600
+    assert L._grain_ttl(opts, 'x.slow') == 60
+    assert L._grain_ttl(opts, 'x.fast') == 0
+
+    now = time.time()
+    L._LAST_GRAINS.update({'x.slow': (now - 30, {'slow': 1}), 'x.fast': (now, {'fast': 1}),
+                           'core.os_data': (now - 90000, {'os': 'Linux'})})
+    assert L._fresh_grains(opts, ['x.slow', 'x.fast', 'core.os_data', 'x.new']) == {'x.slow': {'slow': 1}}
+
+    cfn = str(tmpdir.join('grains.cache.p'))
+    serial = L.hubblestack.payload.Serial({})
+    with open(cfn, 'wb') as fh:
+        serial.dump({'hubble_version': L.__version__, 'boot_id': L._boot_id(),
+                     'funcs': {'x.slow': [now, {'slow': 2}], 'core.os_data': [now, {'os': 'Linux'}]}}, fh)
+    L._LAST_GRAINS.clear()
+    L._load_grains_cache({}, cfn)
+    assert L._LAST_GRAINS['x.slow'][1] == {'slow': 2}
+    # the core grains are always collected again
+    assert 'core.os_data' not in L._LAST_GRAINS
+
+    # so is everything after a reboot
+    L._LAST_GRAINS.clear()
+    boot_id = L._boot_id
+    monkeypatch.setattr(L, '_boot_id', lambda: 'another-boot')
+    L._load_grains_cache({}, cfn)
+    assert not L._LAST_GRAINS
+    monkeypatch.setattr(L, '_boot_id', boot_id)
+    L._load_grains_cache({}, cfn)
+
+    # caches written by another version (or the old format) are ignored
+    with open(cfn, 'wb') as fh:
+        serial.dump({'hubble_version': '0.0.1', 'funcs': {'x.fast': [now, {'fast': 2}]}}, fh)
+    L._load_grains_cache({}, cfn)
+    with open(cfn, 'wb') as fh:
+        serial.dump({'os': 'Linux'}, fh)
+    L._load_grains_cache({}, cfn)
+    assert list(L._LAST_GRAINS) == ['x.slow']
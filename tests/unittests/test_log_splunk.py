@@ -0,0 +1,75 @@
+# coding: utf-8
+
+import logging
+import mock
+import pytest
+
+import hubblestack.log.splunk
+import hubblestack.status
+from hubblestack.log.splunk import SplunkHandler
+
+class FakeHEC(object):
+    maxByteLength = 100000
+
+    def __init__(self, *a, **kw):
+        self.batched = list()
+        self.flushes = list()
+
+    def batchEvent(self, payload, eventtime='', no_queue=False):
+        assert no_queue
+        self.batched.append(payload)
+
+    def flushBatch(self):
+        self.flushes.append(list(self.batched))
+        self.batched = list()
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(hubblestack.log.splunk, '__opts__',
+        {'splunklogging_queue_size': 4, 'splunklogging_flush_interval': 60}, raising=False)
+    monkeypatch.setattr(hubblestack.log.splunk, '__mods__',
+        {'config.get': lambda key, default=None: default}, raising=False)
+    monkeypatch.setattr(hubblestack.log.splunk, 'get_splunk_options',
+        lambda: [{'custom_fields': [], 'index': 'hubble', 'sourcetype': 'hubble_log'}])
+    monkeypatch.setattr(hubblestack.log.splunk, 'make_hec_args', lambda opts: ((), {}))
+    monkeypatch.setattr(hubblestack.log.splunk, 'http_event_collector', FakeHEC)
+    monkeypatch.setattr(hubblestack.utils.stdrec, 'get_fqdn', lambda: 'fqdn.example.com')
+    monkeypatch.setattr(hubblestack.utils.stdrec, 'std_info', lambda: {'minion_id': 'test'})
+    # keep the sender thread out of the way, we'll flush by hand
+    with mock.patch.object(SplunkHandler, '_start_sender'):
+        yield SplunkHandler()
+
+def _record(msg, name='some.module'):
+    return logging.LogRecord(name, logging.ERROR, __file__, 1, msg, None, None)
+
+def test_emit_only_queues(handler):
+    hec = handler.endpoint_list[0][0]
+    assert handler.emit(_record('first'))
+    assert handler.emit(_record('second'))
+    assert not hec.batched and not hec.flushes
+    assert len(handler.queue) == 2
+
+    handler.flush()
+    assert len(handler.queue) == 0
+    assert len(hec.flushes) == 1
+    assert [ p['event']['message'] for p in hec.flushes[0] ] == ['first', 'second']
+    assert hec.flushes[0][0]['host'] == 'fqdn.example.com'
+    assert hec.flushes[0][0]['event']['minion_id'] == 'test'
+
+def test_emit_filters_own_loggers(handler):
+    assert handler.emit(_record('loop', name='hubblestack.hec.obj')) is False
+    assert len(handler.queue) == 0
+
+def test_ring_buffer_drops_oldest(handler):
+    dropped = hubblestack.status.HubbleStatus.dat['hubblestack.log.splunk.dropped']
+    before = sum(x.count for x in dropped)
+    for i in range(6):
+        handler.emit(_record('msg{0}'.format(i)))
+    assert len(handler.queue) == 4
+    assert handler.wakeup.is_set()
+    dropped = hubblestack.status.HubbleStatus.dat['hubblestack.log.splunk.dropped']
+    assert sum(x.count for x in dropped) - before == 2
+
+    handler.flush()
+    hec = handler.endpoint_list[0][0]
+    assert [ p['event']['message'] for p in hec.flushes[0] ] == ['msg2', 'msg3', 'msg4', 'msg5']
@@ -0,0 +1,94 @@
+# coding: utf-8
+
+import json
+import os
+
+import pytest
+
+import hubblestack.modules.nebula_osquery as nebula
+
+def _event(idx, **columns):
+    columns.setdefault('idx', str(idx))
+    return json.dumps({'name': 'q', 'action': 'added', 'columns': columns}) + '\n'
+
+@pytest.fixture
+def logdir(tmp_path, monkeypatch):
+    monkeypatch.setattr(nebula, '__opts__', {'cachedir': str(tmp_path / 'cache'),
+        'osquerylogpath': str(tmp_path / 'logs'), 'osquerylog_backupdir': str(tmp_path / 'backup'),
+        'osquery_logfile_maxbytes': 50000000, 'osquery_logfile_maxbytes_toparse': 100000000,
+        'osquery_backuplogs_count': 2, 'osquery_log_parser_batch_size': 3}, raising=False)
+    for name in ('logs', 'backup'):
+        (tmp_path / name).mkdir()
+    return tmp_path / 'logs'
+
+def _offset(path):
+    offsetfile = os.path.join(nebula.__opts__['cachedir'], 'osqueryd', 'offset', path.name)
+    if not os.path.isfile(offsetfile):
+        return 0
+    with open(offsetfile) as fh:
+        return json.load(fh)['offset']
+
+def _write(path, lines, mode='a'):
+    with open(str(path), mode) as fh:
+        fh.write(''.join(lines))
+
+def test_batches_and_offsets(logdir):
+    results = logdir / 'osqueryd.results.log'
+    _write(results, [ _event(i) for i in range(7) ])
+    _write(results, [ _event(99, blob='__JSONIFY__{"a": 1}') ])
+
+    gen = nebula.osqueryd_log_parser()
+    first = next(gen)
+    assert [ x['columns']['idx'] for x in first ] == ['0', '1', '2']
+    # the first batch hasn't been handed off yet
+    assert _offset(results) == 0
+
+    second = next(gen)
+    assert [ x['columns']['idx'] for x in second ] == ['3', '4', '5']
+    assert _offset(results) == len(''.join(_event(i) for i in range(3)))
+
+    rest = list(gen)
+    assert [ len(x) for x in rest ] == [2]
+    assert rest[0][1]['columns']['blob'] == {'a': 1}
+    assert _offset(results) == os.path.getsize(str(results))
+
+    # nothing new, nothing yielded; a half written line waits for the next run
+    assert list(nebula.osqueryd_log_parser()) == []
+    _write(results, [ _event(8), _event(9)[:10] ])
+    assert [ [ x['columns']['idx'] for x in b ] for b in nebula.osqueryd_log_parser() ] == [['8']]
+
+def test_rotation(logdir):
+    results = logdir / 'osqueryd.results.log'
+    _write(results, [ _event(i) for i in range(4) ])
+    nebula.__opts__['osquery_logfile_maxbytes'] = 10
+
+    batches = list(nebula.osqueryd_log_parser())
+    assert [ len(x) for x in batches ] == [3, 1]
+    assert not results.exists()
+    assert len(os.listdir(str(logdir.parent / 'backup'))) == 1
+
+def test_status_covers_the_whole_pass(logdir, monkeypatch):
+    results = logdir / 'osqueryd.results.log'
+    _write(results, [ _event(i) for i in range(4) ])
+    marks = []
+    class Handle(object):
+        def fin(self):
+            marks.append('fin')
+    def mark(name):
+        marks.append(name)
+        return Handle()
+    monkeypatch.setattr(nebula.hubble_status, 'mark', mark)
+
+    gen = nebula.osqueryd_log_parser()
+    assert marks == []
+    next(gen)
+    assert marks == ['osqueryd_log_parser']
+    list(gen)
+    assert marks == ['osqueryd_log_parser', 'fin']
+
+    # closing the generator before it's exhausted ends the timing too
+    _write(results, [ _event(i) for i in range(4, 8) ])
+    gen = nebula.osqueryd_log_parser()
+    assert len(next(gen)) == 3
+    gen.close()
+    assert marks[2:] == ['osqueryd_log_parser', 'fin']
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+import json
+import threading
+import time
+
+import pytest
+
+import hubblestack.modules.nebula_osquery as nebula
+from tests.unittests.utils.test_osquery_lib import fake_osqueryi
+
+class FakeOsqueryi(object):
+    def __init__(self, delays=None, fail=()):
+        self.delays = delays or dict()
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.timeouts = list()
+
+    def __call__(self, cmd, timeout=None):
+        query_sql = cmd[-1]
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+            self.timeouts.append(timeout)
+        time.sleep(self.delays.get(query_sql, 0.05))
+        with self.lock:
+            self.running -= 1
+        if query_sql in self.fail:
+            return {'retcode': 1, 'stdout': '', 'stderr': 'no such table'}
+        return {'retcode': 0, 'stdout': json.dumps([{'sql': query_sql}]), 'stderr': ''}
+
+@pytest.fixture
+def osqueryi(monkeypatch):
+    def _setup(opts=None, **kw):
+        fake = FakeOsqueryi(**kw)
+        monkeypatch.setattr(nebula, '__opts__', opts or dict(), raising=False)
+        monkeypatch.setattr(nebula, '__grains__', {'osquerybinpath': 'osqueryi'}, raising=False)
+        monkeypatch.setattr(nebula, '__mods__', {'cmd.run_all': fake}, raising=False)
+        return fake
+    return _setup
+
+def _query_data(count):
+    return dict( ('q{0}'.format(i), {'query': 'select {0};'.format(i)}) for i in range(count) )
+
+def test_parallel_keeps_order_and_timing(osqueryi):
+    fake = osqueryi({'osquery_max_parallel': 3},
+        delays={'select 0;': 0.3, 'select 1;': 0.1}, fail=('select 2;',))
+    _, timing, ret = nebula._run_osquery_queries(_query_data(6), False)
+
+    assert fake.max_running == 3
+    assert [ list(x)[0] for x in ret ] == ['q{0}'.format(i) for i in range(6)]
+    assert ret[0]['q0'] == {'result': True, 'data': [{'sql': 'select 0;'}]}
+    assert ret[2]['q2'] == {'result': False, 'error': 'no such table'}
+    assert sorted(timing) == ['q{0}'.format(i) for i in range(6)]
+    assert timing['q0'] >= 0.3
+
+def test_serial_by_default(osqueryi):
+    fake = osqueryi()
+    success, _, ret = nebula._run_osquery_queries(_query_data(3), True)
+    assert fake.max_running == 1
+    assert success is True
+    assert [ x['query_name'] for x in ret ] == ['q0', 'q1', 'q2']
+    assert all( x['query_result']['result'] is True for x in ret )
+
+def test_group_deadline(osqueryi):
+    fake = osqueryi({'osquery_group_timeout': 0.2}, delays={'select 0;': 0.3})
+    _, timing, ret = nebula._run_osquery_queries(_query_data(2), False)
+    assert fake.timeouts[0] <= 0.2
+    # the second query would have started after the deadline
+    assert len(fake.timeouts) == 1
+    assert ret[1]['q1']['result'] is False
+    assert 'deadline' in ret[1]['q1']['error']
+    assert 'q1' in timing
+
+def test_batch_mode(osqueryi, monkeypatch):
+    fake = osqueryi({'osquery_batch_mode': True, 'osquery_max_parallel': 2}, fail=('select 2;',))
+    batch = fake_osqueryi(fail=('select 2;',))
+    def run_all(cmd, stdin=None, timeout=None, **kw):
+        if stdin is None:
+            return fake(cmd, timeout=timeout)
+        return batch(cmd, stdin=stdin, timeout=timeout)
+    monkeypatch.setitem(nebula.__mods__, 'cmd.run_all', run_all)
+
+    _, timing, ret = nebula._run_osquery_queries(_query_data(5), False)
+    # one session per worker, plus the failed query run on its own
+    assert len(batch.calls) == 2
+    assert len(fake.timeouts) == 1
+    assert [ list(x)[0] for x in ret ] == ['q{0}'.format(i) for i in range(5)]
+    assert ret[0]['q0'] == {'result': True, 'data': [{'q': 'select 0;'}] * 2}
+    assert ret[2]['q2'] == {'result': False, 'error': 'no such table'}
+    assert sorted(timing) == ['q{0}'.format(i) for i in range(5)]
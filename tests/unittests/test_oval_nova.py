@@ -0,0 +1,104 @@
+import hubblestack.files.hubblestack_nova.oval_scanner as oval_scanner
+
+FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<oval_definitions xmlns="http://oval.mitre.org/XMLSchema/oval-definitions-5"
+    xmlns:oval="http://oval.mitre.org/XMLSchema/oval-common-5"
+    xmlns:linux="http://oval.mitre.org/XMLSchema/oval-definitions-5#linux">
+  <definitions>
+    <definition id="oval:def:1" class="patch">
+      <metadata>
+        <title>RHSA-2020:0001: openssl security update</title>
+        <reference ref_id="RHSA-2020:0001" ref_url="https://access.redhat.com/errata/RHSA-2020:0001" source="RHSA"/>
+        <reference ref_id="CVE-2020-0001" ref_url="https://access.redhat.com/security/cve/CVE-2020-0001" source="CVE"/>
+        <advisory><severity>Important</severity></advisory>
+      </metadata>
+      <criteria operator="OR">
+        <criterion test_ref="oval:tst:1" comment="openssl is earlier than 1:1.0.2k-19.el7"/>
+        <criterion test_ref="oval:tst:2" comment="openssl-libs is earlier than 1:1.0.2k-19.el7"/>
+      </criteria>
+    </definition>
+    <definition id="oval:def:2" class="patch">
+      <metadata>
+        <title>RHSA-2020:0002: {pkg} security update</title>
+        <reference ref_id="RHSA-2020:0002" ref_url="https://access.redhat.com/errata/RHSA-2020:0002" source="RHSA"/>
+        <advisory><severity>Low</severity></advisory>
+      </metadata>
+      <criteria><criterion test_ref="oval:tst:3" comment="{pkg} is earlier than 2.0-1.el7"/></criteria>
+    </definition>
+  </definitions>
+  <tests>
+    <linux:rpminfo_test id="oval:tst:1" comment="openssl is earlier than 1:1.0.2k-19.el7">
+      <linux:object object_ref="oval:obj:1"/><linux:state state_ref="oval:ste:1"/>
+    </linux:rpminfo_test>
+    <linux:rpminfo_test id="oval:tst:2" comment="openssl-libs is earlier than 1:1.0.2k-19.el7">
+      <linux:object object_ref="oval:obj:2"/><linux:state state_ref="oval:ste:1"/>
+    </linux:rpminfo_test>
+    <linux:rpminfo_test id="oval:tst:3" comment="{pkg} is earlier than 2.0-1.el7">
+      <linux:object object_ref="oval:obj:3"/><linux:state state_ref="oval:ste:2"/>
+    </linux:rpminfo_test>
+  </tests>
+  <objects>
+    <linux:rpminfo_object id="oval:obj:1"><linux:name>openssl</linux:name></linux:rpminfo_object>
+    <linux:rpminfo_object id="oval:obj:2"><linux:name>openssl-libs</linux:name></linux:rpminfo_object>
+    <linux:rpminfo_object id="oval:obj:3"><linux:name>{pkg}</linux:name></linux:rpminfo_object>
+  </objects>
+  <states>
+    <linux:rpminfo_state id="oval:ste:1"><linux:evr datatype="evr_string" operation="less than">1:1.0.2k-19.el7</linux:evr></linux:rpminfo_state>
+    <linux:rpminfo_state id="oval:ste:2"><linux:evr datatype="evr_string" operation="less than">0:2.0-1.el7</linux:evr></linux:rpminfo_state>
+  </states>
+</oval_definitions>
+'''
+
+
+def _write_feed(tmpdir, pkg='bash'):
+    feed = tmpdir.join('com.redhat.rhsa-RHEL7.xml')
+    feed.write(FEED.format(pkg=pkg))
+    return str(feed)
+
+
+def test_index_matches_full_parse(tmpdir):
+    feed = _write_feed(tmpdir)
+    index = str(tmpdir.join('com.redhat.rhsa-RHEL7.xml.idx'))
+    assert oval_scanner.get_oval_index(feed, index)
+
+    with open(feed, 'rb') as fh:
+        oval_and_maps = oval_scanner.map_oval_ids(oval_scanner.build_oval(fh.read(), {}), {})
+    expected = oval_scanner.create_vulns(oval_and_maps, {})
+    for data in expected.values():
+        data.pop('tests')
+    pkgs = ['openssl', 'openssl-libs', 'bash']
+    assert oval_scanner.load_vulns(index, pkgs) == expected
+
+    vulns = oval_scanner.load_vulns(index, ['openssl-libs', 'kernel'])
+    assert list(vulns) == ['oval:def:1']
+    assert vulns['oval:def:1']['pkg'] == [{'name': 'openssl-libs', 'version': '1:1.0.2k-19.el7'}]
+    assert vulns['oval:def:1']['severity'] == 'Important'
+    assert oval_scanner.load_vulns(index, []) == {}
+
+
+def test_index_rebuilt_when_source_changes(tmpdir, monkeypatch):
+    feed = _write_feed(tmpdir)
+    index = str(tmpdir.join('com.redhat.rhsa-RHEL7.xml.idx'))
+    assert oval_scanner.get_oval_index(feed, index)
+    assert not oval_scanner.get_oval_index(feed, index)
+
+    # rewritten with the same content: the index is kept
+    builds = []
+    monkeypatch.setattr(oval_scanner, 'build_oval_index', lambda *args: builds.append(args))
+    _write_feed(tmpdir)
+    assert not oval_scanner.get_oval_index(feed, index)
+    assert not builds
+    monkeypatch.undo()
+
+    _write_feed(tmpdir, pkg='zsh')
+    assert oval_scanner.get_oval_index(feed, index)
+    assert list(oval_scanner.load_vulns(index, ['bash'])) == []
+    assert list(oval_scanner.load_vulns(index, ['zsh'])) == ['oval:def:2']
+
+
+def test_get_vulns_without_index(tmpdir, monkeypatch):
+    feed = _write_feed(tmpdir)
+    with_index = oval_scanner.get_vulns(feed, str(tmpdir.join('oval')), {'bash': '1.0-1.el7'})
+    monkeypatch.setattr(oval_scanner, 'sqlite3', None)
+    vulns = oval_scanner.get_vulns(feed, str(tmpdir.join('oval')), {'bash': '1.0-1.el7'})
+    assert vulns['oval:def:2']['pkg'] == with_index['oval:def:2']['pkg']
@@ -4,6 +4,7 @@ Test the fim (pulsar) internals for various correctness
 
 import os
 import shutil
+import time
 import logging
 
 from hubblestack.exceptions import CommandExecutionError
@@ -545,3 +546,204 @@ class TestPulsar2(object):
 
         assert set4 == set([self.atfile])
         assert levents4 == 3
+
+    def test_config_index(self):
+        self.reset(**{
+            '/var/log': {'exclude': ['/var/log/journal', '/var/log/*.gz',
+                                     {r'/var/log/app/\d+\.tmp$': {'regex': True}}]},
+            '/var/log/app': {'mask': ['create', 'modify'], 'watch_files': True},
+            '/etc/passwd': {},
+            '/': {'recurse': False},
+        })
+        cm = pulsar.ConfigManager()
+        index = cm.index
+        assert 'checksum' not in index.entries
+
+        assert cm.path_of_config('/var/log/app/x/y.log') == '/var/log/app'
+        assert cm.path_of_config('/var/log/app') == '/var/log/app'
+        assert cm.path_of_config('/var/log/apple') == '/var/log'
+        assert cm.path_of_config('/etc/passwd') == '/etc/passwd'
+        assert cm.path_of_config('/etc/shadow') == '/'
+        assert cm.format_path('/var/log/messages')[0] == '/var/log'
+
+        excludes = index.get('/var/log').excludes
+        assert excludes('/var/log/journal/system.journal')
+        assert excludes('/var/log/syslog.2.gz')
+        assert excludes('/var/log/app/123.tmp')
+        assert not excludes('/var/log/syslog')
+        assert not index.get('/var/log/app').excludes('/var/log/journal')
+
+        app = index.get('/var/log/app')
+        assert app.mask == pulsar.pyinotify.IN_CREATE
+        assert app.watch_files and not app.recurse
+
+        # refreshing the config rebuilds the index
+        cm.update()
+        assert cm.index is not index
+
+    def test_watch_index(self):
+        self.reset()
+        wm = self.watch_manager
+        wm._add_db('/a', {'/a': 1, '/a/b': 2, '/a/c': 3})
+        wm._add_db('/a/b', {'/a/b': 2, '/a/b/d': 4})
+        wm._add_db('/e', {'/e': 5})
+
+        assert wm.wd_db == {1: '/a', 2: '/a/b', 3: '/a/c', 4: '/a/b/d', 5: '/e'}
+        assert wm.parent_db == {'/a': {'/a/b', '/a/c'}, '/a/b': {'/a/b/d'}}
+        assert wm.child_db == {'/a/b': '/a', '/a/c': '/a', '/a/b/d': '/a/b'}
+        assert wm.root_db == {'/a', '/e'}
+        assert sorted(wm._get_paths(4, 5, 99)) == ['/a/b/d', '/e']
+        assert sorted(wm._get_wdl('/a/c', 5, '/nope')) == [3, 5]
+        # paths bring their children along, wds don't
+        assert sorted(wm._get_wdl('/a')) == [1, 2, 3]
+        assert sorted(wm._get_wdl(1)) == [1]
+
+        # a re-added path drops its stale wd
+        wm._add_db('/e', {'/e': 6})
+        assert wm.wd_db.get(5) is None and wm.wd_db[6] == '/e'
+
+        # removing a child prunes it from its parent; the last child takes the set with it
+        wm._rm_db(4)
+        assert '/a/b' not in wm.parent_db
+        assert '/a/b/d' not in wm.child_db
+
+        # removing a parent leaves its children parentless
+        wm._rm_db(1)
+        assert wm.parent_db == {}
+        assert wm.child_db == {}
+        assert wm.root_db == {'/a/b', '/a/c', '/e'}
+        assert wm.watch_db == {'/a/b': 2, '/a/c': 3, '/e': 6}
+        assert wm.wd_db == {2: '/a/b', 3: '/a/c', 6: '/e'}
+
+    def test_coalesce_events(self):
+        self.reset(coalesce_seconds=0.3, **{self.atdir: {'watch_files': True}})
+        self.mk_tdir_and_write_tfile()
+        self.watch_manager.watch(self.tdir)
+
+        for i in range(3):
+            self.mk_tdir_and_write_tfile(to_write='supz{0}\n'.format(i))
+            self.process()
+        assert self.get_clear_events() == []
+
+        time.sleep(0.3)
+        ret = pulsar.process()
+        assert len(ret) == 1
+        assert ret[0]['path'] == self.atfile
+        assert ret[0]['count'] == 3
+        assert ret[0]['changes'] == ['IN_MODIFY']
+        self.nuke_tdir()
+
+class TestChecksumWorker(object):
+    """ the background checksum worker """
+
+    def sha256(self, data):
+        import hashlib
+        return hashlib.sha256(data).hexdigest()
+
+    def write(self, path, data):
+        with open(str(path), 'wb') as fh:
+            fh.write(data)
+        return str(path)
+
+    def test_debounce_and_cache(self, tmp_path):
+        fname = self.write(tmp_path / 'f', b'one')
+        worker = pulsar.ChecksumWorker(workers=0, debounce=1, deadline=30)
+
+        worker.request({'n': 1}, fname, 'sha256', now=100)
+        assert worker.poll(now=100.5) == []
+        self.write(fname, b'two')
+        worker.request({'n': 2}, fname, 'sha256', now=100.6)
+        # both events share the one (debounced) hash of the current contents
+        ret = worker.poll(now=101)
+        assert [ x['n'] for x in ret ] == [1, 2]
+        assert all( x['checksum'] == self.sha256(b'two') for x in ret )
+        assert all( x['checksum_type'] == 'sha256' for x in ret )
+
+        key = pulsar._stat_key(os.stat(fname))
+        assert worker.cached(fname, key, 'sha256') == self.sha256(b'two')
+        assert worker.cached(fname, key, 'md5') is None
+        self.write(fname, b'three!')
+        assert worker.cached(fname, pulsar._stat_key(os.stat(fname)), 'sha256') is None
+
+    def test_no_contents_when_unchanged(self, tmp_path):
+        fname = self.write(tmp_path / 'f', b'data')
+        worker = pulsar.ChecksumWorker(workers=0, debounce=0)
+        worker.request({}, fname, 'sha256', contents_size=20480, now=0)
+        first, = worker.poll(now=0)
+        assert first['checksum'] == self.sha256(b'data')
+        assert worker.held == []
+        worker.request({}, fname, 'sha256', contents_size=20480, now=0)
+        second, = worker.poll(now=0)
+        assert 'contents' not in second
+
+    def test_deadline_and_missing_files(self, tmp_path):
+        worker = pulsar.ChecksumWorker(workers=0, debounce=10, deadline=5)
+        worker.request({'n': 1}, self.write(tmp_path / 'f', b'x'), 'sha256', now=0)
+        ret = worker.poll(now=5)
+        assert ret == [{'n': 1, 'checksum_type': 'sha256', 'checksum_pending': True}]
+
+        worker = pulsar.ChecksumWorker(workers=0, debounce=0)
+        worker.request({'n': 2}, str(tmp_path / 'nope'), 'sha256', now=0)
+        assert worker.poll(now=0) == [{'n': 2, 'checksum_type': 'sha256'}]
+
+    def test_thread_pool(self, tmp_path):
+        files = [ self.write(tmp_path / str(i), str(i).encode()) for i in range(5) ]
+        worker = pulsar.ChecksumWorker(workers=2, debounce=0)
+        for i, fname in enumerate(files):
+            worker.request({'n': i}, fname, 'sha256', now=0)
+        ret = list()
+        for _ in range(500):
+            ret.extend(worker.poll(now=0))
+            assert len(worker.running) <= 2
+            if len(ret) == len(files):
+                break
+            time.sleep(0.01)
+        assert sorted( (x['n'], x['checksum']) for x in ret ) == \
+            [ (i, self.sha256(str(i).encode())) for i in range(5) ]
+
+    def test_byte_budget(self, monkeypatch):
+        slept = list()
+        monkeypatch.setattr(pulsar.time, 'time', lambda: 1000.0)
+        monkeypatch.setattr(pulsar.time, 'sleep', slept.append)
+        budget = pulsar._ByteBudget(100)
+        budget.consume(50)
+        budget.consume(100)
+        budget.consume(50)
+        assert slept == [0.5, 1.5]
+
+class TestEventCoalescer(object):
+    """ cross-sweep event coalescing """
+
+    def sub(self, path, change='IN_MODIFY', **kw):
+        kw.update({'path': path, 'change': change})
+        return kw
+
+    def test_merge_within_window(self):
+        co = pulsar.EventCoalescer(window=5)
+        assert co.add(self.sub('/a', 'IN_CREATE', n=1), 'pc1', now=0) == []
+        co.add(self.sub('/b', n=2), 'pc2', now=1)
+        co.add(self.sub('/a', n=3), 'pc3', now=4)
+        assert co.flush(now=4.9) == []
+
+        # the latest event for the path, with the changes merged
+        (sub, pconf), = co.flush(now=5)
+        assert pconf == 'pc3'
+        assert sub == {'path': '/a', 'change': 'IN_MODIFY', 'n': 3,
+                       'changes': ['IN_CREATE', 'IN_MODIFY'], 'count': 2}
+        (sub, _), = co.flush(now=6)
+        assert sub['n'] == 2 and sub['count'] == 1
+        assert not co.held
+
+        # a new window starts after a flush
+        co.add(self.sub('/a'), None, now=7)
+        assert co.flush(now=11) == []
+
+    def test_bounded(self):
+        co = pulsar.EventCoalescer(window=5, max_paths=2)
+        co.add(self.sub('/a'), None, now=0)
+        co.add(self.sub('/b'), None, now=0)
+        co.add(self.sub('/a'), None, now=0)
+        pushed = co.add(self.sub('/c'), None, now=0)
+        assert [ x[0]['path'] for x in pushed ] == ['/a']
+        assert pushed[0][0]['count'] == 2
+        assert list(co.held) == ['/b', '/c']
@@ -0,0 +1,116 @@
+# coding: utf-8
+
+import time
+from datetime import datetime
+
+import pytest
+
+from hubblestack.scheduler import Scheduler, getlastrunbycron
+
+class Clock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def _runner(clock, durations=None):
+    ran = list()
+    def execute(job):
+        ran.append((job.name, clock.now))
+        clock.now += (durations or {}).get(job.name, 0)
+    return ran, execute
+
+FUNCS = {'test.ping': None, 'hubble.audit': None}
+
+def test_jobs_run_in_deadline_order(clock):
+    sched = Scheduler(clock)
+    sched.load({'a': {'function': 'test.ping', 'seconds': 60},
+                'b': {'function': 'hubble.audit', 'seconds': 30, 'args': ['x']},
+                'c': {'function': 'test.ping', 'seconds': 60, 'run_on_start': True}}, FUNCS, {})
+    ran, execute = _runner(clock)
+    assert sched.run_pending(execute) == 1
+    assert ran == [('c', 1000.0)]
+    assert sched.next_run() == 1030.0
+
+    clock.now = 1065
+    assert sched.run_pending(execute) == 3
+    assert [x[0] for x in ran[1:]] == ['b', 'a', 'c']
+    stats = sched.stats()
+    assert stats['b']['lag'] == 35 and stats['b']['runs'] == 1
+    assert stats['b']['next_run'] == 1095
+
+def test_invalid_jobs_are_dropped_once(clock, caplog):
+    sched = Scheduler(clock)
+    config = {'nofunc': {'seconds': 60}, 'missing': {'function': 'nope.nope', 'seconds': 60},
+              'badargs': {'function': 'test.ping', 'seconds': 60, 'args': 'x'},
+              'badsecs': {'function': 'test.ping', 'seconds': 'often'},
+              'badpolicy': {'function': 'test.ping', 'seconds': 60, 'missed': 'sometimes'},
+              'good': {'function': 'test.ping', 'seconds': 60}}
+    sched.load(config, FUNCS, {})
+    assert list(sched.jobs) == ['good']
+    errors = len(caplog.records)
+    sched.load(config, FUNCS, {})
+    assert len(caplog.records) == errors
+
+    # a function that shows up in reloaded modules gets its job scheduled
+    sched.load(config, dict(FUNCS, **{'nope.nope': None}), {})
+    assert sorted(sched.jobs) == ['good', 'missing']
+
+def test_reload_keeps_unchanged_jobs(clock):
+    sched = Scheduler(clock)
+    config = {'a': {'function': 'test.ping', 'seconds': 60},
+              'b': {'function': 'test.ping', 'seconds': 60}}
+    sched.load(config, FUNCS, {})
+    clock.now += 10
+    config = {'a': {'function': 'test.ping', 'seconds': 60},
+              'b': {'function': 'test.ping', 'seconds': 120}}
+    sched.load(config, FUNCS, {})
+    assert sched.jobs['a'].next_run == 1060
+    assert sched.jobs['b'].next_run == 1130
+
+def test_missed_policies(clock):
+    sched = Scheduler(clock)
+    sched.load({'once': {'function': 'test.ping', 'seconds': 10},
+                'skip': {'function': 'test.ping', 'seconds': 10, 'missed': 'skip'}}, FUNCS, {})
+    ran, execute = _runner(clock)
+    clock.now = 1035
+    assert sched.run_pending(execute) == 1
+    assert ran == [('once', 1035)]
+    assert sched.jobs['skip'].next_run == 1040
+    assert sched.stats()['skip']['skipped'] == 1
+
+def test_overlap_policies(clock):
+    sched = Scheduler(clock)
+    sched.load({'queue': {'function': 'test.ping', 'seconds': 10, 'run_on_start': True},
+                'skip': {'function': 'test.ping', 'seconds': 10, 'run_on_start': True,
+                         'overlap': 'skip'}}, FUNCS, {})
+    ran, execute = _runner(clock, {'queue': 25, 'skip': 25})
+    assert sched.run_pending(execute) == 2
+    assert ran == [('queue', 1000), ('skip', 1025)]
+    assert sched.jobs['queue'].next_run == 1010
+    # skip runs at the next interval after it finished
+    assert sched.jobs['skip'].next_run == 1055
+    stats = sched.stats()
+    assert stats['queue']['overruns'] == 1 and stats['skip']['overruns'] == 1
+    assert stats['skip']['skipped'] == 2
+
+    # queue runs again right away, but only once per run_pending()
+    assert sched.run_pending(execute) == 1
+    assert ran[-1] == ('queue', 1050)
+
+def test_cron_last_run():
+    base = datetime(2018, 1, 1, 0, 0)
+    epoch = time.mktime(base.timetuple())
+    def slow(seconds, now):
+        ret = epoch
+        while ret + seconds < now:
+            ret += seconds
+        return ret
+    for seconds in (900, 3600, 86400):
+        for now in (epoch, epoch + 1, epoch + seconds, epoch + 10 * seconds + 7, time.time()):
+            assert getlastrunbycron(base, seconds, now) == slow(seconds, now)
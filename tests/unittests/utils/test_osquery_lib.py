@@ -0,0 +1,51 @@
+# coding: utf-8
+
+import json
+import re
+
+from hubblestack.utils import osquery_lib
+
+def fake_osqueryi(fail=(), die_after=None):
+    ''' pretend to be an osqueryi --json session reading stdin '''
+    calls = list()
+    def run_all(cmd, stdin=None, timeout=None, **kw):
+        calls.append(cmd)
+        out, err = list(), list()
+        for lineno, line in enumerate(stdin.splitlines()):
+            if die_after is not None and lineno >= die_after:
+                return {'retcode': -9, 'stdout': '\n'.join(out), 'stderr': 'Killed'}
+            marker = re.match(r"select '(.*)' as (\w+);", line)
+            if marker:
+                out.append(json.dumps([{marker.group(2): marker.group(1)}], indent=2))
+            elif line in fail:
+                err.append('Error: no such table')
+            else:
+                out.append(json.dumps([{'q': line}, {'q': line}], indent=2))
+        return {'retcode': 1 if err else 0, 'stdout': '\n'.join(out), 'stderr': '\n'.join(err)}
+    run_all.calls = calls
+    return run_all
+
+def test_run_batch_demultiplexes():
+    run_all = fake_osqueryi(fail=('select bad;',))
+    ret = osquery_lib.run_batch(['osqueryi', '--json'],
+        ['select 1', 'select bad;', ' select 3; '], run_all=run_all)
+    assert len(run_all.calls) == 1
+    assert ret[0] == [{'q': 'select 1;'}, {'q': 'select 1;'}]
+    assert ret[1] is None
+    assert ret[2] == [{'q': 'select 3;'}, {'q': 'select 3;'}]
+
+def test_run_batch_session_dies():
+    # three lines per query: the second query never reaches its end marker
+    ret = osquery_lib.run_batch(['osqueryi'], ['select 1', 'select 2', 'select 3'],
+        run_all=fake_osqueryi(die_after=5))
+    assert ret[0] == [{'q': 'select 1;'}, {'q': 'select 1;'}]
+    assert ret[1:] == [None, None]
+
+def test_parse_batch_output_ignores_foreign_markers():
+    stdout = json.dumps([{osquery_lib.BATCH_MARKER: 'other:0:begin'}])
+    stdout += 'W1018 some warning\n'
+    stdout += json.dumps([{osquery_lib.BATCH_MARKER: 'tok:0:begin'}])
+    stdout += json.dumps([{osquery_lib.BATCH_MARKER: 'other:0:end'}])
+    stdout += json.dumps([{osquery_lib.BATCH_MARKER: 'tok:0:end'}])
+    assert osquery_lib.parse_batch_output(stdout, 'tok', 1) == [
+        [{osquery_lib.BATCH_MARKER: 'other:0:end'}]]
@@ -0,0 +1,81 @@
+# coding: utf-8
+
+import os
+
+from hubblestack.utils.parsed_files import ParsedFiles, ENTRY_OVERHEAD
+
+def _parser(calls):
+    def parse(path):
+        calls.append(path)
+        with open(path) as fh:
+            return fh.read()
+    return parse
+
+def test_results_kept_until_the_file_changes(tmpdir):
+    calls = []
+    cache = ParsedFiles()
+    path = tmpdir.join('sshd_config')
+    path.write('PermitRootLogin no\n')
+    path = str(path)
+    assert cache.get(path, 'text', _parser(calls)) == 'PermitRootLogin no\n'
+    assert cache.get(path, 'text', _parser(calls)) == 'PermitRootLogin no\n'
+    assert calls == [path]
+    # another kind of parse of the same file is kept apart
+    assert cache.get(path, 'lines', lambda p: ['PermitRootLogin no']) == ['PermitRootLogin no']
+
+    with open(path, 'a') as fh:
+        fh.write('Protocol 2\n')
+    assert cache.get(path, 'text', _parser(calls)) == 'PermitRootLogin no\nProtocol 2\n'
+    assert calls == [path, path]
+
+    # replaced by another file (new inode) with the same size and mtime
+    st = os.stat(path)
+    other = tmpdir.join('other')
+    other.write('PermitRootLogin ye\nProtocol 2\n')
+    os.utime(str(other), ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.rename(str(other), path)
+    assert cache.get(path, 'text', _parser(calls)) == 'PermitRootLogin ye\nProtocol 2\n'
+    assert cache.stats == {'hits': 1, 'misses': 4, 'evictions': 0}
+
+def test_lru_budget(tmpdir):
+    calls = []
+    paths = []
+    for name in 'abcd':
+        path = tmpdir.join(name)
+        path.write('x' * 100)
+        paths.append(str(path))
+    cache = ParsedFiles(max_bytes=3 * (100 + ENTRY_OVERHEAD))
+    for path in paths[:3]:
+        cache.get(path, 'text', _parser(calls))
+    # a is used again, b is the least recently used
+    cache.get(paths[0], 'text', _parser(calls))
+    cache.get(paths[3], 'text', _parser(calls))
+    assert cache.stats['evictions'] == 1
+    assert cache.size == 3 * (100 + ENTRY_OVERHEAD)
+    del calls[:]
+    for path in paths:
+        cache.get(path, 'text', _parser(calls))
+    assert calls[0] == paths[1]
+
+    # files bigger than the whole budget aren't kept
+    cache = ParsedFiles(max_bytes=100)
+    del calls[:]
+    cache.get(paths[0], 'text', _parser(calls))
+    cache.get(paths[0], 'text', _parser(calls))
+    assert len(calls) == 2 and cache.size == 0
+
+def test_pseudo_files_not_kept(tmpdir):
+    calls = []
+    cache = ParsedFiles()
+    # an empty file may just as well be a sysctl that reports no size
+    path = str(tmpdir.join('empty'))
+    open(path, 'w').close()
+    cache.get(path, 'text', _parser(calls))
+    cache.get(path, 'text', _parser(calls))
+    assert calls == [path, path]
+    assert cache.size == 0
+
+    uuid = '/proc/sys/kernel/random/uuid'
+    if os.path.exists(uuid):
+        assert cache.get(uuid, 'text', _parser(calls)) != cache.get(uuid, 'text', _parser(calls))
+        assert not cache._entries
@@ -0,0 +1,78 @@
+# coding: utf-8
+
+import os
+
+from hubblestack.files.hubblestack_nova import openssl
+from hubblestack.utils.profile_store import ProfileStore
+
+def _write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return str(path)
+
+def test_reparse_only_changed(tmp_path):
+    profiles = tmp_path / 'profiles'
+    _write(profiles / 'a.yaml', 'a: 1\n')
+    fname = _write(profiles / 'sub' / 'b.yaml', 'b: 2\n')
+    _write(profiles / 'broken.yaml', 'x: [\n')
+    _write(profiles / 'skip.txt', 'not: yaml\n')
+    store = ProfileStore()
+
+    data, missing, changed = store.load_tree([str(profiles)])
+    assert changed
+    assert data == {'/a.yaml': {'a': 1}, '/sub/b.yaml': {'b': 2}}
+    assert list(missing) == ['/broken.yaml']
+    assert store.stats['misses'] == 3 and store.stats['hits'] == 0
+    assert store.stats['errors'] == 1
+
+    data, missing, changed = store.load_tree([str(profiles)])
+    assert not changed
+    assert store.stats['misses'] == 3 and store.stats['hits'] == 3
+
+    # rewritten with the same content: read and hashed, but not parsed
+    st = os.stat(fname)
+    _write(profiles / 'sub' / 'b.yaml', 'b: 2\n')
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    data, _, changed = store.load_tree([str(profiles)])
+    assert not changed
+    assert store.stats['misses'] == 3
+
+    _write(profiles / 'sub' / 'b.yaml', 'b: 3\n')
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10 ** 9))
+    data, _, changed = store.load_tree([str(profiles)])
+    assert changed
+    assert data['/sub/b.yaml'] == {'b': 3}
+    assert store.stats['misses'] == 4
+
+def test_removed_files(tmp_path):
+    profiles = tmp_path / 'profiles'
+    _write(profiles / 'a.yaml', 'a: 1\n')
+    fname = _write(profiles / 'b.yaml', 'b: 2\n')
+    store = ProfileStore()
+    store.load_tree([str(profiles)])
+
+    os.unlink(fname)
+    data, _, changed = store.load_tree([str(profiles)])
+    assert changed
+    assert list(data) == ['/a.yaml']
+    assert list(store.files) == [str(profiles / 'a.yaml')]
+
+def test_audits_get_their_own_copy(tmp_path):
+    profiles = tmp_path / 'profiles'
+    _write(profiles / 'openssl.yaml', """\
+openssl:
+  - check_cert:
+      data:
+        tag: CERT-1
+        endpoint: localhost
+      description: the cert is valid
+""")
+    store = ProfileStore()
+
+    # openssl pops the tag out of the profile data; a second audit of the
+    # cached profile must still find it
+    for _ in range(2):
+        data, _, _ = store.load_tree([str(profiles)])
+        tags = openssl._get_tags(data['/openssl.yaml'])
+        assert list(tags) == ['CERT-1']
+    assert store.stats['hits'] == 1
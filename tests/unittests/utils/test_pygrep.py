@@ -0,0 +1,125 @@
+# coding: utf-8
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from hubblestack.utils import pygrep
+from hubblestack.utils.parsed_files import PARSED_FILES
+
+SSHD_CONFIG = '''# sample sshd_config
+Protocol 2
+Protocol 22
+XProtocol 2
+PermitRootLogin no
+#PermitRootLogin yes
+MaxAuthTries 4
+  IgnoreRhosts yes
+ClientAliveInterval 300
+ClientAliveCountMax 0
+Ciphers aes256-ctr,aes192-ctr
+LogLevel INFO
+X11Forwarding no
+^Protocol 3
+*literal star
+maxauthtries 6
+Banner /etc/issue.net
+'''
+
+LOGIN_DEFS = '''PASS_MAX_DAYS\t90
+PASS_MIN_DAYS   7
+PASS_WARN_AGE 7
+UMASK 027
+'''
+
+CASES = [
+    ['^PermitRootLogin'],
+    ['-E', '^\\s*maxauthtries\\s+[0-4]$', '-i'],
+    ['-i', 'maxauthtries'],
+    ['-v', '^#'],
+    ['-w', 'no'],
+    ['-x', 'Protocol 2'],
+    ['-xE', 'Protocol 2|no'],
+    ['-x', 'no'],
+    ['-c', 'yes'],
+    ['-c', 'nothing-here'],
+    ['-l', 'INFO'],
+    ['-A1', 'Ciphers'],
+    ['-B', '2', 'LogLevel'],
+    ['-C1', '-i', 'alive'],
+    ['-E', 'PASS_(MAX|MIN)_DAYS[[:space:]]+[0-9]+'],
+    ['PASS_\\(MAX\\|MIN\\)_DAYS'],
+    ['^UMASK\\s\\+0[0-7]7$'],
+    ['a+b|c'],
+    ['*literal'],
+    ['^^Protocol'],
+    ['^*literal'],
+    ['\\<yes\\>'],
+    ['-F', 'aes256-ctr,'],
+    ['--ignore-case', '--count', 'PERMIT'],
+]
+
+@pytest.fixture
+def files(tmp_path):
+    sshd = tmp_path / 'sshd_config'
+    sshd.write_text(SSHD_CONFIG)
+    login = tmp_path / 'login.defs'
+    login.write_text(LOGIN_DEFS)
+    pygrep.clear_cache()
+    return [str(sshd), str(login)]
+
+@pytest.mark.skipif(not shutil.which('grep'), reason='no grep binary to compare with')
+@pytest.mark.parametrize('args', CASES)
+@pytest.mark.parametrize('nfiles', [1, 2])
+def test_same_as_grep(files, args, nfiles):
+    cmd = ['grep'] + args + files[:nfiles]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    ret = pygrep.run(cmd)
+    assert ret['retcode'] == proc.returncode
+    assert ret['stdout'] == proc.stdout.decode().rstrip()
+
+def test_string_command_and_stdin(files):
+    ret = pygrep.run("grep -E '^Protocol 2$' {0}".format(files[0]))
+    assert ret == {'retcode': 0, 'stdout': 'Protocol 2', 'stderr': ''}
+    ret = pygrep.run(['grep', '-c', 'o'], stdin='foo\nbar\nbaz boo\n')
+    assert ret['stdout'] == '2'
+
+def test_file_cache(files):
+    pygrep.run(['grep', 'x', files[0]])
+    assert (files[0], 'grep-lines') in PARSED_FILES._entries
+    lines = pygrep.read_lines(files[0])
+    assert pygrep.read_lines(files[0]) is lines
+    with open(files[0], 'a') as fh:
+        fh.write('UsePAM yes\n')
+    assert pygrep.run(['grep', 'UsePAM', files[0]])['stdout'] == 'UsePAM yes'
+
+@pytest.mark.skipif(not os.path.exists('/proc/sys/kernel/random/uuid'), reason='needs /proc')
+def test_proc_files_read_every_time(files):
+    uuid = '/proc/sys/kernel/random/uuid'
+    first = pygrep.run(['grep', '-', uuid])['stdout']
+    assert first and pygrep.run(['grep', '-', uuid])['stdout'] != first
+    assert (uuid, 'grep-lines') not in PARSED_FILES._entries
+
+def test_big_files_left_to_grep(files, monkeypatch):
+    monkeypatch.setattr(pygrep, 'MAX_FILE_SIZE', len(SSHD_CONFIG) - 1)
+    with pytest.raises(pygrep.GrepUnsupported):
+        pygrep.run(['grep', 'Protocol', files[0]])
+    assert pygrep.run(['grep', 'UMASK', files[1]])['stdout'] == 'UMASK 027'
+
+@pytest.mark.parametrize('cmd', [
+    ['grep', '-P', 'x', '/etc/hostname'],
+    ['grep', '-e', 'x', '/etc/hostname'],
+    ['grep', '-r', 'x', '/etc'],
+    ['grep', 'x', '/does/not/exist'],
+    ['grep', '-E', '(?i)x', '/etc/hostname'],
+    ['grep', '\\d', '/etc/hostname'],
+    ['grep', '-E', 'a+?', '/etc/hostname'],
+    ['grep', '-E', 'a{2}*', '/etc/hostname'],
+    ['grep', 'a*\\?', '/etc/hostname'],
+    ['ls', '/etc'],
+])
+def test_unsupported(cmd):
+    with pytest.raises(pygrep.GrepUnsupported):
+        pygrep.run(cmd)
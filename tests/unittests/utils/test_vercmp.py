@@ -0,0 +1,86 @@
+# coding: utf-8
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from hubblestack.utils.pkg import vercmp
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resources', 'dpkg_versions.txt')
+
+def _corpus():
+    with open(CORPUS) as fh:
+        for line in fh:
+            if line.startswith('#') or not line.strip():
+                continue
+            ver1, ver2, expected = line.rstrip('\n').split('\t')
+            yield ver1, ver2, int(expected)
+
+def test_dpkg_corpus():
+    pairs = list(_corpus())
+    assert len(pairs) > 1000
+    for ver1, ver2, expected in pairs:
+        assert vercmp.dpkg_version_cmp(ver1, ver2) == expected, (ver1, ver2)
+
+@pytest.mark.skipif(not shutil.which('dpkg'), reason='dpkg is not installed')
+def test_dpkg_corpus_against_dpkg():
+    for ver1, ver2, _ in list(_corpus())[::25]:
+        expected = [ret for oper, ret in (('lt', -1), ('eq', 0), ('gt', 1))
+                    if subprocess.call(['dpkg', '--compare-versions', ver1, oper, ver2]) == 0]
+        assert [vercmp.dpkg_version_cmp(ver1, ver2)] == expected, (ver1, ver2)
+
+@pytest.mark.parametrize('version', ['a:1.0', '1:', '1.0-', '-1', '1.0 1'])
+def test_dpkg_refuses_what_dpkg_refuses(version):
+    with pytest.raises(ValueError):
+        vercmp.dpkg_version_cmp(version, '1.0')
+
+# from rpm's own test suite (tests/rpmvercmp.at)
+RPMVERCMP = [
+    ('1.0', '1.0', 0), ('1.0', '2.0', -1), ('2.0', '1.0', 1), ('2.0.1', '2.0.1', 0),
+    ('2.0', '2.0.1', -1), ('2.0.1', '2.0', 1), ('2.0.1a', '2.0.1a', 0), ('2.0.1a', '2.0.1', 1),
+    ('2.0.1', '2.0.1a', -1), ('5.5p1', '5.5p1', 0), ('5.5p1', '5.5p2', -1), ('5.5p2', '5.5p1', 1),
+    ('5.5p10', '5.5p10', 0), ('5.5p1', '5.5p10', -1), ('5.5p10', '5.5p1', 1),
+    ('10xyz', '10.1xyz', -1), ('10.1xyz', '10xyz', 1), ('xyz10', 'xyz10', 0),
+    ('xyz10', 'xyz10.1', -1), ('xyz10.1', 'xyz10', 1), ('xyz.4', 'xyz.4', 0), ('xyz.4', '8', -1),
+    ('8', 'xyz.4', 1), ('xyz.4', '2', -1), ('2', 'xyz.4', 1), ('5.5p2', '5.6p1', -1),
+    ('5.6p1', '5.5p2', 1), ('5.6p1', '6.5p1', -1), ('6.5p1', '5.6p1', 1), ('6.0.rc1', '6.0', 1),
+    ('6.0', '6.0.rc1', -1), ('10b2', '10a1', 1), ('10a2', '10b2', -1), ('1.0aa', '1.0aa', 0),
+    ('1.0a', '1.0aa', -1), ('1.0aa', '1.0a', 1), ('10.0001', '10.0001', 0), ('10.0001', '10.1', 0),
+    ('10.1', '10.0001', 0), ('10.0001', '10.0039', -1), ('10.0039', '10.0001', 1),
+    ('4.999.9', '5.0', -1), ('5.0', '4.999.9', 1), ('20101121', '20101121', 0),
+    ('20101121', '20101122', -1), ('20101122', '20101121', 1), ('2_0', '2_0', 0), ('2.0', '2_0', 0),
+    ('2_0', '2.0', 0), ('a', 'a', 0), ('a+', 'a+', 0), ('a+', 'a_', 0), ('a_', 'a+', 0),
+    ('+a', '+a', 0), ('+a', '_a', 0), ('_a', '+a', 0), ('+_', '+_', 0), ('_+', '+_', 0),
+    ('_+', '_', 0), ('+', '_', 0), ('_', '+', 0), ('1.0~rc1', '1.0~rc1', 0), ('1.0~rc1', '1.0', -1),
+    ('1.0', '1.0~rc1', 1), ('1.0~rc1', '1.0~rc2', -1), ('1.0~rc2', '1.0~rc1', 1),
+    ('1.0~rc1~git123', '1.0~rc1~git123', 0), ('1.0~rc1~git123', '1.0~rc1', -1),
+    ('1.0~rc1', '1.0~rc1~git123', 1), ('1.0^', '1.0^', 0), ('1.0^', '1.0', 1), ('1.0', '1.0^', -1),
+    ('1.0^git1', '1.0^git1', 0), ('1.0^git1', '1.0', 1), ('1.0', '1.0^git1', -1),
+    ('1.0^git1', '1.0^git2', -1), ('1.0^git2', '1.0^git1', 1), ('1.0^git1', '1.01', -1),
+    ('1.01', '1.0^git1', 1), ('1.0^20160101', '1.0^20160101', 0), ('1.0^20160101', '1.0.1', -1),
+    ('1.0.1', '1.0^20160101', 1), ('1.0^20160101^git1', '1.0^20160101^git1', 0),
+    ('1.0^20160102', '1.0^20160101^git1', 1), ('1.0^20160101^git1', '1.0^20160102', -1),
+    ('1.0~rc1^git1', '1.0~rc1^git1', 0), ('1.0~rc1^git1', '1.0~rc1', 1),
+    ('1.0~rc1', '1.0~rc1^git1', -1), ('1.0^git1~pre', '1.0^git1~pre', 0),
+    ('1.0^git1', '1.0^git1~pre', 1), ('1.0^git1~pre', '1.0^git1', -1),
+]
+
+def test_rpmvercmp():
+    for ver1, ver2, expected in RPMVERCMP:
+        assert vercmp.rpmvercmp(ver1, ver2) == expected, (ver1, ver2)
+
+def test_rpm_evr():
+    assert vercmp.rpm_version_cmp('1:1.0-1', '2.0-1') == 1
+    assert vercmp.rpm_version_cmp('3.28.0-1.el7', '3.28.0-1.el7_9') == -1
+    # the release only counts when both have one
+    assert vercmp.rpm_version_cmp('3.2', '3.2-1') == 0
+    assert vercmp.rpm_version_cmp('3.2-2', '3.2-10') == -1
+
+def test_memoized():
+    vercmp.clear_cache()
+    vercmp.dpkg_version_cmp('1.0', '1.1')
+    vercmp.dpkg_version_cmp('1.0', '1.1')
+    info = vercmp.dpkg_version_cmp.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
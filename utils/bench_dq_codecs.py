@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Compare the disk queue compression codecs (see hubblestack.hec.dq.CODECS) on
+nebula and pulsar HEC payloads: compression ratio and compress/decompress
+throughput.
+
+    python utils/bench_dq_codecs.py
+    python utils/bench_dq_codecs.py --rounds 20 nebula=/tmp/nebula.payloads pulsar=/tmp/pulsar.payloads
+
+Captured payload files hold one payload per line (e.g. the contents of a
+'files' backend disk queue, decompressed). Without any, payloads shaped like
+the ones splunk_nebula_return and splunk_pulsar_return send are generated.
+Like the queue itself, payloads are concatenated up to 100k (SPLUNK_MAX_MSG)
+before being compressed.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from hubblestack.hec import dq
+
+HOST = {'minion_id': 'host-1234.example.com', 'dest_host': 'host-1234.example.com',
+        'dest_ip': '10.11.12.13', 'dest_fqdn': 'host-1234.example.com',
+        'system_uuid': '4c4c4544-0047-3810-8033-b4c04f4b5232',
+        'cloud_instance_id': 'i-0123456789abcdef0', 'cloud_account_id': '123456789012'}
+
+
+def _nebula_payload(rnd, idx):
+    event = {'query': 'running_procs', 'job_id': '20201018052342123456',
+             'pid': str(rnd.randint(1, 65535)), 'name': rnd.choice(['sshd', 'bash', 'python3', 'cron']),
+             'cmdline': '/usr/sbin/sshd -D -o AuthorizedKeysCommand=/usr/bin/lookup %d' % idx,
+             'uid': str(rnd.choice([0, 1000, 33])), 'parent': str(rnd.randint(1, 4000)),
+             'start_time': str(1600000000 + rnd.randint(0, 10 ** 6))}
+    event.update(HOST)
+    return json.dumps({'host': HOST['dest_host'], 'index': 'hubble',
+                       'sourcetype': 'hubble_osquery_running_procs', 'event': event,
+                       'time': time.time()})
+
+
+def _pulsar_payload(rnd, idx):
+    path = '/var/log/app/%s/%d.log' % (rnd.choice(['web', 'db', 'worker']), idx % 50)
+    event = {'action': rnd.choice(['IN_MODIFY', 'IN_CREATE', 'IN_DELETE']), 'change': 'IN_MODIFY',
+             'file_path': path, 'file_name': os.path.basename(path), 'object_path': path,
+             'object_category': 'file', 'file_acl': '0644', 'file_create_time': 1600000000.0,
+             'file_modify_time': 1600000000.0 + idx, 'file_size': rnd.random() * 1024,
+             'user': 'root', 'group': 'root',
+             'file_hash': '%064x' % rnd.getrandbits(256), 'file_hash_type': 'sha256'}
+    event.update(HOST)
+    return json.dumps({'host': HOST['dest_host'], 'index': 'hubble', 'sourcetype': 'hubble_fim',
+                       'event': event, 'time': time.time()})
+
+
+def generated_payloads(kind, count=2000):
+    """ generate payloads shaped like the ones the returners send """
+    rnd = random.Random(kind)
+    func = _nebula_payload if kind == 'nebula' else _pulsar_payload
+    return [func(rnd, idx) for idx in range(count)]
+
+
+def load_payloads(fname):
+    """ read captured payloads, one per line """
+    with open(fname, 'r') as fh:
+        return [line.strip() for line in fh if line.strip()]
+
+
+def chunk(payloads, size=dq.SPLUNK_MAX_MSG):
+    """ concatenate payloads the way DiskQueue.getz() would hand them back """
+    ret, cur = [], ''
+    for payload in payloads:
+        if cur and len(cur) + 1 + len(payload) > size:
+            ret.append(cur)
+            cur = ''
+        cur = cur + ' ' + payload if cur else payload
+    if cur:
+        ret.append(cur)
+    return ret
+
+
+def bench(chunks, compression, rounds):
+    """ return (ratio, compress MB/s, decompress MB/s) for the given setting """
+    codec, level = dq.parse_compression(compression)
+    raw = sum(len(x) for x in chunks)
+    t0 = time.time()
+    for _ in range(rounds):
+        stored = [dq.compress(x, codec, level) for x in chunks]
+    t1 = time.time()
+    for _ in range(rounds):
+        for item in stored:
+            dq.decompress(item)
+    t2 = time.time()
+    mb = raw * rounds / (1024.0 ** 2)
+    ratio = raw / float(sum(len(x) for x in stored))
+    return ratio, mb / max(t1 - t0, 1e-9), mb / max(t2 - t1, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--compression', action='append',
+                        help='a disk_queue_compression setting to test (repeatable)')
+    parser.add_argument('captured', nargs='*', help='name=file of captured payloads')
+    args = parser.parse_args()
+
+    settings = args.compression or ['none', 'zlib:1', 'gzip:1', 'zlib:6', 'lzma:0', 'bz2:5']
+    sets = dict(x.split('=', 1) for x in args.captured)
+    if not sets:
+        sets = {'nebula': None, 'pulsar': None}
+
+    print('{0:8} {1:10} {2:>7} {3:>12} {4:>12}'.format(
+        'payload', 'codec', 'ratio', 'comp MB/s', 'decomp MB/s'))
+    for name, fname in sorted(sets.items()):
+        payloads = load_payloads(fname) if fname else generated_payloads(name)
+        chunks = chunk(payloads)
+        for compression in settings:
+            if dq.parse_compression(compression)[0] not in dq.CODECS and compression != 'none':
+                continue
+            ratio, c_rate, d_rate = bench(chunks, compression, args.rounds)
+            print('{0:8} {1:10} {2:7.2f} {3:12.1f} {4:12.1f}'.format(
+                name, compression, ratio, c_rate, d_rate))
+
+
+if __name__ == '__main__':
+    main()
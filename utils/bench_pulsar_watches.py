@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Time the pulsar watch manager's bookkeeping (see
+hubblestack.modules.pulsar.PulsarWatchManager) on a large synthetic tree:
+adding the watches, removing a burst of them (as IN_IGNORED/IN_DELETE_SELF
+storms do) and pruning after the config stops recursing into part of it.
+
+    python utils/bench_pulsar_watches.py
+    python utils/bench_pulsar_watches.py --watches 100000 --files-per-dir 50 --remove 5000
+
+Only the watch manager's own indexes are exercised; no inotify watches are
+created, so this runs unprivileged and without touching max_user_watches.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import hubblestack.modules.pulsar as pulsar
+
+ROOT = '/bench'
+
+
+def synthetic_tree(watches, files_per_dir):
+    """
+    yield (parent, {path: wd}) batches the way watch() hands them to
+    _add_db() until there are the given number of watches: first the
+    recursive add_watch() of the configured directory, then the files of each
+    directory under their directory
+    """
+    dirs = max(1, watches // (files_per_dir + 1))
+    dirpaths = [ROOT] + ['{0}/d{1}/d{2}'.format(ROOT, idx // 100, idx) for idx in range(1, dirs)]
+    yield ROOT, dict((path, wd) for wd, path in enumerate(dirpaths, 1))
+    wd = len(dirpaths)
+    for dirpath in dirpaths:
+        items = {}
+        for idx in range(files_per_dir):
+            if wd >= watches:
+                break
+            wd += 1
+            items['{0}/f{1}'.format(dirpath, idx)] = wd
+        if not items:
+            break
+        yield dirpath, items
+
+
+def watch_manager():
+    """ a PulsarWatchManager configured for the synthetic tree """
+    pulsar.__opts__ = {'pulsar': {ROOT: {'recurse': True, 'watch_files': True}}}
+    pulsar.__mods__ = {'config.get': lambda _, default=None: default}
+    pulsar.__context__ = {}
+    return pulsar.PulsarWatchManager()
+
+
+def timed(label, func, *args):
+    t0 = time.time()
+    ret = func(*args)
+    print('{0:28} {1:10.3f}s'.format(label, time.time() - t0))
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--watches', type=int, default=500000)
+    parser.add_argument('--files-per-dir', type=int, default=20)
+    parser.add_argument('--remove', type=int, default=10000,
+                        help='how many watches to remove one at a time')
+    args = parser.parse_args()
+
+    wm = watch_manager()
+    batches = list(synthetic_tree(args.watches, args.files_per_dir))
+
+    def add():
+        for parent, items in batches:
+            wm._add_db(parent, items)
+    timed('add {0} watches'.format(sum(len(x[1]) for x in batches)), add)
+
+    def remove():
+        # the most recently added watches go first, like a deleted subtree
+        for wd in range(args.watches, max(args.watches - args.remove, 1), -1):
+            wm._rm_db(wd)
+    timed('remove {0} one by one'.format(args.remove), remove)
+
+    # NOTE: files and directories are all made up, so every child counts as a file
+    wm.cm.config = {ROOT: {'recurse': True, 'watch_files': False}}
+    to_rm = timed('prune', lambda: list(wm._prune_paths_to_stop_watching()))
+    print('{0:28} {1:10}'.format('watches left', len(wm.watch_db)))
+    print('{0:28} {1:10}'.format('watches to prune', len(to_rm)))
+
+
+if __name__ == '__main__':
+    main()